@@ -1,20 +1,21 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, session, flash
-from flask_babel import Babel, gettext as _
+from flask import Flask, render_template, jsonify, request, redirect, url_for, session, Response, abort
+from flask_babel import Babel
 import json
+import hashlib
 from datetime import datetime, timedelta
 import threading
 import logging
 from dotenv import load_dotenv
 import time
-import sqlite3
-from werkzeug.security import generate_password_hash
-from functools import wraps
 from threading import Thread
 from db_persistence import run_db_persistence
 
 # Import modules
-from auth import auth_bp, get_user_by_id, get_user_preferences, login_required, admin_required, init_db, get_user_context
+from db_connection import get_db_connection
+from subscriptions import subscription_index
+from auth import auth_bp, get_user_by_id, get_user_preferences, login_required, admin_required, init_db
 import pokemon_scraper
+import state_changes
 
 
 # Force l'initialisation de la base de données au démarrage
@@ -155,122 +156,241 @@ def ensure_database_exists():
         logging.error(f"Erreur lors de l'initialisation de la base de données: {e}")
         return False
 
-# Data storage for web interface
+# Data storage for web interface (the catalog itself is served by /api/sites and /api/collections)
 stats = {
+    "last_alert": None,
+    "results": {},
+    "active_alerts": []
+}
+
+# Bookkeeping updated on every check, served by /api/status: kept out of the
+# /api/stats body so that its ETag only changes when a result changes
+check_status = {
     "last_check": None,
     "next_check": None,
     "total_checks": 0,
-    "last_alert": None,
-    "monitored_sites": pokemon_scraper.SITES,
-    "results": {},
-    "active_alerts": [],
-    "collections_data": {
-        collection["name"]: {
-            "image_url": collection["image_url"],
-            "keywords": collection["keywords"]
-        } for collection in pokemon_scraper.POKEMON_COLLECTIONS
-    }
+    # Last check of each site
+    "sites": {}
 }
 
+# /api/stats body, serialized once per change by the bot instead of on every request
+# (etag, bytes); replaced as a whole so a request always sees a complete snapshot
+stats_snapshot = None
+stats_publish_lock = threading.RLock()
+
+# logs/stats.json is written outside stats_publish_lock; the version keeps a slow
+# writer from replacing a newer dump with an older one
+stats_version = 0
+stats_saved_version = 0
+stats_file_lock = threading.Lock()
+
+def build_collection_results():
+    """Group the latest check results by collection."""
+    collection_results = {}
+    for collection in pokemon_scraper.POKEMON_COLLECTIONS:
+        collection_name = collection["name"]
+        collection_results[collection_name] = {
+            "name": collection_name,
+            "image_url": collection["image_url"],
+            "products": [],
+            "in_stock_count": 0
+        }
+    
+    # Add products to their collections
+    for result_key, result in stats["results"].items():
+        if "collection" in result:
+            collection_name = result["collection"]
+            if collection_name in collection_results:
+                product_info = {
+                    "name": result["product_name"],
+                    "site": result["site_name"],
+                    "url": result["url"],
+                    "available": result["available"],
+                    "price": result["product_data"].get("price", "N/A"),
+                    "message": result["message"],
+                    "timestamp": result["timestamp"],
+                    "date": result["date"]
+                }
+                collection_results[collection_name]["products"].append(product_info)
+                if result["available"]:
+                    collection_results[collection_name]["in_stock_count"] += 1
+    return collection_results
+
+def publish_stats():
+    """Serialize the current statistics for /api/stats and return the (etag, body) snapshot."""
+    global stats_snapshot
+    with stats_publish_lock:
+        snapshot = dict(stats)
+        snapshot["collection_results"] = build_collection_results()
+        body = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+        stats_snapshot = (hashlib.sha1(body).hexdigest()[:20], body)
+        return stats_snapshot
+
+def refresh_catalog_stats(catalog):
+    """Regroup the results under the collections of a reloaded catalog."""
+    publish_stats()
+
+pokemon_scraper.catalog_listeners.append(refresh_catalog_stats)
+
+# Alert screenshots (raw image bytes), served by /api/screenshots/<screenshot_id>
+# so that stats and /api/stats only carry a small reference
+screenshot_store = {}
+
+def store_screenshots(result_key, screenshots):
+    """Keep the latest screenshots of a product and return their references."""
+    refs = []
+    prefix = hashlib.sha1(result_key.encode('utf-8')).hexdigest()[:12]
+    for idx, screenshot in enumerate(screenshots or []):
+        screenshot_id = f"{prefix}-{idx}"
+        screenshot_store[screenshot_id] = {
+            "data": pokemon_scraper.screenshot_bytes(screenshot),
+            "mime_type": screenshot.get("mime_type", "image/png")
+        }
+        refs.append({
+            "caption": screenshot.get("caption", "Screenshot"),
+            "url": f"/api/screenshots/{screenshot_id}"
+        })
+    return refs
+
 # Override check function to update stats
 original_check_site_product = pokemon_scraper.check_site_product
 
+# Set by on_change_event, which runs inside the check on the same thread; the wrapper
+# saves the stats once the result of that check is in stats["results"]
+stats_changed = threading.local()
+
 def check_site_product_wrapper(site_info, product_info):
     """Wrap the check function to update statistics."""
     available, message, screenshots, product_data = original_check_site_product(site_info, product_info)
+    now = datetime.now()
+    check_status["sites"][site_info["name"]] = now.strftime("%d/%m/%Y %H:%M:%S")
     
-    # Update stats
+    # Update stats (in place: only the fields of this check change)
     result_key = f"{site_info['name']}_{product_info['name']}"
-    stats["results"][result_key] = {
-        "available": available,
-        "message": message,
-        "timestamp": datetime.now().strftime("%H:%M:%S"),
-        "date": datetime.now().strftime("%d/%m/%Y"),
-        "screenshots": screenshots,
-        "product_data": product_data,
-        "site_name": site_info["name"],
-        "product_name": product_info["name"],
-        "collection": product_info["collection"],
-        "url": product_info["url"]
-    }
-    
-    # If available, add to active alerts
-    if available:
-        # Check if alert already exists
-        existing_alert = False
-        for alert in stats["active_alerts"]:
-            if alert["source"] == site_info["name"] and alert["product_name"] == product_info["name"]:
-                existing_alert = True
-                # Update existing alert
-                alert["message"] = message
-                alert["timestamp"] = datetime.now().strftime("%H:%M:%S")
-                alert["date"] = datetime.now().strftime("%d/%m/%Y")
-                alert["screenshots"] = screenshots
-                alert["product_data"] = product_data
-                break
-        
-        if not existing_alert:
-            stats["active_alerts"].append({
-                "source": site_info["name"],
+    events = getattr(stats_changed, "pending", False)
+    stats_changed.pending = False
+    with stats_publish_lock:
+        result = stats["results"].get(result_key)
+        if result is None:
+            result = stats["results"][result_key] = {
+                "screenshots": [],
+                "site_name": site_info["name"],
                 "product_name": product_info["name"],
                 "collection": product_info["collection"],
+                "url": product_info["url"]
+            }
+        # timestamp and date tell when the result last changed, not when it was last checked
+        changed = (result.get("available"), result.get("message"), result.get("product_data")) != \
+            (available, message, product_data) or bool(screenshots) or (not available and result["screenshots"])
+        if changed:
+            result.update({
+                "available": available,
                 "message": message,
-                "url": product_info["url"],
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "date": datetime.now().strftime("%d/%m/%Y"),
-                "screenshots": screenshots,
+                "timestamp": now.strftime("%H:%M:%S"),
+                "date": now.strftime("%d/%m/%Y"),
                 "product_data": product_data
             })
-            
-            # Send personalized notifications to users
-            conn = sqlite3.connect('database.db')
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Get all users with active notification preferences for this product/collection
-            query = """
-                SELECT u.id, u.username, u.email, u.preferences, n.* 
-                FROM users u
-                JOIN user_notifications n ON u.id = n.user_id
-                WHERE n.active = 1 
-                AND (n.collection = ? OR n.collection = 'all')
-                AND (n.product = ? OR n.product = '' OR n.product IS NULL)
-                AND (n.site = ? OR n.site = '' OR n.site IS NULL)
-                AND u.role = 'user'
-            """
-            
-            collection_name = product_info["collection"]
-            product_name = product_info["name"]
-            site_name = site_info["name"]
-            
-            users_to_notify = cursor.execute(query, (collection_name, product_name, site_name)).fetchall()
-            
-            # Send notifications to these users
-            for user in users_to_notify:
-                # Check user's notification preferences
-                preferences = {}
-                if user['preferences']:
-                    try:
-                        preferences = json.loads(user['preferences'])
-                    except:
-                        pass
-                
-                # Check if price is within range
-                price = product_data.get('price', 0)
-                if price and user['min_price'] <= price <= user['max_price']:
-                    # Send notification based on user preferences
-                    if preferences.get('notifications_email', True):
-                        # Send email notification
-                        logging.info(f"Envoi d'un email à {user['email']} au sujet de {product_name}")
-                    
-                    if preferences.get('notifications_telegram', False):
-                        # Send telegram notification
-                        logging.info(f"Envoi d'une notification Telegram à {user['username']} au sujet de {product_name}")
-            
-            conn.close()
+            if screenshots:
+                result["screenshots"] = store_screenshots(result_key, screenshots)
+            elif not available:
+                result["screenshots"] = []
+        # Alerts changed by on_change_event are published with the result
+        if changed or events:
+            publish_stats()
+    
+    # Persist only when something changed
+    if events:
+        save_stats()
     
     return available, message, screenshots, product_data
 
+def save_stats():
+    """Save stats to JSON file for persistence (screenshots are only references)."""
+    global stats_version, stats_saved_version
+    try:
+        # The bot threads update stats in place: serialize under the lock, write without it
+        with stats_publish_lock:
+            stats_version += 1
+            version = stats_version
+            data = json.dumps(stats)
+        with stats_file_lock:
+            if version < stats_saved_version:
+                return
+            with open('logs/stats.json.tmp', 'w') as f:
+                f.write(data)
+            os.replace('logs/stats.json.tmp', 'logs/stats.json')
+            stats_saved_version = version
+    except Exception as e:
+        logging.error(f"Error saving stats: {e}")
+
+def notify_users(site_info, product_info, product_data):
+    """Send personalized notifications to the users subscribed to a product."""
+    product_name = product_info["name"]
+    price = product_data.get('price', 0)
+    if not price:
+        return
+    
+    # Subscriptions are matched in memory (see subscriptions.py), without querying the database
+    for subscription in subscription_index.match(product_info["collection"], product_name, site_info["name"], price):
+        # Send notification based on user preferences
+        if subscription.email_alerts:
+            # Send email notification
+            logging.info(f"Envoi d'un email à {subscription.email} au sujet de {product_name}")
+        
+        if subscription.telegram_alerts:
+            # Send telegram notification
+            logging.info(f"Envoi d'une notification Telegram à {subscription.username} au sujet de {product_name}")
+
+def on_change_event(event):
+    """Update active alerts and notify subscribers when a product changes (see state_changes)."""
+    site_info, product_info = event.site, event.product
+    result_key = f"{site_info['name']}_{product_info['name']}"
+    
+    notify = False
+    with stats_publish_lock:
+        if event.kind == state_changes.SOLD_OUT:
+            # The product is no longer in stock: its alert is not active anymore
+            stats["active_alerts"] = [
+                alert for alert in stats["active_alerts"]
+                if not (alert["source"] == site_info["name"] and alert["product_name"] == product_info["name"])
+            ]
+        elif state_changes.is_alert_event(event):
+            screenshot_refs = store_screenshots(result_key, event.screenshots)
+            # Check if alert already exists
+            existing_alert = False
+            for alert in stats["active_alerts"]:
+                if alert["source"] == site_info["name"] and alert["product_name"] == product_info["name"]:
+                    existing_alert = True
+                    # Update existing alert
+                    alert["message"] = event.message
+                    alert["timestamp"] = datetime.now().strftime("%H:%M:%S")
+                    alert["date"] = datetime.now().strftime("%d/%m/%Y")
+                    if screenshot_refs:
+                        alert["screenshots"] = screenshot_refs
+                    alert["product_data"] = event.product_data
+                    break
+        
+            if not existing_alert:
+                stats["active_alerts"].append({
+                    "source": site_info["name"],
+                    "product_name": product_info["name"],
+                    "collection": product_info["collection"],
+                    "message": event.message,
+                    "url": product_info["url"],
+                    "timestamp": datetime.now().strftime("%H:%M:%S"),
+                    "date": datetime.now().strftime("%d/%m/%Y"),
+                    "screenshots": screenshot_refs,
+                    "product_data": event.product_data
+                })
+                notify = True
+    
+    if notify:
+        notify_users(site_info, product_info, event.product_data)
+    
+    stats_changed.pending = True
+
+pokemon_scraper.change_listeners.append(on_change_event)
+
 # Replace original function
 pokemon_scraper.check_site_product = check_site_product_wrapper
 
@@ -279,172 +399,118 @@ original_main_program = pokemon_scraper.main_program
 
 def main_program_wrapper():
     """Wrap the main function to update statistics."""
-    stats["total_checks"] = 0
-    
-    while True:
+    check_status["total_checks"] = 0
+    status_lock = threading.Lock()
+    pokemon_scraper.ensure_chromedriver()
+
+    def on_result(site, product, result):
+        available, message, screenshots, product_data = result
         now = datetime.now()
-        stats["total_checks"] += 1
-        stats["last_check"] = now.strftime("%d/%m/%Y %H:%M:%S")
-        
-        # Execute a check
-        logging.info(f"Check #{stats['total_checks']} - {now.strftime('%d/%m/%Y %H:%M:%S')}")
-        
-        # List to collect all positive alerts
-        alerts = []
-        
-        # 1. Check all configured sites
-        for site in pokemon_scraper.SITES:
-            try:
-                logging.info(f"Checking site: {site['name']}")
-                for product in site['products']:
-                    available, message, screenshots, product_data = pokemon_scraper.check_site_product(site, product)
-                    if available:
-                        alerts.append({
-                            "source": site["name"],
-                            "product_name": product["name"],
-                            "collection": product["collection"],
-                            "message": message,
-                            "url": product["url"],
-                            "screenshots": screenshots,
-                            "product_data": product_data
-                        })
-                        logging.info(f"DETECTION on {site['name']} for {product['name']}: {message}")
-                    else:
-                        logging.info(f"{site['name']} for {product['name']}: {message}")
-                    
-                    # Short pause between products
-                    time.sleep(1)
-                
-                # Short pause between sites
-                time.sleep(2)
-            except Exception as e:
-                logging.error(f"Error checking {site['name']}: {e}")
+        # The stats themselves were published by check_site_product_wrapper if the result changed
+        with status_lock:
+            check_status["total_checks"] += 1
+            check_status["last_check"] = now.strftime("%d/%m/%Y %H:%M:%S")
+            next_due = scheduler.next_due()
+            if next_due:
+                check_status["next_check"] = datetime.fromtimestamp(next_due).strftime("%d/%m/%Y %H:%M:%S")
+
+        if available:
+            logging.info(f"DETECTION on {site['name']} for {product['name']}: {message}")
+        else:
+            logging.info(f"{site['name']} for {product['name']}: {message}")
+
+    def on_change(event):
+        # Global notifications only for restocks and price changes while in stock
+        if not state_changes.is_alert_event(event):
+            return
+        alert = pokemon_scraper.alert_from_event(event)
+        now = datetime.now()
+
+        subject = f"ALERT - Pokemon cards in stock!" if event.kind == state_changes.RESTOCK else f"ALERT - Pokemon price change!"
+        email_content = f"""
+        Hello,
         
-        # If alerts were found, send notifications
-        if alerts:
-            # Build email with all alerts
-            subject = f"ALERT - Pokemon cards in stock!"
-            
-            # Build email content
-            email_content = """
-            Hello,
-            
-            Stock availability has been detected for Pokemon collections.
-            
-            Alert details:
-            """
-            
-            # Add each alert
-            for idx, alert in enumerate(alerts, 1):
-                email_content += f"""
-            {idx}. {alert['source']} - {alert['product_name']}
-               {alert['message']}
-               URL: {alert['url']}
-            """
-            
-            email_content += """
-            Please check these sites quickly to confirm and make your purchase.
-            
-            This message was automatically sent by your monitoring bot.
-            """
-            
-            # Send global notifications
-            notification_ok = pokemon_scraper.send_notifications(subject, email_content, alerts)
-            if notification_ok:
-                stats["last_alert"] = now.strftime("%d/%m/%Y %H:%M:%S")
-                logging.info(f"ALERTS SENT - {len(alerts)} detections")
-            else:
-                logging.error("Failed to send notifications")
+        Stock availability has been detected for Pokemon collections.
         
-        # Calculate next check
-        check_interval = pokemon_scraper.random.randint(
-            pokemon_scraper.CHECK_INTERVAL_MIN, 
-            pokemon_scraper.CHECK_INTERVAL_MAX
-        )
-        next_check_time = now.timestamp() + check_interval
-        stats["next_check"] = datetime.fromtimestamp(next_check_time).strftime("%d/%m/%Y %H:%M:%S")
+        Alert details:
         
-        # Log next check time
-        logging.info(f"Next check: {stats['next_check']}")
+        {alert['source']} - {alert['product_name']}
+           {pokemon_scraper.describe_event(event)}
+           URL: {alert['url']}
         
-        # Save stats to JSON file for persistence
-        try:
-            with open('logs/stats.json', 'w') as f:
-                # Create a simplified version without large screenshot data
-                save_stats = stats.copy()
-                for key, result in save_stats["results"].items():
-                    if "screenshots" in result:
-                        # Keep screenshot info but remove the data
-                        save_stats["results"][key]["screenshots"] = [
-                            {"caption": ss.get("caption", "Screenshot")} for ss in result["screenshots"]
-                        ]
-                
-                for alert in save_stats["active_alerts"]:
-                    if "screenshots" in alert:
-                        # Keep screenshot info but remove the data
-                        alert["screenshots"] = [
-                            {"caption": ss.get("caption", "Screenshot")} for ss in alert["screenshots"]
-                        ]
-                
-                json.dump(save_stats, f)
-        except Exception as e:
-            logging.error(f"Error saving stats: {e}")
+        Please check this site quickly to confirm and make your purchase.
         
-        # Wait before next check
-        time.sleep(check_interval)
+        This message was automatically sent by your monitoring bot.
+        """
+
+        # Send global notifications
+        notification_ok = pokemon_scraper.send_notifications(subject, email_content, [alert])
+        if notification_ok:
+            stats["last_alert"] = now.strftime("%d/%m/%Y %H:%M:%S")
+            logging.info(f"ALERT SENT - {alert['source']} for {alert['product_name']}")
+        else:
+            logging.error("Failed to send notifications")
+
+    # Products are checked as they become due (priority, volatility, host budget)
+    scheduler = pokemon_scraper.CheckScheduler(
+        pokemon_scraper.SITES,
+        check_func=pokemon_scraper.check_site_product,
+        on_result=on_result,
+        base_interval=(pokemon_scraper.CHECK_INTERVAL_MIN + pokemon_scraper.CHECK_INTERVAL_MAX) // 2,
+        workers=pokemon_scraper.CHECK_WORKERS,
+        host_limit=pokemon_scraper.HOST_CONCURRENCY
+    )
+    pokemon_scraper.change_listeners.append(on_change)
+    pokemon_scraper.catalog_listeners.append(lambda catalog: scheduler.sync(catalog.sites))
+    pokemon_scraper.start_catalog_watch()
+    scheduler.run()
 
 # Add function for simplified bot (for Render)
 def simplified_bot():
     """Simplified version of the bot for Render environment that checks less frequently."""
-    stats["total_checks"] = 0
+    check_status["total_checks"] = 0
+    pokemon_scraper.start_catalog_watch()
+    
+    # Alert events (restocks, price changes) raised during the current cycle
+    cycle_events = []
+    pokemon_scraper.change_listeners.append(
+        lambda event: cycle_events.append(event) if state_changes.is_alert_event(event) else None
+    )
     
     while True:
         try:
             now = datetime.now()
-            stats["total_checks"] += 1
-            stats["last_check"] = now.strftime("%d/%m/%Y %H:%M:%S")
+            check_status["total_checks"] += 1
+            check_status["last_check"] = now.strftime("%d/%m/%Y %H:%M:%S")
             
             # Execute a check
-            logging.info(f"[RENDER] Check #{stats['total_checks']} - {now.strftime('%d/%m/%Y %H:%M:%S')}")
+            logging.info(f"[RENDER] Check #{check_status['total_checks']} - {now.strftime('%d/%m/%Y %H:%M:%S')}")
             
-            # List to collect all positive alerts
-            alerts = []
+            cycle_events.clear()
             
             # Check highest priority sites only (to save resources on Render)
             high_priority_sites = [site for site in pokemon_scraper.SITES if site.get('priority', 0) >= 2]
             sites_to_check = high_priority_sites if high_priority_sites else pokemon_scraper.SITES[:2]
             
-            for site in sites_to_check:
-                try:
-                    logging.info(f"[RENDER] Checking site: {site['name']}")
-                    # Only check a subset of products on Render to save resources
-                    products_to_check = site['products'][:3] if len(site['products']) > 3 else site['products']
-                    
-                    for product in products_to_check:
-                        available, message, screenshots, product_data = pokemon_scraper.check_site_product(site, product)
-                        if available:
-                            alerts.append({
-                                "source": site["name"],
-                                "product_name": product["name"],
-                                "collection": product["collection"],
-                                "message": message,
-                                "url": product["url"],
-                                "screenshots": screenshots,
-                                "product_data": product_data
-                            })
-                            logging.info(f"[RENDER] DETECTION on {site['name']} for {product['name']}: {message}")
-                        else:
-                            logging.info(f"[RENDER] {site['name']} for {product['name']}: {message}")
-                        
-                        # Longer pause between products on Render
-                        time.sleep(5)
-                    
-                    # Longer pause between sites on Render
-                    time.sleep(10)
-                except Exception as e:
-                    logging.error(f"[RENDER] Error checking {site['name']}: {e}")
+            # Only check a subset of products on Render to save resources
+            checks = [(site, product) for site in sites_to_check for product in site['products'][:3]]
+            logging.info(f"[RENDER] Checking {len(checks)} products on {len(sites_to_check)} sites")
             
-            # Handle alerts (same as in main program)
+            # All sites at once; the fetch engine limits the concurrent requests per host
+            try:
+                results = pokemon_scraper.check_products_concurrently(checks)
+            except Exception as e:
+                logging.error(f"[RENDER] Error checking products: {e}")
+                results = []
+            
+            for (site, product), (available, message, screenshots, product_data) in zip(checks, results):
+                if available:
+                    logging.info(f"[RENDER] DETECTION on {site['name']} for {product['name']}: {message}")
+                else:
+                    logging.info(f"[RENDER] {site['name']} for {product['name']}: {message}")
+            
+            # Handle alerts (only products that changed during this cycle)
+            alerts = [pokemon_scraper.alert_from_event(event) for event in cycle_events]
             if alerts:
                 subject = f"ALERT - Pokemon cards in stock!"
                 email_content = """
@@ -455,10 +521,10 @@ def simplified_bot():
                 Alert details:
                 """
                 
-                for idx, alert in enumerate(alerts, 1):
+                for idx, (event, alert) in enumerate(zip(cycle_events, alerts), 1):
                     email_content += f"""
                 {idx}. {alert['source']} - {alert['product_name']}
-                   {alert['message']}
+                   {pokemon_scraper.describe_event(event)}
                    URL: {alert['url']}
                 """
                 
@@ -471,34 +537,15 @@ def simplified_bot():
                 notification_ok = pokemon_scraper.send_notifications(subject, email_content, alerts)
                 if notification_ok:
                     stats["last_alert"] = now.strftime("%d/%m/%Y %H:%M:%S")
+                    publish_stats()
                     logging.info(f"[RENDER] ALERTS SENT - {len(alerts)} detections")
                 else:
                     logging.error("[RENDER] Failed to send notifications")
             
             # Set next check time (longer interval for Render)
             next_check_time = now.timestamp() + 1800  # 30 minutes
-            stats["next_check"] = datetime.fromtimestamp(next_check_time).strftime("%d/%m/%Y %H:%M:%S")
-            logging.info(f"[RENDER] Next check: {stats['next_check']}")
-            
-            # Save stats to JSON file
-            try:
-                with open('logs/stats.json', 'w') as f:
-                    save_stats = stats.copy()
-                    for key, result in save_stats["results"].items():
-                        if "screenshots" in result:
-                            save_stats["results"][key]["screenshots"] = [
-                                {"caption": ss.get("caption", "Screenshot")} for ss in result["screenshots"]
-                            ]
-                    
-                    for alert in save_stats["active_alerts"]:
-                        if "screenshots" in alert:
-                            alert["screenshots"] = [
-                                {"caption": ss.get("caption", "Screenshot")} for ss in alert["screenshots"]
-                            ]
-                    
-                    json.dump(save_stats, f)
-            except Exception as e:
-                logging.error(f"[RENDER] Error saving stats: {e}")
+            check_status["next_check"] = datetime.fromtimestamp(next_check_time).strftime("%d/%m/%Y %H:%M:%S")
+            logging.info(f"[RENDER] Next check: {check_status['next_check']}")
             
             # Wait longer between checks on Render
             time.sleep(1800)  # 30 minutes
@@ -560,56 +607,47 @@ def set_language(language):
 @app.route('/api/stats')
 @login_required
 def get_stats():
-    # Add collection data
-    enhanced_stats = stats.copy()
-    
-    # Group results by collection
-    collection_results = {}
-    for collection in pokemon_scraper.POKEMON_COLLECTIONS:
-        collection_name = collection["name"]
-        collection_results[collection_name] = {
-            "name": collection_name,
-            "image_url": collection["image_url"],
-            "products": [],
-            "in_stock_count": 0
-        }
+    """Serve the published stats snapshot, plus the notifications of the current user."""
+    etag, body = stats_snapshot or publish_stats()
     
-    # Add products to their collections
-    for result_key, result in stats["results"].items():
-        if "collection" in result:
-            collection_name = result["collection"]
-            if collection_name in collection_results:
-                product_info = {
-                    "name": result["product_name"],
-                    "site": result["site_name"],
-                    "url": result["url"],
-                    "available": result["available"],
-                    "price": result["product_data"].get("price", "N/A"),
-                    "message": result["message"],
-                    "timestamp": result["timestamp"],
-                    "date": result["date"]
-                }
-                collection_results[collection_name]["products"].append(product_info)
-                if result["available"]:
-                    collection_results[collection_name]["in_stock_count"] += 1
-    
-    enhanced_stats["collection_results"] = collection_results
-    
-    # Get user's notifications
+    # Get user's notifications (small, merged into the pre-serialized body)
+    user_part = None
     if 'user_id' in session:
-        user_id = session['user_id']
-        conn = sqlite3.connect('database.db')
-        conn.row_factory = sqlite3.Row
+        conn = get_db_connection()
         notifications = conn.execute(
             'SELECT * FROM user_notifications WHERE user_id = ? AND active = 1', 
-            (user_id,)
+            (session['user_id'],)
         ).fetchall()
         conn.close()
-        
-        # Convert to list of dicts
-        enhanced_stats["user_notifications"] = [dict(notification) for notification in notifications]
+        user_part = json.dumps([dict(notification) for notification in notifications], separators=(",", ":")).encode("utf-8")
+        etag = f"{etag}-{hashlib.sha1(user_part).hexdigest()[:12]}"
     
-    return jsonify(enhanced_stats)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        if user_part is not None:
+            body = body[:-1] + b',"user_notifications":' + user_part + b'}'
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Browsers revalidate with If-None-Match on every poll and get a 304 while nothing changed
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/status')
+@login_required
+def get_status():
+    """Bot activity (checks count, last and next check, last check of each site), small and never cached."""
+    # Copies: the bot threads update these dicts while the response is serialized
+    return jsonify(dict(check_status, sites=dict(check_status["sites"])))
+
+@app.route('/api/screenshots/<screenshot_id>')
+@login_required
+def get_screenshot(screenshot_id):
+    """Serve an alert screenshot image."""
+    screenshot = screenshot_store.get(screenshot_id)
+    if not screenshot:
+        abort(404)
+    return Response(screenshot["data"], mimetype=screenshot["mime_type"])
 
 @app.route('/api/logs')
 @login_required
@@ -667,14 +705,24 @@ def refresh_product(site_name, product_name):
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)})
 
+@app.route('/api/history/<site_name>/<product_name>')
+@login_required
+def get_product_history(site_name, product_name):
+    """Check history of a product: recent results and older hourly aggregates."""
+    days = request.args.get('days', default=30, type=int)
+    since = time.time() - days * 86400
+    history = pokemon_scraper.check_history
+    return jsonify({
+        "results": history.history(product_name, since=since, site=site_name),
+        "hourly": history.hourly(product_name, since=since, site=site_name)
+    })
+
 @app.route('/api/circuit-breakers')
 @login_required
 def get_circuit_breakers():
     if hasattr(pokemon_scraper, 'circuit_breakers'):
-        return jsonify({
-            name: {"state": cb.state, "failure_count": cb.failure_count} 
-            for name, cb in pokemon_scraper.circuit_breakers.items()
-        })
+        # One entry per host, with the breakers of its products
+        return jsonify(pokemon_scraper.circuit_breakers.summary())
     return jsonify({})
 
 @app.route('/api/collections')
@@ -698,9 +746,10 @@ def get_sites():
         sites_info.append({
             "name": site["name"],
             "base_url": site["base_url"],
-            "type": site["type"],
-            "country": site["country"],
-            "priority": site["priority"],
+            # Optional in the catalog (see site_catalog.REQUIRED_SITE_KEYS)
+            "type": site.get("type", "retailer"),
+            "country": site.get("country", ""),
+            "priority": site.get("priority", 999),
             "product_count": len(site["products"])
         })
     return jsonify(sites_info)
@@ -721,13 +770,14 @@ def save_user_notification():
     min_price = float(data.get('min_price', 0))
     max_price = float(data.get('max_price', 9999))
     
-    conn = sqlite3.connect('database.db')
-    conn.execute(
+    conn = get_db_connection()
+    cursor = conn.execute(
         'INSERT INTO user_notifications (user_id, collection, product, site, min_price, max_price) VALUES (?, ?, ?, ?, ?, ?)',
         (user_id, collection, product, site, min_price, max_price)
     )
     conn.commit()
     conn.close()
+    subscription_index.add_notification(cursor.lastrowid)
     
     return jsonify({"status": "success", "message": "Notification preference saved"})
 
@@ -740,13 +790,15 @@ def delete_user_notification(notification_id):
     
     user_id = session['user_id']
     
-    conn = sqlite3.connect('database.db')
-    conn.execute(
+    conn = get_db_connection()
+    cursor = conn.execute(
         'DELETE FROM user_notifications WHERE id = ? AND user_id = ?',
         (notification_id, user_id)
     )
     conn.commit()
     conn.close()
+    if cursor.rowcount:
+        subscription_index.remove_notification(notification_id)
     
     return jsonify({"status": "success", "message": "Notification deleted"})
 
@@ -1,6 +1,6 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash, session, jsonify
 from flask_bcrypt import Bcrypt
-from datetime import datetime, timedelta
+from datetime import timedelta
 import uuid
 import sqlite3
 import os
@@ -8,6 +8,9 @@ import json
 from functools import wraps
 import re
 import logging
+from db_connection import DB_PATH, get_db_connection
+from subscriptions import subscription_index
+from db_migrations import run_migrations
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("auth")
 
@@ -15,8 +18,7 @@ logger = logging.getLogger("auth")
 auth_bp = Blueprint('auth', __name__)
 bcrypt = Bcrypt()
 
-# Configuration des BD
-DB_PATH = 'database.db'
+# Configuration des BD (chemin partagé : voir db_connection.py)
 USER_SCHEMA = '''
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -48,39 +50,98 @@ CREATE TABLE IF NOT EXISTS user_notifications (
 )
 '''
 
-def init_db():
-    """Initialise la base de données avec le schéma et l'utilisateur admin"""
-    logger.info("Début d'initialisation de la base de données")
+def create_admin_user(conn):
+    """Crée le compte admin par défaut s'il n'existe pas"""
+    admin_exists = conn.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'").fetchone()[0]
+    status = "Existe" if admin_exists else "N'existe pas"
+    logger.info(f"Vérification utilisateur admin: {status}")
     
+    if not admin_exists:
+        logger.info("Création du compte admin par défaut")
+        hashed_pwd = bcrypt.generate_password_hash('admin123').decode('utf-8')
+        conn.execute(
+            'INSERT INTO users (username, email, password, role, api_key) VALUES (?, ?, ?, ?, ?)',
+            ('admin', 'admin@pokemon-monitor.com', hashed_pwd, 'admin', str(uuid.uuid4()))
+        )
+
+def create_base_schema(conn):
+    conn.execute(USER_SCHEMA)
+    conn.execute(NOTIFICATION_SCHEMA)
+    create_admin_user(conn)
+
+# Migrations du schéma, dans l'ordre (ne jamais modifier une migration déjà publiée :
+# en ajouter une nouvelle avec la version suivante)
+MIGRATIONS = [
+    (1, "Tables users et user_notifications, compte admin", create_base_schema),
+    (2, "Index des requêtes sur users et user_notifications", [
+        # get_user_notifications, /api/stats
+        'CREATE INDEX IF NOT EXISTS idx_user_notifications_user_active ON user_notifications (user_id, active)',
+        # Recherche des abonnés d'un produit (collection, produit, site)
+        'CREATE INDEX IF NOT EXISTS idx_user_notifications_match '
+        'ON user_notifications (active, collection, product, site, user_id)',
+        # get_pending_users (filtre sur le rôle, tri par date) et jointure des abonnés approuvés
+        'CREATE INDEX IF NOT EXISTS idx_users_role_created ON users (role, created_at)',
+        # get_all_users
+        'CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at)',
+    ]),
+    (3, "Table circuit_breaker_states (disjoncteurs du bot par hôte et par produit)", [
+        '''
+        CREATE TABLE IF NOT EXISTS circuit_breaker_states (
+            name TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            failure_count INTEGER NOT NULL,
+            last_failure REAL,
+            updated_at REAL NOT NULL
+        )
+        ''',
+    ]),
+    (4, "Historique des vérifications (check_results) et agrégats horaires", [
+        # available est NULL quand la page n'a pas été reconnue (blocage, erreur...)
+        '''
+        CREATE TABLE IF NOT EXISTS check_results (
+            id INTEGER PRIMARY KEY,
+            product TEXT NOT NULL,
+            site TEXT NOT NULL,
+            ts REAL NOT NULL,
+            available INTEGER,
+            price REAL,
+            latency REAL,
+            tier TEXT
+        )
+        ''',
+        # Couvre les requêtes de l'historique, qui ne lisent jamais la table elle-même
+        'CREATE INDEX IF NOT EXISTS idx_check_results_product_ts '
+        'ON check_results (product, ts, site, available, price, latency, tier)',
+        # Recherche des lignes les plus anciennes par la rétention
+        'CREATE INDEX IF NOT EXISTS idx_check_results_ts ON check_results (ts)',
+        '''
+        CREATE TABLE IF NOT EXISTS check_results_hourly (
+            product TEXT NOT NULL,
+            site TEXT NOT NULL,
+            hour INTEGER NOT NULL,
+            checks INTEGER NOT NULL,
+            valid_checks INTEGER NOT NULL,
+            in_stock_checks INTEGER NOT NULL,
+            price_count INTEGER NOT NULL,
+            price_sum REAL,
+            min_price REAL,
+            max_price REAL,
+            latency_sum REAL,
+            PRIMARY KEY (product, hour, site)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+]
+
+def init_db():
+    """Met la base de données à jour (schéma et utilisateur admin) via les migrations"""
     if not os.path.exists(DB_PATH):
         logger.info(f"Création du fichier {DB_PATH}")
     
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Création des tables
-        logger.info("Création du schéma de la base de données")
-        cursor.execute(USER_SCHEMA)
-        cursor.execute(NOTIFICATION_SCHEMA)
-        
-        # Vérification si l'utilisateur admin existe déjà
-        admin_exists = cursor.execute("SELECT COUNT(*) FROM users WHERE username = 'admin'").fetchone()[0]
-        status = "Existe" if admin_exists else "N'existe pas"
-        logger.info(f"Vérification utilisateur admin: {status}")
-        
-        if not admin_exists:
-            # Création de l'utilisateur admin par défaut
-            logger.info("Création du compte admin par défaut")
-            hashed_pwd = bcrypt.generate_password_hash('admin123').decode('utf-8')
-            cursor.execute(
-                'INSERT INTO users (username, email, password, role, api_key) VALUES (?, ?, ?, ?, ?)',
-                ('admin', 'admin@pokemon-monitor.com', hashed_pwd, 'admin', str(uuid.uuid4()))
-            )
-        
-        conn.commit()
-        conn.close()
-        logger.info("Initialisation de la base de données réussie")
+        applied = run_migrations(get_db_connection(), MIGRATIONS)
+        if applied:
+            logger.info(f"Base de données mise à jour: {applied} migration(s) appliquée(s)")
         return True
     except Exception as e:
         logger.error(f"Erreur lors de l'initialisation de la base de données: {e}")
@@ -100,10 +161,8 @@ def get_user_context():
     return {'user': None, 'preferences': {}}
 
 # Fonctions d'accès à la base de données
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+# get_db_connection() renvoie la connexion réutilisée du thread : close() la rend
+# disponible pour l'appel suivant sans la fermer
 
 def get_user_by_username(username):
     conn = get_db_connection()
@@ -159,6 +218,8 @@ def update_user_role(user_id, new_role):
     conn.execute('UPDATE users SET role = ? WHERE id = ?', (new_role, user_id))
     conn.commit()
     conn.close()
+    # Seuls les utilisateurs approuvés reçoivent des alertes
+    subscription_index.refresh_user(user_id)
     return True
 
 def update_user_last_login(user_id):
@@ -172,6 +233,7 @@ def update_user_preferences(user_id, preferences):
     conn.execute('UPDATE users SET preferences = ? WHERE id = ?', (json.dumps(preferences), user_id))
     conn.commit()
     conn.close()
+    subscription_index.refresh_user(user_id)
 
 def get_user_preferences(user_id):
     conn = get_db_connection()
@@ -183,12 +245,13 @@ def get_user_preferences(user_id):
 
 def save_notification_preference(user_id, collection, product, site, min_price=0, max_price=9999):
     conn = get_db_connection()
-    conn.execute(
+    cursor = conn.execute(
         'INSERT INTO user_notifications (user_id, collection, product, site, min_price, max_price) VALUES (?, ?, ?, ?, ?, ?)',
         (user_id, collection, product, site, min_price, max_price)
     )
     conn.commit()
     conn.close()
+    subscription_index.add_notification(cursor.lastrowid)
     return True
 
 def get_user_notifications(user_id):
@@ -396,6 +459,8 @@ def update_profile():
     
     conn.commit()
     conn.close()
+    # L'email sert aux alertes : l'index des abonnements doit le voir
+    subscription_index.refresh_user(user_id)
     
     flash('Profile updated successfully', 'success')
     return redirect(url_for('auth.profile'))
@@ -461,6 +526,7 @@ def reject_user(user_id):
     conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
     conn.commit()
     conn.close()
+    subscription_index.refresh_user(user_id)
     
     flash('User rejected', 'success')
     return redirect(url_for('auth.admin_dashboard'))
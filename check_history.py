@@ -0,0 +1,198 @@
+"""
+check_history.py - Time-series history of check results in SQLite
+"""
+
+import os
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from product_extractor import is_valid_extraction
+from db_connection import get_db_connection
+
+logger = logging.getLogger("PokemonStockBot")
+
+# Results waiting in memory are written together, at most every HISTORY_FLUSH_INTERVAL seconds
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "50"))
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "5"))
+# Raw results older than this are folded into hourly aggregates, which are kept longer
+HISTORY_RAW_DAYS = int(os.getenv("HISTORY_RAW_DAYS", "7"))
+HISTORY_HOURLY_DAYS = int(os.getenv("HISTORY_HOURLY_DAYS", "365"))
+HISTORY_RETENTION_INTERVAL = 3600
+
+HOUR = 3600
+DAY = 86400
+
+DOWNSAMPLE_SQL = """
+INSERT INTO check_results_hourly
+    (product, site, hour, checks, valid_checks, in_stock_checks,
+     price_count, price_sum, min_price, max_price, latency_sum)
+SELECT product, site, CAST(ts / 3600 AS INTEGER) * 3600, COUNT(*), COUNT(available),
+       COALESCE(SUM(available), 0), COUNT(price), SUM(price), MIN(price), MAX(price), SUM(latency)
+FROM check_results
+WHERE ts < ?
+GROUP BY product, site, CAST(ts / 3600 AS INTEGER)
+ON CONFLICT (product, hour, site) DO UPDATE SET
+    checks = checks + excluded.checks,
+    valid_checks = valid_checks + excluded.valid_checks,
+    in_stock_checks = in_stock_checks + excluded.in_stock_checks,
+    price_count = price_count + excluded.price_count,
+    price_sum = COALESCE(price_sum, 0) + COALESCE(excluded.price_sum, 0),
+    min_price = MIN(COALESCE(min_price, excluded.min_price), COALESCE(excluded.min_price, min_price)),
+    max_price = MAX(COALESCE(max_price, excluded.max_price), COALESCE(excluded.max_price, max_price)),
+    latency_sum = COALESCE(latency_sum, 0) + COALESCE(excluded.latency_sum, 0)
+"""
+
+
+class CheckHistory:
+    """
+    Records every check result in the check_results table (created with
+    check_results_hourly by the schema migrations, see auth.MIGRATIONS;
+    available is NULL when the page was not recognised). Checks only put
+    rows in a queue; a single writer thread inserts them in batches (one
+    transaction each) and periodically folds rows older than raw_days into
+    hourly aggregates, so the database stays small.
+    Connections come from db_connection (WAL, so the web pages read the
+    history while the writer appends to it).
+    """
+    def __init__(self, batch_size=HISTORY_BATCH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL,
+                 raw_days=HISTORY_RAW_DAYS, hourly_days=HISTORY_HOURLY_DAYS,
+                 retention_interval=HISTORY_RETENTION_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.raw_days = raw_days
+        self.hourly_days = hourly_days
+        self.retention_interval = retention_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_retention = float("-inf")
+
+    def record(self, site_info, product_info, result, latency=None, tier=None, ts=None):
+        available, _, _, product_data = result
+        valid = is_valid_extraction(product_data)
+        self._queue.put((
+            product_info['name'],
+            site_info['name'],
+            time.time() if ts is None else ts,
+            int(bool(available)) if valid else None,
+            product_data.get("price") if valid else None,
+            latency,
+            tier
+        ))
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="check-history", daemon=True)
+                    self._thread.start()
+
+    def _take_batch(self, timeout):
+        """Wait up to timeout for a first row, then take what is already queued."""
+        try:
+            rows = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, conn, rows):
+        with conn:
+            conn.executemany(
+                "INSERT INTO check_results (product, site, ts, available, price, latency, tier) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        for _ in rows:
+            self._queue.task_done()
+
+    def downsample(self, now=None):
+        """Fold raw rows older than raw_days into hourly rows and drop expired hours."""
+        now = time.time() if now is None else now
+        conn = get_db_connection()
+        # Whole hours only, so an hour never has both raw and aggregated rows
+        cutoff = (now - self.raw_days * DAY) // HOUR * HOUR
+        with conn:
+            conn.execute(DOWNSAMPLE_SQL, (cutoff,))
+            folded = conn.execute("DELETE FROM check_results WHERE ts < ?", (cutoff,)).rowcount
+            conn.execute("DELETE FROM check_results_hourly WHERE hour < ?", (now - self.hourly_days * DAY,))
+        if folded:
+            logger.info(f"Check history: {folded} results folded into hourly aggregates")
+        return folded
+
+    def _run(self):
+        while not self._stop.is_set():
+            rows = self._take_batch(self.flush_interval)
+            try:
+                conn = get_db_connection()
+                if rows:
+                    self._write(conn, rows)
+            except sqlite3.Error as e:
+                logger.error(f"Could not write the check history ({len(rows)} results): {e}")
+                for _ in rows:
+                    self._queue.task_done()
+                continue
+            if time.monotonic() - self._last_retention >= self.retention_interval:
+                self._last_retention = time.monotonic()
+                try:
+                    self.downsample()
+                except sqlite3.Error as e:
+                    logger.error(f"Check history retention failed: {e}")
+
+    def flush(self, timeout=None):
+        """Wait until every queued result has been written."""
+        if self._thread is None:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            time.sleep(0.05)
+
+    def history(self, product, since=None, site=None):
+        """Raw results of a product since a timestamp (default: raw_days), oldest first."""
+        since = time.time() - self.raw_days * DAY if since is None else since
+        query = ("SELECT site, ts, available, price, latency, tier FROM check_results "
+                 "WHERE product = ? AND ts >= ?")
+        params = [product, since]
+        if site:
+            query += " AND site = ?"
+            params.append(site)
+        rows = get_db_connection().execute(query + " ORDER BY ts", params).fetchall()
+        return [
+            {"site": site_name, "ts": ts, "available": None if available is None else bool(available),
+             "price": price, "latency": latency, "tier": tier}
+            for site_name, ts, available, price, latency, tier in rows
+        ]
+
+    def hourly(self, product, since=None, site=None):
+        """Hourly aggregates of a product (older than the raw results), oldest first."""
+        since = 0 if since is None else since
+        query = ("SELECT site, hour, checks, valid_checks, in_stock_checks, price_count, price_sum, "
+                 "min_price, max_price, latency_sum FROM check_results_hourly WHERE product = ? AND hour >= ?")
+        params = [product, since]
+        if site:
+            query += " AND site = ?"
+            params.append(site)
+        rows = get_db_connection().execute(query + " ORDER BY hour", params).fetchall()
+        return [
+            {"site": site_name, "hour": hour, "checks": checks,
+             "in_stock_ratio": in_stock / valid if valid else None,
+             "avg_price": price_sum / price_count if price_count else None,
+             "min_price": min_price, "max_price": max_price,
+             "avg_latency": latency_sum / checks if latency_sum is not None and checks else None}
+            for site_name, hour, checks, valid, in_stock, price_count, price_sum, min_price, max_price, latency_sum
+            in rows
+        ]
+
+    def stop(self):
+        self.flush(timeout=5)
+        self._stop.set()
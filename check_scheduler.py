@@ -0,0 +1,224 @@
+"""
+check_scheduler.py - Priority-queue polling scheduler for product checks
+"""
+
+import heapq
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from product_extractor import is_valid_extraction
+
+logger = logging.getLogger("PokemonStockBot")
+
+# Share of the base interval used for each site priority (1 = most important)
+PRIORITY_FACTORS = {1: 0.25, 2: 0.5}
+# Lower bound of any interval, whatever the priority and volatility
+MIN_INTERVAL = int(os.getenv("MIN_CHECK_INTERVAL", "30"))
+# Number of recent results used to measure how often a product changes
+VOLATILITY_WINDOW = 10
+# Default request budget of a host (overridable per site with "requests_per_minute")
+HOST_REQUESTS_PER_MINUTE = float(os.getenv("HOST_REQUESTS_PER_MINUTE", "6"))
+HOST_BURST = 2
+
+
+class HostBudget:
+    """Token bucket limiting the number of checks sent to one host per minute."""
+    def __init__(self, requests_per_minute, burst=HOST_BURST):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(max(1, burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, now):
+        """Take one token. Returns 0 on success, else the seconds to wait for one."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ScheduledProduct:
+    def __init__(self, site, product, base_interval):
+        self.key = (site['name'], product['name'])
+        self.history = deque(maxlen=VOLATILITY_WINDOW)
+        self.update(site, product, base_interval)
+
+    def update(self, site, product, base_interval):
+        """Take the site and product entries of a new catalog, keeping the history."""
+        self.site = site
+        self.product = product
+        self.host = urlparse(product['url']).netloc.lower()
+        self.base_interval = site.get(
+            "check_interval", base_interval * PRIORITY_FACTORS.get(site.get('priority'), 1.0)
+        )
+
+    def record(self, result):
+        """Keep the availability and price of a check; errors and blocked pages say nothing about them."""
+        available, _, _, product_data = result
+        if is_valid_extraction(product_data):
+            self.history.append((available, product_data.get("price")))
+
+    def volatility(self):
+        """Number of availability or price changes among the recent results."""
+        results = list(self.history)
+        return sum(1 for previous, current in zip(results, results[1:]) if previous != current)
+
+    def next_interval(self):
+        interval = max(MIN_INTERVAL, self.base_interval / (1 + self.volatility()))
+        # Keep some randomness so requests don't follow a fixed pattern
+        return interval * random.uniform(0.9, 1.1)
+
+
+class CheckScheduler:
+    """
+    Keeps a heap of (next_due, product) entries and hands due products to a
+    bounded set of worker threads. Each product's interval comes from its
+    site priority and recent volatility, and every host has a request budget:
+    a due product whose host is out of budget is pushed back to the moment
+    the budget allows it.
+    on_result(site, product, result) is called after every check.
+    """
+    def __init__(self, sites, check_func, on_result=None, base_interval=600, workers=8, host_limit=2):
+        self.check_func = check_func
+        self.on_result = on_result
+        self.base_interval = base_interval
+        self.workers = workers
+        self.host_limit = host_limit
+        self._heap = []
+        self._seq = 0
+        self._products = {}
+        self._budgets = {}
+        self._in_flight = defaultdict(int)
+        self._cond = threading.Condition()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._stop = threading.Event()
+        now = time.monotonic()
+        for site in sites:
+            for product in site['products']:
+                self._add(ScheduledProduct(site, product, base_interval), now)
+
+    def _add(self, item, due):
+        self._products[item.key] = item
+        self._ensure_budget(item)
+        self._push(item, due)
+
+    def _ensure_budget(self, item):
+        if item.host not in self._budgets:
+            rate = item.site.get("requests_per_minute", HOST_REQUESTS_PER_MINUTE)
+            self._budgets[item.host] = HostBudget(rate)
+
+    def _push(self, item, due):
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, item))
+
+    def sync(self, sites):
+        """
+        Apply a new catalog: new products are due at once, removed ones are
+        dropped (a check in progress still finishes), others keep their due
+        time and history.
+        """
+        with self._cond:
+            now = time.monotonic()
+            keys = set()
+            for site in sites:
+                for product in site['products']:
+                    key = (site['name'], product['name'])
+                    keys.add(key)
+                    item = self._products.get(key)
+                    if item is None:
+                        self._add(ScheduledProduct(site, product, self.base_interval), now)
+                    else:
+                        item.update(site, product, self.base_interval)
+                        self._ensure_budget(item)
+            for key in set(self._products) - keys:
+                del self._products[key]
+            self._cond.notify_all()
+        logger.info(f"Scheduler updated - {len(keys)} products")
+
+    def next_due(self):
+        """Wall-clock timestamp of the next scheduled check, or None."""
+        with self._cond:
+            if not self._heap:
+                return None
+            return time.time() + max(0.0, self._heap[0][0] - time.monotonic())
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _next_ready(self):
+        """
+        Pop the most overdue product whose host has a free slot and budget left.
+        Products skipped because of their host keep their due time, so they
+        run before anything that became due after them.
+        """
+        with self._cond:
+            now = time.monotonic()
+            wake = now + 1.0
+            skipped = []
+            try:
+                while self._heap and self._heap[0][0] <= now:
+                    entry = heapq.heappop(self._heap)
+                    item = entry[2]
+                    if self._products.get(item.key) is not item:
+                        # Removed by a catalog reload
+                        continue
+                    if self._in_flight[item.host] >= self.host_limit:
+                        skipped.append(entry)
+                        continue
+                    wait = self._budgets[item.host].try_acquire(now)
+                    if wait > 0:
+                        skipped.append(entry)
+                        wake = min(wake, now + wait)
+                        continue
+                    self._in_flight[item.host] += 1
+                    return item, item.host
+                if self._heap:
+                    wake = min(wake, self._heap[0][0])
+            finally:
+                for entry in skipped:
+                    heapq.heappush(self._heap, entry)
+            self._cond.wait(max(0.0, wake - now))
+            return None
+
+    def _run_check(self, item, host):
+        try:
+            try:
+                result = self.check_func(item.site, item.product)
+            except Exception as e:
+                err_msg = f"Error checking {item.site['name']} for {item.product['name']}: {e}"
+                logger.error(err_msg)
+                result = (False, err_msg, [], {})
+            item.record(result)
+            with self._cond:
+                self._in_flight[host] -= 1
+                if self._products.get(item.key) is item:
+                    self._push(item, time.monotonic() + item.next_interval())
+                self._cond.notify_all()
+            if self.on_result:
+                try:
+                    self.on_result(item.site, item.product, result)
+                except Exception as e:
+                    logger.error(f"Error handling result of {item.product['name']}: {e}")
+        finally:
+            self._slots.release()
+
+    def run(self):
+        """Run checks until stop() is called."""
+        logger.info(f"Scheduler started - {len(self._products)} products on {len(self._budgets)} hosts")
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scheduler") as executor:
+            while not self._stop.is_set():
+                ready = self._next_ready()
+                if ready is None:
+                    continue
+                self._slots.acquire()
+                executor.submit(self._run_check, *ready)
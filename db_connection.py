@@ -0,0 +1,95 @@
+"""
+db_connection.py - Connexions SQLite partagées par l'application (une par thread)
+"""
+
+import os
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger("db_connection")
+
+# Chemin unique de la base, utilisé par l'authentification, l'API et le bot
+DB_PATH = os.getenv("DATABASE_PATH", "database.db")
+# Nombre de requêtes préparées gardées en cache par connexion
+CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))
+# Attente maximale (secondes) quand un autre thread écrit
+BUSY_TIMEOUT = 10
+
+
+class PooledConnection:
+    """
+    Connexion SQLite d'un thread. S'utilise comme sqlite3.Connection ;
+    close() ne ferme pas la connexion mais annule une éventuelle transaction
+    restée ouverte, pour que le prochain appel du même thread reparte propre.
+    """
+    def __init__(self, conn, generation):
+        self._conn = conn
+        self.generation = generation
+
+    @property
+    def raw(self):
+        """La sqlite3.Connection elle-même (par ex. pour Connection.backup)."""
+        return self._conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc_info):
+        return self._conn.__exit__(*exc_info)
+
+    def close(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+    def really_close(self):
+        self._conn.close()
+
+
+class ConnectionProvider:
+    """
+    Fournit à chaque thread sa propre connexion, ouverte une seule fois avec
+    le journal WAL et synchronous=NORMAL, et réutilisée ensuite (ce qui garde
+    aussi le cache de requêtes préparées de sqlite3).
+    """
+    def __init__(self, path=DB_PATH, cached_statements=CACHED_STATEMENTS):
+        self.path = path
+        self.cached_statements = cached_statements
+        self._generation = 0
+        self._local = threading.local()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return PooledConnection(conn, self._generation)
+
+    def get(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and conn.generation != self._generation:
+            conn.really_close()
+            conn = None
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    def set_path(self, path):
+        """Change la base utilisée ; chaque thread se reconnecte à son prochain appel."""
+        self.path = path
+        self.reset()
+
+    def reset(self):
+        """À appeler quand le fichier est remplacé (restauration d'une sauvegarde)."""
+        self._generation += 1
+
+
+db = ConnectionProvider()
+
+
+def get_db_connection():
+    """Connexion SQLite du thread courant (lignes accessibles par nom de colonne)."""
+    return db.get()
@@ -0,0 +1,66 @@
+"""
+db_migrations.py - Migrations versionnées du schéma SQLite
+"""
+
+import time
+import sqlite3
+import logging
+
+logger = logging.getLogger("db_migrations")
+
+SCHEMA_VERSION_TABLE = '''
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    applied_at REAL NOT NULL
+)
+'''
+
+
+def current_version(conn):
+    """Dernière version appliquée (0 pour une base sans migration)"""
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        # Table schema_version absente
+        return 0
+
+
+def run_migrations(conn, migrations):
+    """
+    Applique, dans l'ordre, les migrations (version, description, étape) plus
+    récentes que la version de la base. Une étape est une liste de requêtes SQL
+    ou une fonction recevant la connexion ; chaque migration est appliquée dans
+    sa propre transaction. Renvoie le nombre de migrations appliquées.
+    Si la base est à jour, le seul coût est la lecture de la version.
+    """
+    latest = migrations[-1][0]
+    if current_version(conn) >= latest:
+        return 0
+
+    applied = 0
+    conn.execute(SCHEMA_VERSION_TABLE)
+    conn.commit()
+    for version, description, step in migrations:
+        # BEGIN IMMEDIATE : un seul processus migre, les autres attendent puis relisent la version
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            logger.info(f"Migration {version} : {description}")
+            if callable(step):
+                step(conn)
+            else:
+                for statement in step:
+                    conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, time.time())
+            )
+            conn.commit()
+            applied += 1
+        except Exception:
+            conn.rollback()
+            raise
+    return applied
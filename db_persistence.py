@@ -1,22 +1,25 @@
 # db_persistence.py - Version corrigée
 import os
-import subprocess
 import time
-import shutil
+import tempfile
 import logging
 import sqlite3
 import requests
-import base64
 import hashlib
-from datetime import datetime
-import json
+from db_connection import DB_PATH, get_db_connection
+from db_sync import ContentsStore, DatabaseSync, SyncError
+from subscriptions import subscription_index
 
 # Configuration
 GITHUB_REPO = os.environ.get("GITHUB_REPO", "kaizen2025/database")  # Format: username/repo
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
-GITHUB_API = f"https://api.github.com/repos/{GITHUB_REPO}/contents"
-DB_PATH = "database.db"
-BACKUP_INTERVAL = 900  # 15 minutes
+# Une autre URL (serveur local imitant l'API contents) permet de tester la synchronisation
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+GITHUB_API = f"{GITHUB_API_URL.rstrip('/')}/repos/{GITHUB_REPO}/contents"
+# Ancien format : la base entière dans un seul fichier (encore lu à la restauration)
+GITHUB_DB_FILE = os.path.basename(DB_PATH)
+BACKUP_INTERVAL = 900  # 15 minutes minimum entre deux envois
+CHECK_INTERVAL = 60  # Détection des modifications toutes les minutes
 
 # Configurer le logging
 logging.basicConfig(
@@ -26,6 +29,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger("DB-Persistence")
 
+# Envoi incrémental : base compressée puis changesets SQL (voir db_sync.py)
+database_sync = DatabaseSync(ContentsStore(GITHUB_API, GITHUB_TOKEN), f"{DB_PATH}.synced")
+
 def calculate_file_hash(filepath):
     """Calcule le hash MD5 d'un fichier"""
     if not os.path.exists(filepath):
@@ -37,108 +43,65 @@ def calculate_file_hash(filepath):
             md5_hash.update(chunk)
     return md5_hash.hexdigest()
 
+def copy_database(source, path):
+    """Copie cohérente de la base ouverte vers un fichier (API de sauvegarde SQLite)"""
+    target = sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+
 def get_file_from_github():
-    """Récupère le fichier DB depuis GitHub"""
+    """Récupère la base depuis GitHub (base + changesets, ou ancien fichier unique)"""
     if not GITHUB_TOKEN:
         logger.error("GITHUB_TOKEN non configuré")
         return False
     
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    
     try:
-        # Vérifier si le fichier existe sur GitHub
-        response = requests.get(f"{GITHUB_API}/{DB_PATH}", headers=headers)
+        # Sauvegarder la base locale actuelle si existante
+        if os.path.exists(DB_PATH):
+            backup_path = f"{DB_PATH}.backup"
+            copy_database(get_db_connection().raw, backup_path)
+            logger.info(f"Sauvegarde locale créée: {backup_path}")
         
-        if response.status_code == 200:
-            # Fichier trouvé, télécharger
-            content = response.json()
-            file_content = base64.b64decode(content['content'])
-            
-            # Sauvegarder le fichier local actuel si existant
-            if os.path.exists(DB_PATH):
-                backup_path = f"{DB_PATH}.backup"
-                shutil.copy2(DB_PATH, backup_path)
-                logger.info(f"Sauvegarde locale créée: {backup_path}")
-            
-            # Écrire le fichier téléchargé
-            with open(DB_PATH, "wb") as f:
-                f.write(file_content)
-            
+        # La base reconstruite est copiée dans la base ouverte
+        # (les connexions partagées et le journal WAL restent cohérents)
+        if database_sync.restore(get_db_connection().raw):
+            # Les abonnements indexés en mémoire venaient de l'ancienne base
+            subscription_index.invalidate()
             logger.info(f"Base de données téléchargée depuis GitHub")
             return True
-        elif response.status_code == 404:
+        
+        file_content = database_sync.store.get(GITHUB_DB_FILE)
+        if file_content is None:
             logger.warning("Base de données non trouvée sur GitHub, une nouvelle sera créée")
             return False
-        else:
-            logger.error(f"Erreur lors de la récupération: {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        logger.error(f"Erreur lors de la récupération depuis GitHub: {e}")
-        return False
-
-def upload_file_to_github():
-    """Pousse la base de données vers GitHub"""
-    if not GITHUB_TOKEN:
-        logger.error("GITHUB_TOKEN non configuré")
-        return False
-    
-    if not os.path.exists(DB_PATH):
-        logger.error(f"Le fichier {DB_PATH} n'existe pas")
-        return False
-    
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-    
-    try:
-        # Vérifier si le fichier existe déjà
-        response = requests.get(f"{GITHUB_API}/{DB_PATH}", headers=headers)
-        
-        # Lire le contenu du fichier
-        with open(DB_PATH, "rb") as f:
-            file_content = f.read()
         
-        encoded_content = base64.b64encode(file_content).decode()
-        commit_message = f"Update database - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        
-        data = {
-            "message": commit_message,
-            "content": encoded_content,
-        }
-        
-        # Si le fichier existe déjà, inclure son SHA
-        if response.status_code == 200:
-            data["sha"] = response.json()["sha"]
-        
-        # Envoyer le fichier
-        upload_response = requests.put(
-            f"{GITHUB_API}/{DB_PATH}",
-            headers=headers,
-            json=data
-        )
+        download_path = f"{DB_PATH}.download"
+        with open(download_path, "wb") as f:
+            f.write(file_content)
+        source = sqlite3.connect(download_path)
+        try:
+            source.backup(get_db_connection().raw)
+        finally:
+            source.close()
+            os.remove(download_path)
+        subscription_index.invalidate()
         
-        if upload_response.status_code in [200, 201]:
-            logger.info(f"Base de données sauvegardée sur GitHub")
-            return True
-        else:
-            logger.error(f"Erreur lors de l'envoi: {upload_response.status_code} - {upload_response.text}")
-            return False
+        logger.info(f"Base de données téléchargée depuis GitHub (ancien format)")
+        return True
     except Exception as e:
-        logger.error(f"Erreur lors de l'envoi vers GitHub: {e}")
+        logger.error(f"Erreur lors de la récupération depuis GitHub: {e}")
         return False
 
-def verify_db_integrity():
-    """Vérifie que la base de données est utilisable"""
-    if not os.path.exists(DB_PATH):
+def verify_db_integrity(path=None):
+    """Vérifie que la base de données (ou un instantané) est utilisable"""
+    if not os.path.exists(path or DB_PATH):
         logger.warning("Base de données non trouvée localement")
         return False
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = sqlite3.connect(path) if path else get_db_connection()
         # Vérifier que les tables essentielles existent
         tables = conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()
         conn.close()
@@ -155,6 +118,81 @@ def verify_db_integrity():
         logger.error(f"Erreur lors de la vérification de la base de données: {e}")
         return False
 
+def create_snapshot():
+    """Copie cohérente de la base dans un fichier temporaire, sans bloquer les écritures"""
+    fd, path = tempfile.mkstemp(
+        prefix="snapshot-", suffix=".db", dir=os.path.dirname(os.path.abspath(DB_PATH))
+    )
+    os.close(fd)
+    try:
+        copy_database(get_db_connection().raw, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path
+
+class ChangeDetector:
+    """
+    Détecte les modifications de la base sans la relire : PRAGMA data_version
+    change quand une autre connexion (de ce processus ou d'un autre) valide
+    une écriture, et la date/taille des fichiers base et -wal couvrent les
+    remplacements du fichier.
+    """
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self.state = None
+        self._conn = None
+    
+    def _current_state(self):
+        # Connexion dédiée : data_version ignore les écritures de sa propre connexion
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10)
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        files = []
+        for path in (self.path, f"{self.path}-wal"):
+            try:
+                stat = os.stat(path)
+                files.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                files.append(None)
+        return data_version, tuple(files)
+    
+    def changed(self):
+        state = self._current_state()
+        changed = state != self.state
+        self.state = state
+        return changed
+
+def backup_database(last_hash=None):
+    """
+    Sauvegarde un instantané de la base sur GitHub s'il diffère du dernier envoyé.
+    Renvoie le hash de l'instantané envoyé, last_hash si l'instantané est
+    identique au dernier envoyé, ou None en cas d'échec.
+    """
+    snapshot = create_snapshot()
+    try:
+        snapshot_hash = calculate_file_hash(snapshot)
+        if snapshot_hash == last_hash:
+            logger.info("Contenu identique à la dernière sauvegarde, envoi ignoré")
+            return last_hash
+        if not verify_db_integrity(snapshot):
+            return None
+        if not GITHUB_TOKEN:
+            logger.error("GITHUB_TOKEN non configuré")
+            return None
+        try:
+            sent = database_sync.push(snapshot)
+        except (requests.RequestException, SyncError, sqlite3.Error) as e:
+            logger.error(f"Erreur lors de l'envoi vers GitHub: {e}")
+            # Le manifeste distant sera relu au prochain envoi
+            database_sync.manifest = None
+            return None
+        if sent:
+            logger.info(f"Base de données sauvegardée sur GitHub ({sent})")
+        return snapshot_hash
+    finally:
+        os.remove(snapshot)
+
 def create_db_schema():
     """Crée le schéma de la base de données si nécessaire"""
     try:
@@ -190,47 +228,43 @@ def run_db_persistence():
         db_valid = verify_db_integrity()
         logger.info(f"Base de données initialisée localement: {'Succès' if db_valid else 'Échec'}")
     
-    # Boucle principale
-    try:
-        while True:
-            time.sleep(60)  # Check toutes les minutes
-            if os.path.exists(DB_PATH):
-                current_hash = calculate_file_hash(DB_PATH)
-                logger.info(f"Vérification périodique de la base de données: {current_hash}")
-            else:
-                logger.error("Base de données absente lors de la vérification périodique")
-    except Exception as e:
-        logger.error(f"Erreur dans la boucle principale: {e}")
-    
     # 4. Vérifier si une sauvegarde est disponible en cas d'échec
     if not db_valid and os.path.exists(f"{DB_PATH}.backup"):
         logger.warning("Restauration depuis la sauvegarde locale...")
-        shutil.copy2(f"{DB_PATH}.backup", DB_PATH)
+        source = sqlite3.connect(f"{DB_PATH}.backup")
+        try:
+            source.backup(get_db_connection().raw)
+        finally:
+            source.close()
+        subscription_index.invalidate()
         if verify_db_integrity():
             logger.info("Restauration depuis la sauvegarde réussie.")
-            upload_file_to_github()
     
-    # Boucle de surveillance et sauvegarde
-    last_upload_time = time.time()
-    last_db_hash = calculate_file_hash(DB_PATH)
+    # Boucle de surveillance et sauvegarde : une base qui ne vient pas de GitHub
+    # est envoyée dès le départ, ensuite seulement après des modifications
+    detector = ChangeDetector()
+    detector.changed()
+    pending = not db_downloaded
+    last_upload_time = 0.0
+    last_snapshot_hash = None
     
     while True:
         try:
-            current_time = time.time()
-            current_hash = calculate_file_hash(DB_PATH)
-            
-            # Vérifier si la DB a été modifiée et si l'intervalle de temps est écoulé
-            time_elapsed = current_time - last_upload_time > BACKUP_INTERVAL
-            hash_changed = current_hash != last_db_hash
+            if detector.changed():
+                pending = True
             
-            if (hash_changed or time_elapsed) and verify_db_integrity():
-                logger.info("Modifications détectées ou délai écoulé, sauvegarde en cours...")
-                if upload_file_to_github():
-                    last_upload_time = current_time
-                    last_db_hash = current_hash
+            if pending and time.time() - last_upload_time >= BACKUP_INTERVAL:
+                logger.info("Modifications détectées, sauvegarde en cours...")
+                uploaded_hash = backup_database(last_snapshot_hash)
+                # En cas d'échec (None), la sauvegarde reste en attente
+                if uploaded_hash is not None:
+                    if uploaded_hash != last_snapshot_hash:
+                        last_upload_time = time.time()
+                        last_snapshot_hash = uploaded_hash
+                    pending = False
             
             # Attendre avant la prochaine vérification
-            time.sleep(60)  # Vérifier toutes les minutes
+            time.sleep(CHECK_INTERVAL)
             
         except Exception as e:
             logger.error(f"Erreur dans la boucle de persistance: {e}")
@@ -0,0 +1,312 @@
+"""
+db_sync.py - Synchronisation incrémentale de la base SQLite avec l'API contents de GitHub
+
+Format distant (dans SYNC_DIR) :
+- manifest.json : instantané de base et liste ordonnée des changesets
+- base-<id>-<n>.gz : morceaux de l'instantané compressé (gzip)
+- delta-<id>-<n>.sql.gz : changesets SQL compressés, à rejouer dans l'ordre sur la base
+
+La restauration reconstruit la base à partir de la base compressée, puis
+rejoue les changesets.
+"""
+
+import os
+import time
+import gzip
+import json
+import base64
+import shutil
+import sqlite3
+import hashlib
+import logging
+import requests
+
+logger = logging.getLogger("DB-Persistence")
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+SYNC_DIR = os.environ.get("GITHUB_SYNC_DIR", "database-sync")
+# Taille des morceaux compressés : sous 1 Mo une fois encodés en base64, l'API
+# renvoie alors le contenu directement
+CHUNK_SIZE = int(os.environ.get("SYNC_CHUNK_SIZE", str(700 * 1024)))
+# Une nouvelle base est envoyée après MAX_DELTAS changesets, ou quand leur
+# taille cumulée dépasse DELTA_RATIO fois celle de la base
+MAX_DELTAS = int(os.environ.get("SYNC_MAX_DELTAS", "50"))
+DELTA_RATIO = float(os.environ.get("SYNC_DELTA_RATIO", "0.5"))
+
+
+class SyncError(Exception):
+    pass
+
+
+class ContentsStore:
+    """
+    Fichiers d'un dépôt via l'API contents (GitHub ou serveur compatible).
+    Les sha des fichiers sont gardés en cache : une mise à jour n'a pas
+    besoin d'une lecture préalable, sauf si le fichier a changé entre-temps.
+    """
+    def __init__(self, api_url, token, session=None):
+        self.api_url = api_url.rstrip("/")
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json"
+        })
+        self.shas = {}
+
+    def _url(self, path):
+        return f"{self.api_url}/{path}"
+
+    def get(self, path):
+        """Contenu d'un fichier, ou None s'il n'existe pas"""
+        response = self.session.get(self._url(path), timeout=60)
+        if response.status_code == 404:
+            self.shas.pop(path, None)
+            return None
+        response.raise_for_status()
+        data = response.json()
+        self.shas[path] = data["sha"]
+        if data.get("content"):
+            return base64.b64decode(data["content"])
+        # Fichier trop gros pour être renvoyé en JSON : lecture du contenu brut
+        raw = self.session.get(
+            self._url(path), headers={"Accept": "application/vnd.github.v3.raw"}, timeout=60
+        )
+        raw.raise_for_status()
+        return raw.content
+
+    def put(self, path, content, message):
+        """Crée ou remplace un fichier et renvoie son sha"""
+        body = {"message": message, "content": base64.b64encode(content).decode()}
+        if path in self.shas:
+            body["sha"] = self.shas[path]
+        response = self.session.put(self._url(path), json=body, timeout=120)
+        if response.status_code in (409, 422):
+            # sha en cache périmé (ou fichier créé ailleurs) : relire puis réessayer une fois
+            self.get(path)
+            if path in self.shas:
+                body["sha"] = self.shas[path]
+            response = self.session.put(self._url(path), json=body, timeout=120)
+        response.raise_for_status()
+        sha = response.json()["content"]["sha"]
+        self.shas[path] = sha
+        return sha
+
+    def delete(self, path, sha, message):
+        response = self.session.delete(self._url(path), json={"message": message, "sha": sha}, timeout=60)
+        if response.status_code not in (200, 404):
+            response.raise_for_status()
+        self.shas.pop(path, None)
+
+
+def _quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(text):
+    """Texte à inclure dans une chaîne SQL entre apostrophes"""
+    return text.replace("'", "''")
+
+
+def _schema(conn, database):
+    return sorted(
+        tuple(row) for row in conn.execute(f"SELECT type, name, tbl_name, sql FROM {database}.sqlite_master")
+    )
+
+
+def _tables(conn):
+    return [row[0] for row in conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' "
+        "AND (name NOT LIKE 'sqlite_%' OR name = 'sqlite_sequence') ORDER BY name"
+    )]
+
+
+def _row_key(conn, table):
+    """Colonnes identifiant une ligne : rowid, ou la clé primaire d'une table WITHOUT ROWID"""
+    try:
+        conn.execute(f"SELECT rowid FROM main.{table} LIMIT 0")
+        return ["rowid"]
+    except sqlite3.OperationalError:
+        info = conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+        return [_quote_identifier(row[1]) for row in sorted(info, key=lambda row: row[5]) if row[5]]
+
+
+def compute_changeset(old_path, new_path):
+    """
+    Script SQL qui transforme la base old_path en new_path ("" si elles sont
+    identiques). Renvoie None quand le schéma a changé : il faut alors
+    envoyer une nouvelle base.
+    """
+    conn = sqlite3.connect(new_path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS old", (old_path,))
+        if _schema(conn, "main") != _schema(conn, "old"):
+            return None
+
+        deletes, upserts = [], []
+        for name in _tables(conn):
+            table = _quote_identifier(name)
+            key = _row_key(conn, table)
+            columns = [_quote_identifier(row[1]) for row in conn.execute(f"PRAGMA main.table_info({table})")]
+            if key == ["rowid"]:
+                columns = ["rowid"] + columns
+            column_list = ", ".join(columns)
+            # Les requêtes SQL sont produites par SQLite lui-même (quote() échappe textes et blobs)
+            values = " || ',' || ".join(f"quote({column})" for column in columns)
+            upserts.extend(row[0] for row in conn.execute(
+                f"SELECT '{_literal(f'INSERT OR REPLACE INTO {table} ({column_list}) VALUES (')}' || {values} || ');' "
+                f"FROM (SELECT {column_list} FROM main.{table} EXCEPT SELECT {column_list} FROM old.{table})"
+            ))
+            key_list = ", ".join(key)
+            condition = " || ' AND ' || ".join(f"'{_literal(column)} = ' || quote({column})" for column in key)
+            deletes.extend(row[0] for row in conn.execute(
+                f"SELECT '{_literal(f'DELETE FROM {table} WHERE ')}' || {condition} || ';' "
+                f"FROM (SELECT {key_list} FROM old.{table} EXCEPT SELECT {key_list} FROM main.{table})"
+            ))
+    finally:
+        conn.close()
+
+    if not deletes and not upserts:
+        return ""
+    return "\n".join(["BEGIN;"] + deletes + upserts + ["COMMIT;"]) + "\n"
+
+
+class DatabaseSync:
+    """
+    Envoie la base sous forme d'une base compressée découpée en morceaux puis
+    de changesets SQL, calculés contre synced_path : la copie locale de l'état
+    déjà présent sur le dépôt.
+    """
+    def __init__(self, store, synced_path, directory=SYNC_DIR, chunk_size=CHUNK_SIZE,
+                 max_deltas=MAX_DELTAS, delta_ratio=DELTA_RATIO):
+        self.store = store
+        self.synced_path = synced_path
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.max_deltas = max_deltas
+        self.delta_ratio = delta_ratio
+        self.manifest = None
+
+    def _path(self, name):
+        return f"{self.directory}/{name}"
+
+    def load_manifest(self):
+        data = self.store.get(self._path(MANIFEST_FILE))
+        self.manifest = json.loads(data) if data else {}
+        if self.manifest and self.manifest.get("format") != FORMAT_VERSION:
+            raise SyncError(f"Format de synchronisation inconnu: {self.manifest.get('format')}")
+        return self.manifest
+
+    def _save_manifest(self, message):
+        self.manifest["updated_at"] = time.time()
+        self.store.put(self._path(MANIFEST_FILE), json.dumps(self.manifest, indent=1).encode(), message)
+
+    def _needs_new_base(self):
+        base = self.manifest.get("base")
+        if not base or not os.path.exists(self.synced_path):
+            return True
+        deltas = self.manifest.get("deltas", [])
+        return len(deltas) >= self.max_deltas or sum(delta["size"] for delta in deltas) > self.delta_ratio * base["size"]
+
+    def push(self, snapshot_path):
+        """
+        Envoie l'instantané snapshot_path : un changeset si possible, sinon une
+        nouvelle base. Renvoie "delta", "base", ou None s'il n'y avait rien à envoyer.
+        """
+        if self.manifest is None:
+            self.load_manifest()
+
+        changeset = None if self._needs_new_base() else compute_changeset(self.synced_path, snapshot_path)
+        if changeset == "":
+            return None
+        if changeset is None:
+            self._push_base(snapshot_path)
+            kind = "base"
+        else:
+            self._push_delta(changeset)
+            kind = "delta"
+        shutil.copyfile(snapshot_path, self.synced_path)
+        return kind
+
+    def _push_base(self, snapshot_path):
+        with open(snapshot_path, "rb") as f:
+            raw = f.read()
+        compressed = gzip.compress(raw)
+        base_id = str(int(time.time() * 1000))
+        message = f"Database base {base_id}"
+        chunks = []
+        for index, offset in enumerate(range(0, len(compressed), self.chunk_size)):
+            path = self._path(f"base-{base_id}-{index:03d}.gz")
+            sha = self.store.put(path, compressed[offset:offset + self.chunk_size], message)
+            chunks.append({"path": path, "sha": sha})
+
+        previous = self.manifest
+        self.manifest = {
+            "format": FORMAT_VERSION,
+            "base": {
+                "id": base_id,
+                "chunks": chunks,
+                "size": len(compressed),
+                "sha256": hashlib.sha256(raw).hexdigest()
+            },
+            "deltas": []
+        }
+        self._save_manifest(message)
+        logger.info(f"Base envoyée: {len(raw)} octets, {len(compressed)} compressés en {len(chunks)} morceau(x)")
+
+        # Les fichiers de l'ancienne base ne sont plus référencés par le manifeste
+        for entry in previous.get("base", {}).get("chunks", []) + previous.get("deltas", []):
+            try:
+                self.store.delete(entry["path"], entry["sha"], f"Remove {entry['path']}")
+            except requests.RequestException as e:
+                logger.warning(f"Suppression de {entry['path']} impossible: {e}")
+
+    def _push_delta(self, changeset):
+        data = gzip.compress(changeset.encode("utf-8"))
+        deltas = self.manifest.setdefault("deltas", [])
+        path = self._path(f"delta-{self.manifest['base']['id']}-{len(deltas) + 1:04d}.sql.gz")
+        sha = self.store.put(path, data, f"Database changeset {len(deltas) + 1}")
+        deltas.append({"path": path, "sha": sha, "size": len(data)})
+        self._save_manifest(f"Database changeset {len(deltas)}")
+        logger.info(f"Changeset envoyé: {changeset.count(chr(10)) - 2} requête(s), {len(data)} octets")
+
+    def restore(self, target):
+        """
+        Reconstruit la base distante (base + changesets) et la copie dans la
+        connexion target. Renvoie False si le dépôt ne contient pas ce format.
+        """
+        manifest = self.load_manifest()
+        base = manifest.get("base")
+        if not base:
+            return False
+
+        parts = []
+        for chunk in base["chunks"]:
+            part = self.store.get(chunk["path"])
+            if part is None:
+                raise SyncError(f"Morceau manquant: {chunk['path']}")
+            parts.append(part)
+        raw = gzip.decompress(b"".join(parts))
+        if hashlib.sha256(raw).hexdigest() != base["sha256"]:
+            raise SyncError("Base distante corrompue (sha256 différent)")
+
+        restore_path = f"{self.synced_path}.restore"
+        with open(restore_path, "wb") as f:
+            f.write(raw)
+        try:
+            conn = sqlite3.connect(restore_path)
+            try:
+                for delta in manifest.get("deltas", []):
+                    data = self.store.get(delta["path"])
+                    if data is None:
+                        raise SyncError(f"Changeset manquant: {delta['path']}")
+                    conn.executescript(gzip.decompress(data).decode("utf-8"))
+                conn.backup(target)
+            finally:
+                conn.close()
+            os.replace(restore_path, self.synced_path)
+        finally:
+            if os.path.exists(restore_path):
+                os.remove(restore_path)
+        logger.info(f"Base restaurée: base {base['id']} + {len(manifest.get('deltas', []))} changeset(s)")
+        return True
@@ -0,0 +1,169 @@
+"""
+fetch_engine.py - Asyncio HTTP engine for the standard product check path
+"""
+
+import codecs
+import asyncio
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+import aiohttp
+
+logger = logging.getLogger("PokemonStockBot")
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FetchedPage:
+    """
+    Status, headers and body of a GET. When the body was streamed into a
+    document (see AsyncFetchEngine.fetch), content is None and document is
+    the object that received the chunks.
+    """
+    def __init__(self, url, status_code, headers, encoding, content=None, document=None):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.encoding = encoding
+        self.content = content
+        self.document = document
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+
+class AsyncFetchEngine:
+    """
+    Runs the HTTP requests of product checks as coroutines on one asyncio
+    event loop, in a background thread, with aiohttp.
+    Every host accepts at most host_limit requests at a time, so products of
+    different retailers are fetched together while no retailer sees a burst.
+    Each site keeps one client session (keep-alive connections, TLS
+    sessions, cookies) that is rebuilt after max_age seconds.
+    Coroutines are awaited from other threads with run(), or in batches with
+    gather().
+    """
+    def __init__(self, host_limit=2, max_age=1800, timeout=30, max_retries=3, backoff_factor=2,
+                 retry_statuses=RETRY_STATUSES):
+        self.host_limit = host_limit
+        self.max_age = max_age
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.retry_statuses = tuple(retry_statuses)
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        # Only touched from the loop thread
+        self._sessions = {}
+        self._semaphores = {}
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="fetch-engine", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run(self, coro):
+        """Run a coroutine on the engine loop and wait for its result (from any other thread)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop()).result()
+
+    def gather(self, coros):
+        """Run coroutines together; returns their results in order (exceptions are returned, not raised)."""
+        async def gather_all():
+            return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(gather_all())
+
+    def _semaphore(self, host):
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.host_limit)
+        return semaphore
+
+    def _session(self, site_key, max_age):
+        entry = self._sessions.get(site_key)
+        if entry and time.monotonic() - entry[1] < max_age:
+            return entry[0]
+        if entry:
+            logger.info(f"Refreshing pooled session for {site_key}")
+            # Requests still using the old session finish before it is closed
+            self._loop.call_later(self.timeout, asyncio.ensure_future, entry[0].close())
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit_per_host=self.host_limit, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        self._sessions[site_key] = (session, time.monotonic())
+        return session
+
+    async def fetch(self, site_key, url, headers=None, cookies=None, proxy=None, stream=None,
+                    chunk_size=16 * 1024, max_bytes=None, max_age=None, max_retries=None, backoff_factor=None):
+        """
+        GET url with the session of site_key, within the host limit.
+        Statuses of retry_statuses and connection errors are retried with an
+        exponential backoff. With stream, a 200 body is not kept: stream(encoding)
+        must return a document whose feed(chunk) returns True once the rest of
+        the page is not needed; the download stops there or after max_bytes.
+        Returns a FetchedPage.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        backoff_factor = self.backoff_factor if backoff_factor is None else backoff_factor
+        async with self._semaphore(urlparse(url).netloc.lower()):
+            for attempt in range(max_retries + 1):
+                session = self._session(site_key, self.max_age if max_age is None else max_age)
+                try:
+                    async with session.get(url, headers=headers, cookies=cookies, proxy=proxy) as response:
+                        if response.status not in self.retry_statuses or attempt == max_retries:
+                            return await self._read(response, stream, chunk_size, max_bytes)
+                        logger.info(f"HTTP {response.status} on {url}, retrying")
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == max_retries:
+                        raise
+                    logger.info(f"Connection error on {url}, retrying")
+                await asyncio.sleep(backoff_factor * (2 ** attempt))
+
+    async def _read(self, response, stream, chunk_size, max_bytes):
+        encoding = response.charset or "utf-8"
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            encoding = "utf-8"
+        page = FetchedPage(str(response.url), response.status, response.headers, encoding)
+        if response.status != 200:
+            return page
+        if stream is None:
+            page.content = await response.read()
+            return page
+
+        document = page.document = stream(encoding)
+        bytes_read = 0
+        async for chunk in response.content.iter_chunked(chunk_size):
+            bytes_read += len(chunk)
+            if document.feed(chunk):
+                break
+            if max_bytes and bytes_read >= max_bytes:
+                logger.info(f"Stream size cap reached ({bytes_read} bytes) for {page.url}")
+                break
+        # Leaving the response context drops the connection of a stream cut short
+        return page
+
+    async def _close_sessions(self):
+        sessions = [session for session, _ in self._sessions.values()]
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+    def close(self):
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_sessions(), loop).result(timeout=5)
+        except Exception as e:
+            logger.warning(f"Could not close the fetch engine sessions: {e}")
+        loop.call_soon_threadsafe(loop.stop)
@@ -1,77 +1,251 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import aiohttp
 import time
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
-from datetime import datetime, timedelta
+from datetime import datetime
 import logging
 import telebot
 import re
 import os
 import random
-import json
+import hashlib
 import socket
 import ssl
+import threading
+import atexit
+import sqlite3
 from dotenv import load_dotenv
-from urllib3.util.retry import Retry
-from requests.adapters import HTTPAdapter
 import io
 import base64
+from urllib.parse import urlparse
 from PIL import Image
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, WebDriverException, StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException, WebDriverException
 import chromedriver_autoinstaller
 from selenium.webdriver.chrome.service import Service
 import cloudscraper
-from lxml import html
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+from product_extractor import extract_page, is_valid_extraction
+from fetch_engine import AsyncFetchEngine
+from check_scheduler import CheckScheduler
+from site_catalog import load_catalog, make_extractor, CatalogWatcher
+from state_changes import StateDiffEngine, is_alert_event, RESTOCK, PRICE_CHANGE
+from check_history import CheckHistory
+# SQLite database shared with the web application
+from db_connection import get_db_connection
 
 ###############################################################################
 #                         CIRCUIT BREAKER MANAGEMENT                          #
 ###############################################################################
 class CircuitBreaker:
-    def __init__(self, name, failure_threshold=3, recovery_timeout=300):
+    """
+    Circuit breaker using a monotonic clock. While HALF-OPEN only one probe
+    request is let through at a time. A breaker may have a parent (the breaker
+    of the host): requests need both to allow them, and outcomes are reported
+    to both.
+    """
+    def __init__(self, name, failure_threshold=3, recovery_timeout=300, on_open=None, parent=None, on_change=None):
         self.name = name
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
         self.failure_count = 0
         self.last_failure_time = None
         self.state = "CLOSED"
+        # Called whenever the breaker opens (e.g. to drop state tied to the failing site)
+        self.on_open = on_open
+        self.parent = parent
+        # Called with the breaker after every state change (persistence)
+        self.on_change = on_change
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def _state_changed(self, state):
+        if state == "OPEN":
+            logger.warning(f"Circuit breaker for {self.name} changed to OPEN")
+            if self.on_open:
+                self.on_open()
+        else:
+            logger.info(f"Circuit breaker for {self.name} changed to {state}")
+        if self.on_change:
+            self.on_change(self)
 
     def record_failure(self):
-        self.failure_count += 1
-        self.last_failure_time = datetime.now()
-        if self.failure_count >= self.failure_threshold:
-            self.state = "OPEN"
-            logger.warning(f"Circuit breaker for {self.name} changed to OPEN")
+        with self._lock:
+            self.failure_count += 1
+            self.last_failure_time = time.monotonic()
+            self._probe_started = None
+            opened = self.failure_count >= self.failure_threshold and self.state != "OPEN"
+            if opened:
+                self.state = "OPEN"
+        if opened:
+            self._state_changed("OPEN")
+        if self.parent:
+            self.parent.record_failure()
 
     def record_success(self):
-        if self.state == "HALF-OPEN":
-            self.state = "CLOSED"
-            self.failure_count = 0
-            logger.info(f"Circuit breaker for {self.name} changed to CLOSED")
-        elif self.state == "CLOSED":
-            self.failure_count = 0
+        with self._lock:
+            self._probe_started = None
+            closed = self.state == "HALF-OPEN"
+            if self.state in ("HALF-OPEN", "CLOSED"):
+                self.state = "CLOSED"
+                self.failure_count = 0
+        if closed:
+            self._state_changed("CLOSED")
+        if self.parent:
+            self.parent.record_success()
+
+    def release(self):
+        """End a request without an outcome (e.g. a local error), freeing the probe slot."""
+        with self._lock:
+            self._probe_started = None
+        if self.parent:
+            self.parent.release()
+
+    def _acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "CLOSED":
+                return True
+            half_opened = False
+            if self.state == "OPEN":
+                if now - self.last_failure_time <= self.recovery_timeout:
+                    return False
+                self.state = "HALF-OPEN"
+                half_opened = True
+            # HALF-OPEN: a single probe at a time (a lost probe expires after recovery_timeout)
+            if self._probe_started is not None and now - self._probe_started < self.recovery_timeout:
+                return False
+            self._probe_started = now
+        if half_opened:
+            self._state_changed("HALF-OPEN")
+        return True
 
     def allow_request(self):
-        if self.state == "CLOSED":
-            return True
-        if self.state == "OPEN":
-            elapsed = datetime.now() - self.last_failure_time
-            if elapsed.total_seconds() > self.recovery_timeout:
-                self.state = "HALF-OPEN"
-                logger.info(f"Circuit breaker for {self.name} changed to HALF-OPEN")
-                return True
+        if not self._acquire():
             return False
-        if self.state == "HALF-OPEN":
-            return True
-        return False
+        if self.parent and not self.parent.allow_request():
+            with self._lock:
+                self._probe_started = None
+            return False
+        return True
+
+    def snapshot(self):
+        """State with the last failure as a wall-clock timestamp, for persistence."""
+        with self._lock:
+            last_failure = None
+            if self.last_failure_time is not None:
+                last_failure = time.time() - (time.monotonic() - self.last_failure_time)
+            return self.state, self.failure_count, last_failure
+
+    def restore(self, state, failure_count, last_failure):
+        with self._lock:
+            self.state = state
+            self.failure_count = failure_count
+            if last_failure is not None:
+                self.last_failure_time = time.monotonic() - max(0.0, time.time() - last_failure)
+            elif state != "CLOSED":
+                self.state = "CLOSED"
+
+
+class CircuitBreakerRegistry:
+    """
+    Thread-safe registry with one breaker per host and one child breaker per
+    product. A host that is down opens after a few failures across all of its
+    products instead of being hit once per product.
+    State changes are saved to SQLite so that a restart does not hammer a
+    failing host.
+    """
+    def __init__(self, host_failure_threshold=3):
+        self.host_failure_threshold = host_failure_threshold
+        self._hosts = {}
+        self._products = {}
+        self._saved = None
+        self._lock = threading.Lock()
+
+    def _load_saved(self):
+        if self._saved is not None:
+            return
+        self._saved = {}
+        try:
+            # Table created by the schema migrations (auth.MIGRATIONS)
+            conn = get_db_connection()
+            rows = conn.execute(
+                "SELECT name, state, failure_count, last_failure FROM circuit_breaker_states"
+            ).fetchall()
+            self._saved = {name: (state, count, last_failure) for name, state, count, last_failure in rows}
+        except sqlite3.Error as e:
+            logger.error(f"Could not load circuit breaker states: {e}")
+
+    def _create(self, name, parent=None, on_open=None, failure_threshold=3):
+        breaker = CircuitBreaker(
+            name, failure_threshold=failure_threshold, on_open=on_open, parent=parent, on_change=self._save
+        )
+        if name in self._saved:
+            breaker.restore(*self._saved[name])
+            if breaker.state != "CLOSED":
+                logger.info(f"Circuit breaker for {name} restored as {breaker.state}")
+        return breaker
+
+    def get(self, url, name, on_open=None):
+        """
+        Breaker of one product (named name), child of the breaker of its host.
+        on_open is called when either of them opens.
+        """
+        host = get_host(url)
+        with self._lock:
+            self._load_saved()
+            parent = self._hosts.get(host)
+            if parent is None:
+                parent = self._hosts[host] = self._create(
+                    host, on_open=on_open, failure_threshold=self.host_failure_threshold
+                )
+                self._products[host] = {}
+            elif on_open and parent.on_open is None:
+                parent.on_open = on_open
+            breaker = self._products[host].get(name)
+            if breaker is None:
+                breaker = self._products[host][name] = self._create(name, parent, on_open)
+            elif on_open and breaker.on_open is None:
+                breaker.on_open = on_open
+            return breaker
+
+    def _save(self, breaker):
+        state, failure_count, last_failure = breaker.snapshot()
+        try:
+            with get_db_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO circuit_breaker_states "
+                    "(name, state, failure_count, last_failure, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (breaker.name, state, failure_count, last_failure, time.time())
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Could not save circuit breaker {breaker.name}: {e}")
+
+    def summary(self):
+        """Aggregated view: one entry per host with the state of its products."""
+        with self._lock:
+            hosts = [(host, parent, list(self._products[host].items())) for host, parent in self._hosts.items()]
+        view = {}
+        for host, parent, products in hosts:
+            view[host] = {
+                "state": parent.state,
+                "failure_count": parent.failure_count,
+                "open_products": sum(1 for _, breaker in products if breaker.state != "CLOSED"),
+                "products": {
+                    name: {"state": breaker.state, "failure_count": breaker.failure_count}
+                    for name, breaker in products
+                }
+            }
+        return view
 
 
 ###############################################################################
@@ -172,11 +346,51 @@ MAX_RETRIES = 3
 RETRY_BACKOFF_FACTOR = 2
 RETRY_STATUS_FORCELIST = [429, 500, 502, 503, 504]
 
+# Site catalog (JSON files) and how often they are checked for changes, in seconds
+CATALOG_DIR = os.getenv("CATALOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "catalog"))
+CATALOG_RELOAD_INTERVAL = int(os.getenv("CATALOG_RELOAD_INTERVAL", "10"))
+
 # Random verification interval
 CHECK_INTERVAL_MIN = int(os.getenv("INTERVALLE_MIN", "540"))
 CHECK_INTERVAL_MAX = int(os.getenv("INTERVALLE_MAX", "660"))
 RETRY_INTERVAL = 30  # in seconds
 
+# Concurrent checks: total worker threads and simultaneous checks per host
+CHECK_WORKERS = int(os.getenv("CHECK_WORKERS", "8"))
+HOST_CONCURRENCY = int(os.getenv("HOST_CONCURRENCY", "2"))
+
+# Lifetime (in seconds) of the pooled per-site HTTP sessions before a refresh
+SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", "1800"))
+# Lifetime of a per-site cloudscraper, kept below the usual life of solved challenge cookies
+SCRAPER_MAX_AGE = int(os.getenv("SCRAPER_MAX_AGE", "900"))
+# Statuses showing that the challenge cookies of a cloudscraper are no longer accepted
+CHALLENGE_STATUS_CODES = (403, 429, 503)
+
+# Streaming parse for sites with "streaming": True (chunk size and default byte cap)
+STREAM_CHUNK_SIZE = 16 * 1024
+STREAM_MAX_BYTES = int(os.getenv("STREAM_MAX_BYTES", str(2 * 1024 * 1024)))
+
+# HTML parsing in worker processes (0 = parse in the fetching thread); only pages
+# of at least PARSE_POOL_MIN_BYTES are sent, smaller ones parse faster than the round trip
+PARSE_PROCESSES = int(os.getenv("PARSE_PROCESSES", "0"))
+PARSE_POOL_MIN_BYTES = int(os.getenv("PARSE_POOL_MIN_BYTES", str(64 * 1024)))
+
+# Warm headless Chrome pool: number of browsers and checks served before a browser is recycled
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "25"))
+
+# Alert screenshots: cropped around the highlighted elements and re-encoded under a size cap
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "JPEG").upper()  # JPEG or WEBP
+SCREENSHOT_MAX_BYTES = int(os.getenv("SCREENSHOT_MAX_BYTES", "150000"))
+SCREENSHOT_MAX_WIDTH = 1024
+SCREENSHOT_PADDING = 40
+
+# Seconds during which a product check result is served again instead of re-fetching
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "5"))
+
+# Seconds after which a site memoized on an expensive fetch tier retries the next cheaper one
+TIER_DECAY = int(os.getenv("TIER_DECAY", "1800"))
+
 # List of User-Agents
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
@@ -195,494 +409,79 @@ USER_AGENTS = [
 ###############################################################################
 #            DEFINITION OF SITES TO MONITOR                                   #
 ###############################################################################
-POKEMON_COLLECTIONS = [
-    {
-        "name": "Collection Prismatique",
-        "keywords": ["pokemon", "prismatique", "jcc", "coffret", "boosters"],
-        "product_ids": ["B0D35YH8CW", "B0D35YH5T3"],  # Amazon product IDs examples
-        "image_url": "https://m.media-amazon.com/images/I/71jjIpV14wL._AC_SL1500_.jpg"
-    },
-    {
-        "name": "Collection Aventures Ensemble",
-        "keywords": ["pokemon", "aventures ensemble", "jcc", "coffret", "boosters"],
-        "product_ids": ["B0CD1MMYKL", "B0CD1K2Y9V"],  # Amazon product IDs examples
-        "image_url": "https://m.media-amazon.com/images/I/71WJKOS8MIL._AC_SL1500_.jpg"
-    },
-    {
-        "name": "Collection Eaux Florissantes",
-        "keywords": ["pokemon", "eaux florissantes", "jcc", "coffret", "boosters"],
-        "product_ids": ["B0BZ3Z7BF1", "B0C84MB8D4"],  # Amazon product IDs examples
-        "image_url": "https://m.media-amazon.com/images/I/71J8vVaMB2L._AC_SL1500_.jpg"
-    }
-]
+# Collections, selector sets and sites are declared in the JSON files of
+# CATALOG_DIR, validated and compiled at load time (see site_catalog.py)
+catalog = load_catalog(CATALOG_DIR)
+POKEMON_COLLECTIONS = catalog.collections
+COMMON_SELECTORS = catalog.selectors
+SITES = catalog.sites
+
+circuit_breakers = CircuitBreakerRegistry()
+proxy_manager = ProxyManager()
 
-# Common scraping selectors for different sites
-COMMON_SELECTORS = {
-    "amazon": {
-        "availability": [
-            "#availability span", 
-            "#availability",
-            "#outOfStock",
-            ".a-section.a-spacing-none.a-padding-none > #availability",
-            ".a-section.a-spacing-micro > #availability"
-        ],
-        "price": [
-            "#priceblock_ourprice", 
-            ".a-price .a-offscreen",
-            "#corePrice_feature_div .a-price .a-offscreen",
-            ".a-section.a-spacing-none.aok-align-center > .a-price .a-offscreen"
-        ],
-        "title": [
-            "#productTitle",
-            "#title",
-            ".product-title-word-break"
-        ],
-        "image": [
-            "#landingImage",
-            "#imgBlkFront",
-            ".a-dynamic-image img",
-            "#image-block-container img"
-        ],
-        "add_to_cart_button": [
-            "#add-to-cart-button",
-            "#add-to-cart",
-            "#buy-now-button",
-            ".a-button-input[name='submit.add-to-cart']",
-            "#submit\\.add-to-cart"
-        ],
-        "in_stock_text": [
-            "En stock",
-            "Disponible",
-            "Livraison gratuite",
-            "expédié par Amazon",
-            "Disponible à l'achat"
-        ],
-        "out_of_stock_text": [
-            "Actuellement indisponible",
-            "Nous ne savons pas quand cet article sera de nouveau approvisionné",
-            "Temporairement en rupture de stock",
-            "Cet article n'est pas disponible",
-            "Rupture de stock"
-        ]
-    },
-    "fnac": {
-        "availability": [
-            ".f-buyBox-availabilityStatus-available", 
-            ".f-buyBox-availabilityStatus",
-            ".js-Availability-price",
-            ".f-buyBox-element.js-ProductAvailability"
-        ],
-        "price": [
-            ".f-priceBox-price.f-priceBox-price--reco", 
-            ".f-priceBox-price",
-            ".js-ProductPrice span"
-        ],
-        "title": [
-            ".f-productHeader-Title",
-            ".js-ProductTitle",
-            "h1[itemprop='name']"
-        ],
-        "image": [
-            ".f-productVisuals-mainVisual img",
-            ".js-ProductMainImage",
-            ".product-img img[itemprop='image']"
-        ],
-        "add_to_cart_button": [
-            ".js-ProductBuy-add button",
-            ".f-buyBox-button--buyNow",
-            ".js-AddToCart button",
-            "button[data-fbt='addToCart']"
-        ],
-        "in_stock_text": [
-            "En stock",
-            "Disponible",
-            "Expédié sous",
-            "livraison gratuite",
-            "En stock en ligne"
-        ],
-        "out_of_stock_text": [
-            "Indisponible",
-            "En rupture de stock",
-            "Momentanément indisponible",
-            "Rupture fournisseur",
-            "Stock épuisé"
-        ]
-    },
-    "cultura": {
-        "availability": [
-            ".stock-box", 
-            ".availability-msg",
-            ".product-info-stock"
-        ],
-        "price": [
-            ".product-info-price .price-final-price .price", 
-            ".regular-price .price",
-            ".price-container .price"
-        ],
-        "title": [
-            ".page-title-wrapper h1",
-            ".product-name",
-            ".product-info-main h1"
-        ],
-        "image": [
-            ".gallery-placeholder img",
-            ".product-image-photo",
-            ".fotorama__img"
-        ],
-        "add_to_cart_button": [
-            "#product-addtocart-button",
-            ".tocart",
-            "button.action.primary.tocart"
-        ],
-        "in_stock_text": [
-            "En stock",
-            "Disponible",
-            "Expédié sous",
-            "En stock en magasin",
-            "En stock en ligne"
-        ],
-        "out_of_stock_text": [
-            "Indisponible",
-            "Rupture",
-            "Épuisé",
-            "Non disponible",
-            "Plus en stock"
-        ]
-    },
-    "carrefour": {
-        "availability": [
-            ".stock-status",
-            ".product-detail__stock",
-            "[data-automation='product-stock-status']"
-        ],
-        "price": [
-            ".product-price__amount",
-            ".product-details__current-price",
-            "[data-automation='product-price']"
-        ],
-        "title": [
-            ".product-detail__title",
-            ".product-card__title",
-            "h1.product-detail__title"
-        ],
-        "image": [
-            ".product-detail__image img",
-            ".product-card__image img",
-            "[data-automation='product-visual'] img"
-        ],
-        "add_to_cart_button": [
-            ".pdp-button-container button",
-            ".add-to-cart-button",
-            "[data-automation='add-to-cart-button']"
-        ],
-        "in_stock_text": [
-            "En stock",
-            "Disponible",
-            "Livrable",
-            "en magasin",
-            "Disponible"
-        ],
-        "out_of_stock_text": [
-            "Indisponible",
-            "Épuisé",
-            "Rupture",
-            "Plus disponible",
-            "Non livrable"
-        ]
-    },
-    "joueclubdrive": {
-        "availability": [
-            ".product-info__stock", 
-            ".stock-indication",
-            ".in-stock-status"
-        ],
-        "price": [
-            ".price-info .price", 
-            ".current-price",
-            ".product-price"
-        ],
-        "title": [
-            ".product-info__name",
-            ".product-name",
-            "h1.product-title"
-        ],
-        "image": [
-            ".product-media__image img",
-            ".product-image img",
-            ".product-image-container img"
-        ],
-        "add_to_cart_button": [
-            ".product-add-form button",
-            "#product-addtocart-button",
-            ".add-to-cart-button"
-        ],
-        "in_stock_text": [
-            "En stock",
-            "Disponible",
-            "Retrait",
-            "Livraison",
-            "En magasin"
-        ],
-        "out_of_stock_text": [
-            "Indisponible",
-            "Rupture",
-            "Épuisé",
-            "Non disponible",
-            "Plus en stock"
-        ]
-    },
-    "kingjouetonline": {
-        "availability": [
-            ".product-stock", 
-            ".availability",
-            ".stock-info"
-        ],
-        "price": [
-            ".product-price", 
-            ".price-box .regular-price",
-            ".price-container .price"
-        ],
-        "title": [
-            ".product-name h1",
-            ".page-title",
-            ".product-details h1"
-        ],
-        "image": [
-            ".product-img-box img",
-            ".product-image-container img",
-            ".gallery-image img"
-        ],
-        "add_to_cart_button": [
-            ".add-to-cart-buttons button",
-            ".add-to-cart",
-            ".product-add-form button"
-        ],
-        "in_stock_text": [
-            "En stock",
-            "Disponible",
-            "Expédié sous",
-            "Retrait",
-            "En magasin"
-        ],
-        "out_of_stock_text": [
-            "Indisponible",
-            "Rupture",
-            "Épuisé",
-            "Non disponible",
-            "Plus en stock"
-        ]
-    }
-}
-
-SITES = [
-    {
-        "name": "Amazon France",
-        "base_url": "https://www.amazon.fr",
-        "type": "official",
-        "country": "France",
-        "priority": 1,
-        "selectors": COMMON_SELECTORS["amazon"],
-        "anti_bot_protection": True,
-        "products": [
-            # Prismatique collection
-            {
-                "name": "Collection Prismatique - Coffret Dresseur d'élite",
-                "collection": "Collection Prismatique",
-                "url": "https://www.amazon.fr/dp/B0D35YH8CW",
-                "expected_price_range": [39.99, 59.99]
-            },
-            {
-                "name": "Collection Prismatique - Booster Display 36 boosters",
-                "collection": "Collection Prismatique",
-                "url": "https://www.amazon.fr/dp/B0D35YH5T3",
-                "expected_price_range": [129.99, 169.99]
-            },
-            
-            # Aventures Ensemble collection
-            {
-                "name": "Collection Aventures Ensemble - Coffret Dresseur d'élite",
-                "collection": "Collection Aventures Ensemble",
-                "url": "https://www.amazon.fr/dp/B0CD1MMYKL",
-                "expected_price_range": [39.99, 59.99]
-            },
-            {
-                "name": "Collection Aventures Ensemble - Booster Display",
-                "collection": "Collection Aventures Ensemble",
-                "url": "https://www.amazon.fr/dp/B0CD1K2Y9V",
-                "expected_price_range": [129.99, 169.99]
-            },
-            
-            # Eaux Florissantes collection
-            {
-                "name": "Collection Eaux Florissantes - Coffret Dresseur d'élite",
-                "collection": "Collection Eaux Florissantes",
-                "url": "https://www.amazon.fr/dp/B0BZ3Z7BF1",
-                "expected_price_range": [39.99, 59.99]
-            },
-            {
-                "name": "Collection Eaux Florissantes - Booster Display",
-                "collection": "Collection Eaux Florissantes",
-                "url": "https://www.amazon.fr/dp/B0C84MB8D4",
-                "expected_price_range": [129.99, 169.99]
-            }
-        ]
-    },
-    {
-        "name": "Amazon Italie",
-        "base_url": "https://www.amazon.it",
-        "type": "official",
-        "country": "Italie",
-        "priority": 2,
-        "selectors": COMMON_SELECTORS["amazon"],
-        "anti_bot_protection": True,
-        "products": [
-            # Prismatique collection - Italian name: "Collezione Prismatica"
-            {
-                "name": "Collezione Prismatica - Elite Trainer Box",
-                "collection": "Collection Prismatique",
-                "url": "https://www.amazon.it/dp/B0D35YH8CW",
-                "expected_price_range": [39.99, 59.99]
-            },
-            {
-                "name": "Collezione Prismatica - Display 36 buste",
-                "collection": "Collection Prismatique",
-                "url": "https://www.amazon.it/dp/B0D35YH5T3",
-                "expected_price_range": [129.99, 169.99]
-            }
-            # Add more products here...
-        ]
-    },
-    {
-        "name": "Amazon Espagne",
-        "base_url": "https://www.amazon.es",
-        "type": "official",
-        "country": "Espagne",
-        "priority": 2,
-        "selectors": COMMON_SELECTORS["amazon"],
-        "anti_bot_protection": True,
-        "products": [
-            # Prismatique collection - Spanish name: "Colección Prismática"
-            {
-                "name": "Colección Prismática - Caja de Entrenador Élite",
-                "collection": "Collection Prismatique",
-                "url": "https://www.amazon.es/dp/B0D35YH8CW",
-                "expected_price_range": [39.99, 59.99]
-            },
-            {
-                "name": "Colección Prismática - Display 36 sobres",
-                "collection": "Collection Prismatique",
-                "url": "https://www.amazon.es/dp/B0D35YH5T3",
-                "expected_price_range": [129.99, 169.99]
-            }
-            # Add more products here...
-        ]
-    },
-    {
-        "name": "Fnac",
-        "base_url": "https://www.fnac.com",
-        "type": "official_reseller",
-        "country": "France",
-        "priority": 1,
-        "selectors": COMMON_SELECTORS["fnac"],
-        "anti_bot_protection": False,
-        "products": [
-            {
-                "name": "Collection Prismatique - Coffret Dresseur d'élite",
-                "collection": "Collection Prismatique",
-                "url": "https://www.fnac.com/a18577953/Pokemon-Coffret-Dresseur-d-Elite-Ecarlate-et-Violet-10-Collection-Prismatique",
-                "expected_price_range": [39.99, 59.99]
-            },
-            {
-                "name": "Collection Aventures Ensemble - Coffret Dresseur d'élite",
-                "collection": "Collection Aventures Ensemble",
-                "url": "https://www.fnac.com/a18381025/Pokemon-Coffret-Dresseur-d-Elite-Ecarlate-et-Violet-09-Collection-Aventures-Ensemble",
-                "expected_price_range": [39.99, 59.99]
-            }
-            # Add more products here...
-        ]
-    },
-    {
-        "name": "Cultura",
-        "base_url": "https://www.cultura.com",
-        "type": "official_reseller",
-        "country": "France",
-        "priority": 1,
-        "selectors": COMMON_SELECTORS["cultura"],
-        "anti_bot_protection": False,
-        "products": [
-            {
-                "name": "Collection Prismatique - Coffret Dresseur d'élite",
-                "collection": "Collection Prismatique",
-                "url": "https://www.cultura.com/p-pokemon-coffret-dresseur-d-elite-collection-prismatique-10-0194735603494.html",
-                "expected_price_range": [39.99, 59.99]
-            },
-            {
-                "name": "Collection Aventures Ensemble - Coffret Dresseur d'élite",
-                "collection": "Collection Aventures Ensemble",
-                "url": "https://www.cultura.com/p-pokemon-coffret-dresseur-d-elite-collection-aventures-ensemble-9-0194735602923.html",
-                "expected_price_range": [39.99, 59.99]
-            }
-            # Add more products here...
-        ]
-    },
-    {
-        "name": "Carrefour",
-        "base_url": "https://www.carrefour.fr",
-        "type": "retailer",
-        "country": "France",
-        "priority": 2,
-        "selectors": COMMON_SELECTORS["carrefour"],
-        "anti_bot_protection": False,
-        "products": [
-            {
-                "name": "Collection Prismatique - Coffret Dresseur d'élite",
-                "collection": "Collection Prismatique",
-                "url": "https://www.carrefour.fr/p/coffret-dresseur-d-elite-pokemon-epee-et-bouclier-collection-prismatique-0194735603494",
-                "expected_price_range": [39.99, 59.99]
-            }
-            # Add more products here...
-        ]
-    },
-    {
-        "name": "JouéClub",
-        "base_url": "https://www.joueclub.fr",
-        "type": "official_reseller",
-        "country": "France",
-        "priority": 1,
-        "selectors": COMMON_SELECTORS["joueclubdrive"],
-        "anti_bot_protection": False,
-        "products": [
-            {
-                "name": "Collection Prismatique - Coffret Dresseur d'élite",
-                "collection": "Collection Prismatique",
-                "url": "https://www.joueclub.fr/produit/pokemon-coffret-dresseur-d-elite-collection-prismatique.html",
-                "expected_price_range": [39.99, 59.99]
-            }
-            # Add more products here...
-        ]
-    },
-    {
-        "name": "King Jouet",
-        "base_url": "https://www.king-jouet.com",
-        "type": "official_reseller",
-        "country": "France",
-        "priority": 1,
-        "selectors": COMMON_SELECTORS["kingjouetonline"],
-        "anti_bot_protection": False,
-        "products": [
-            {
-                "name": "Collection Prismatique - Coffret Dresseur d'élite",
-                "collection": "Collection Prismatique",
-                "url": "https://www.king-jouet.com/jeu-jouet/jeux-societe-plateau-cartes/jeux-de-cartes/ref-991322-pokemon-coffret-dresseur-d-elite-collection-prismatique.htm",
-                "expected_price_range": [39.99, 59.99]
-            }
-            # Add more products here...
-        ]
-    }
-]
+# Last known state of every product; check results are turned into change events
+change_tracker = StateDiffEngine()
+# Called with every ChangeEvent (notifications, persistence, web statistics...)
+change_listeners = []
+# Every check result (availability, price, latency, fetch tier) kept in SQLite
+check_history = CheckHistory()
+atexit.register(check_history.stop)
+
+
+###############################################################################
+#              COMPILED EXTRACTORS (ONE PER SITE ENTRY)                       #
+###############################################################################
+def get_extractor(site_info):
+    """Return the compiled extractor of a site, building it for sites outside SITES."""
+    extractors = catalog.extractors
+    extractor = extractors.get(site_info['name'])
+    if extractor is None:
+        extractor = make_extractor(site_info)
+        extractors[site_info['name']] = extractor
+    return extractor
 
-circuit_breakers = {}
-proxy_manager = ProxyManager()
+
+###############################################################################
+#                        CATALOG HOT RELOAD                                   #
+###############################################################################
+# Called with the new catalog after every reload (scheduler, web statistics...)
+catalog_listeners = []
+catalog_watcher = None
+_catalog_watch_lock = threading.Lock()
+
+
+def apply_catalog(new_catalog):
+    """
+    Swap in a new compiled catalog. Checks already running keep the site and
+    product dicts they were given; every later lookup sees the new catalog.
+    """
+    global catalog, SITES, POKEMON_COLLECTIONS, COMMON_SELECTORS
+    catalog = new_catalog
+    SITES = new_catalog.sites
+    POKEMON_COLLECTIONS = new_catalog.collections
+    COMMON_SELECTORS = new_catalog.selectors
+    # Cached extractions may come from the previous selectors, and the tier
+    # that worked for a site from its previous URLs or options
+    page_cache.clear()
+    check_coalescer.clear()
+    fetch_tiers.clear()
+    for listener in list(catalog_listeners):
+        try:
+            listener(new_catalog)
+        except Exception as e:
+            logger.error(f"Error applying the new catalog: {e}")
+
+
+def start_catalog_watch():
+    """Start watching the catalog files (once per process)."""
+    global catalog_watcher
+    with _catalog_watch_lock:
+        if catalog_watcher is None:
+            catalog_watcher = CatalogWatcher(
+                CATALOG_DIR, apply_catalog, CATALOG_RELOAD_INTERVAL, catalog.signature
+            )
+            catalog_watcher.start()
+    return catalog_watcher
 
 ###############################################################################
 #        RANDOM WAIT FUNCTION WITH TIME (NO pyautogui)                        #
@@ -695,26 +494,302 @@ def random_wait(min_sec=2, max_sec=5):
 
 
 ###############################################################################
-#           HTTP SESSION CREATION WITH RETRIES AND PROXY SUPPORT              #
+#         HTTP SESSIONS (CLOUDSCRAPER POOL AND ASYNCIO FETCH ENGINE)          #
 ###############################################################################
-def create_session(site_info=None):
-    session = requests.Session()
-    retry_config = site_info.get("retry_config", {}) if site_info else {}
-    max_retries = retry_config.get("max_retries", MAX_RETRIES)
-    backoff_factor = retry_config.get("backoff_factor", RETRY_BACKOFF_FACTOR)
-    retry_strategy = Retry(
-        total=max_retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=RETRY_STATUS_FORCELIST,
-        allowed_methods=["GET", "HEAD", "OPTIONS", "POST"]
+def create_scraper_session(site_info=None):
+    return cloudscraper.create_scraper(
+        browser={"browser": "chrome", "platform": "windows", "desktop": True},
+        delay=5
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    proxies = proxy_manager.get_proxy_dict()
-    if proxies:
-        session.proxies.update(proxies)
-    return session
+
+
+class SessionPool:
+    """
+    Keeps one long-lived session per site so that keep-alive connections and
+    TLS sessions are reused across products and cycles.
+    Sessions are rebuilt after site_info["session_max_age"] seconds (default
+    SESSION_MAX_AGE). Proxies are passed per request, so the pooled sessions
+    carry none of their own.
+    """
+    def __init__(self, factory, max_age=SESSION_MAX_AGE):
+        self.factory = factory
+        self.max_age = max_age
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, site_info):
+        key = site_info['name']
+        max_age = site_info.get("session_max_age", self.max_age)
+        expired = None
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry and time.monotonic() - entry["created"] < max_age:
+                return entry["session"]
+            if entry:
+                expired = entry["session"]
+            session = self.factory(site_info)
+            self._sessions[key] = {"session": session, "created": time.monotonic()}
+        if expired:
+            logger.info(f"Refreshing pooled session for {key}")
+            expired.close()
+        return session
+
+    def invalidate(self, site_info):
+        with self._lock:
+            entry = self._sessions.pop(site_info['name'], None)
+        if entry:
+            entry["session"].close()
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._sessions.values())
+            self._sessions.clear()
+        for entry in entries:
+            entry["session"].close()
+
+
+# Standard checks run on an asyncio loop: one aiohttp session per site, HOST_CONCURRENCY requests per host
+fetch_engine = AsyncFetchEngine(
+    host_limit=HOST_CONCURRENCY,
+    max_age=SESSION_MAX_AGE,
+    max_retries=MAX_RETRIES,
+    backoff_factor=RETRY_BACKOFF_FACTOR,
+    retry_statuses=RETRY_STATUS_FORCELIST
+)
+atexit.register(fetch_engine.close)
+# Warm cloudscrapers keep their solved challenge cookies; they are also dropped on
+# challenge statuses and when a circuit breaker of the site opens
+scraper_sessions = SessionPool(create_scraper_session, max_age=SCRAPER_MAX_AGE)
+atexit.register(scraper_sessions.clear)
+
+
+###############################################################################
+#         CONDITIONAL FETCH CACHE (ETAG / LAST-MODIFIED / BODY HASH)          #
+###############################################################################
+# Markup that changes on every request without changing the product (comments, CSP nonces)
+VOLATILE_MARKUP = re.compile(r'<!--.*?-->|\snonce="[^"]*"', re.DOTALL)
+
+
+def hash_page_body(text):
+    """Hash of the page body with volatile markup and whitespace runs removed."""
+    normalized = re.sub(r'\s+', ' ', VOLATILE_MARKUP.sub('', text))
+    return hashlib.sha1(normalized.encode('utf-8', errors='replace')).hexdigest()
+
+
+class PageCache:
+    """
+    Remembers, for each product page, the HTTP validators (ETag/Last-Modified),
+    the normalized body hash and the last extraction, so unchanged pages are
+    neither downloaded again (304) nor parsed again (same hash).
+    """
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def conditional_headers(self, key):
+        entry = self.get(key)
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, key, response, body_hash, in_stock, product_data):
+        with self._lock:
+            self._entries[key] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "body_hash": body_hash,
+                "in_stock": in_stock,
+                "product_data": dict(product_data)
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+page_cache = PageCache()
+
+
+class ParsePool:
+    """
+    Process pool running product_extractor.extract_page(), so that the CPU
+    bound parsing of concurrent checks is not serialized by the GIL.
+    Workers are started on first use with the "spawn" method (the monitor
+    process runs threads and browsers, which must not be forked).
+    """
+    def __init__(self, processes=PARSE_PROCESSES, min_bytes=PARSE_POOL_MIN_BYTES):
+        self.processes = processes
+        self.min_bytes = min_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def accepts(self, body):
+        return self.processes > 0 and len(body) >= self.min_bytes
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def extract(self, extractor, body, buy_url, encoding="utf-8", scan_page_text=False):
+        """Returns (in_stock, product_data); parses in the calling thread if the pool broke."""
+        try:
+            future = self._get_executor().submit(
+                extract_page, extractor.spec, body, buy_url, scan_page_text, encoding
+            )
+            return future.result(timeout=60)
+        except BrokenProcessPool:
+            logger.error("Parse worker pool broken, restarting it")
+            self.shutdown()
+            return extract_page(extractor.spec, body, buy_url, scan_page_text, encoding)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+parse_pool = ParsePool()
+atexit.register(parse_pool.shutdown)
+
+
+def _not_modified(cache_key, status_code, url):
+    """Previous (in_stock, product_data) of a page answered with 304, or None."""
+    cached = page_cache.get(cache_key)
+    if status_code == 304 and cached:
+        logger.info(f"Not modified since last check: {url}")
+        return cached["in_stock"], dict(cached["product_data"])
+    return None
+
+
+def _extract_body(site_info, url, cache_key, response, scan_page_text):
+    """
+    Extract a fully downloaded 200 response (requests.Response or FetchedPage),
+    unless its normalized body is identical to the last one.
+    Large pages are parsed in the worker processes of parse_pool when enabled.
+    """
+    cached = page_cache.get(cache_key)
+    body_hash = hash_page_body(response.text)
+    if cached and cached["body_hash"] == body_hash:
+        logger.info(f"Page content unchanged since last check: {url}")
+        page_cache.store(cache_key, response, body_hash, cached["in_stock"], cached["product_data"])
+        return cached["in_stock"], dict(cached["product_data"])
+
+    extractor = get_extractor(site_info)
+    if parse_pool.accepts(response.content):
+        in_stock, product_data = parse_pool.extract(
+            extractor, response.content, url, response.encoding, scan_page_text
+        )
+    else:
+        in_stock, product_data, _ = extractor.extract_html(response.text, url, scan_page_text=scan_page_text)
+    page_cache.store(cache_key, response, body_hash, in_stock, product_data)
+    return in_stock, product_data
+
+
+def _request_headers(cache_key, headers):
+    request_headers = dict(headers)
+    request_headers.update(page_cache.conditional_headers(cache_key))
+    return request_headers
+
+
+def fetch_and_extract(session, site_info, product_info, headers, cookies, scan_page_text=False):
+    """
+    GET a product page with a requests-compatible session (cloudscraper) and
+    extract it with the site's compiled extractor.
+    Sends conditional headers and reuses the previous extraction on a 304 or
+    when the normalized body is identical to the last one.
+    Sites with "streaming": True are parsed while downloading and the
+    download stops once every selector group resolved (or after
+    "stream_max_bytes"), so their body hash is not used.
+    Returns (status_code, in_stock, product_data); product_data is None
+    when the status is not usable.
+    """
+    url = product_info['url']
+    cache_key = (url, scan_page_text)
+    streaming = site_info.get("streaming", False)
+    response = session.get(
+        url, headers=_request_headers(cache_key, headers), cookies=cookies,
+        proxies=proxy_manager.get_proxy_dict(), timeout=30, stream=streaming
+    )
+
+    try:
+        cached = _not_modified(cache_key, response.status_code, url)
+        if cached:
+            return (200,) + cached
+        if response.status_code != 200:
+            return response.status_code, False, None
+
+        if streaming:
+            in_stock, product_data, _ = get_extractor(site_info).extract_stream(
+                response.iter_content(STREAM_CHUNK_SIZE),
+                url,
+                encoding=response.encoding or "utf-8",
+                max_bytes=site_info.get("stream_max_bytes", STREAM_MAX_BYTES),
+                scan_page_text=scan_page_text
+            )
+            page_cache.store(cache_key, response, None, in_stock, product_data)
+            return 200, in_stock, product_data
+
+        return (200,) + _extract_body(site_info, url, cache_key, response, scan_page_text)
+    finally:
+        # Releases the connection, or drops it when the stream was cut short
+        response.close()
+
+
+async def fetch_and_extract_async(site_info, product_info, headers, cookies, scan_page_text=False):
+    """
+    Coroutine counterpart of fetch_and_extract() for fetch_engine: the
+    download is awaited on the engine loop (per-site session, per-host
+    limit) and the parsing runs in a thread so other downloads go on.
+    Site options: "streaming", "stream_max_bytes", "session_max_age" and
+    "retry_config" ({"max_retries", "backoff_factor"}).
+    """
+    url = product_info['url']
+    cache_key = (url, scan_page_text)
+    streaming = site_info.get("streaming", False)
+    extractor = get_extractor(site_info)
+    retry_config = site_info.get("retry_config", {})
+    page = await fetch_engine.fetch(
+        site_info['name'],
+        url,
+        headers=_request_headers(cache_key, headers),
+        cookies=cookies,
+        proxy=proxy_manager.get_proxy_dict().get("https"),
+        stream=extractor.stream_document if streaming else None,
+        chunk_size=STREAM_CHUNK_SIZE,
+        max_bytes=site_info.get("stream_max_bytes", STREAM_MAX_BYTES),
+        max_age=site_info.get("session_max_age"),
+        max_retries=retry_config.get("max_retries"),
+        backoff_factor=retry_config.get("backoff_factor")
+    )
+
+    cached = _not_modified(cache_key, page.status_code, url)
+    if cached:
+        return (200,) + cached
+    if page.status_code != 200:
+        return page.status_code, False, None
+
+    loop = asyncio.get_running_loop()
+    if streaming:
+        in_stock, product_data, _ = await loop.run_in_executor(
+            None, extractor.extract_streamed, page.document, url, scan_page_text
+        )
+        page_cache.store(cache_key, page, None, in_stock, product_data)
+        return 200, in_stock, product_data
+
+    return (200,) + await loop.run_in_executor(None, _extract_body, site_info, url, cache_key, page, scan_page_text)
 
 
 def get_user_agent():
@@ -743,9 +818,9 @@ def send_email(subject, message, screenshots=None):
             if screenshots:
                 for i, screenshot in enumerate(screenshots):
                     try:
-                        img_data = base64.b64decode(screenshot["data"])
-                        img = MIMEImage(img_data)
-                        img.add_header('Content-Disposition', f'attachment; filename="screenshot_{i+1}.png"')
+                        subtype = screenshot.get("mime_type", "image/png").split("/")[-1]
+                        img = MIMEImage(screenshot_bytes(screenshot), _subtype=subtype)
+                        img.add_header('Content-Disposition', f'attachment; filename="screenshot_{i+1}.{subtype}"')
                         img.add_header('Content-ID', f'<screenshot_{i+1}>')
                         msg.attach(img)
                     except Exception as e:
@@ -776,9 +851,8 @@ def send_telegram_alert(message, screenshots=None):
                 if screenshots:
                     for screenshot in screenshots:
                         try:
-                            img_data = base64.b64decode(screenshot["data"])
                             caption = screenshot.get("caption", "Stock availability detected")
-                            with io.BytesIO(img_data) as img_stream:
+                            with io.BytesIO(screenshot_bytes(screenshot)) as img_stream:
                                 bot.send_photo(TELEGRAM_CHAT_ID, img_stream, caption=caption)
                         except Exception as e:
                             logger.error(f"Error sending Telegram screenshot: {e}")
@@ -825,21 +899,40 @@ def send_notifications(subject, message, alerts=None):
 ###############################################################################
 #          INITIALIZING SELENIUM BROWSER FOR COMPLEX SITES                    #
 ###############################################################################
-def initialize_browser(force_stable_chrome_version="113"):
+_chromedriver_lock = threading.Lock()
+_chromedriver_checked = False
+
+
+def ensure_chromedriver(force_stable_chrome_version="113"):
     """
-    Initialize and return a headless Chrome browser instance.
+    Install chromedriver once per process (at startup or before the first browser).
     force_stable_chrome_version: e.g. "113", "114"...
     """
-    try:
-        logger.info("Initializing headless browser (Selenium)")
-
+    global _chromedriver_checked
+    with _chromedriver_lock:
+        if _chromedriver_checked:
+            return
+        _chromedriver_checked = True
         # FORCE a stable version (if possible) to avoid "no such driver by url" errors
         try:
             chromedriver_autoinstaller.install(True, force_stable_chrome_version)
         except Exception as e:
             logger.warning(f"chromedriver-autoinstaller couldn't install version {force_stable_chrome_version}: {e}")
             # Try a default install
-            chromedriver_autoinstaller.install()
+            try:
+                chromedriver_autoinstaller.install()
+            except Exception as e:
+                logger.error(f"chromedriver-autoinstaller failed: {e}")
+
+
+def initialize_browser(force_stable_chrome_version="113"):
+    """
+    Initialize and return a headless Chrome browser instance.
+    force_stable_chrome_version: e.g. "113", "114"...
+    """
+    try:
+        logger.info("Initializing headless browser (Selenium)")
+        ensure_chromedriver(force_stable_chrome_version)
 
         options = Options()
         options.add_argument("--headless=new")
@@ -878,55 +971,222 @@ def initialize_browser(force_stable_chrome_version="113"):
         return None
 
 
+class BrowserPool:
+    """
+    Bounded pool of warm headless browsers leased to Selenium checks.
+    Browsers are reset between leases (cookies, storage, extra tabs) and quit after
+    max_uses checks or as soon as a check using them failed.
+    """
+    def __init__(self, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES):
+        self.max_uses = max_uses
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._uses = {}
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Lease a browser (waits for a free slot). Returns None if Chrome cannot start."""
+        self._slots.acquire()
+        with self._lock:
+            driver = self._idle.pop() if self._idle else None
+        if driver is None:
+            driver = initialize_browser()
+            if driver is None:
+                self._slots.release()
+                return None
+            with self._lock:
+                self._uses[id(driver)] = 0
+        return driver
+
+    def release(self, driver, healthy=True):
+        """Give a leased browser back; unhealthy or worn-out browsers are quit."""
+        try:
+            with self._lock:
+                uses = self._uses.get(id(driver), 0) + 1
+                self._uses[id(driver)] = uses
+            if healthy and uses < self.max_uses and self._reset(driver):
+                with self._lock:
+                    self._idle.append(driver)
+            else:
+                self._discard(driver)
+        finally:
+            self._slots.release()
+
+    def _reset(self, driver):
+        """
+        Close extra tabs and wipe what the previous lease left behind.
+        delete_all_cookies() only reaches the domain of the current page, so
+        cookies of every domain are cleared through the DevTools protocol,
+        along with the storage (localStorage, IndexedDB, cache...) of the
+        origins the tabs were on.
+        """
+        try:
+            handles = driver.window_handles
+            origins = set()
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                origins.add(self._origin(driver.current_url))
+                driver.close()
+            driver.switch_to.window(handles[0])
+            origins.add(self._origin(driver.current_url))
+            driver.get("about:blank")
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            for origin in origins - {None}:
+                driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            return True
+        except Exception as e:
+            logger.warning(f"Could not reset browser, recycling it: {e}")
+            return False
+
+    @staticmethod
+    def _origin(url):
+        parsed = urlparse(url or "")
+        if parsed.scheme not in ("http", "https"):
+            return None
+        return f"{parsed.scheme}://{parsed.netloc}"
+
+    def _discard(self, driver):
+        with self._lock:
+            self._uses.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def shutdown(self):
+        with self._lock:
+            drivers = self._idle[:]
+            self._idle.clear()
+        for driver in drivers:
+            self._discard(driver)
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.shutdown)
+
+
 ###############################################################################
 #     SCREENSHOT CAPTURE WITH SELENIUM (OPTIONAL - IF AVAILABLE)             #
 ###############################################################################
+def locate_elements(driver, highlight_nodes):
+    """Fetch the element handles of extracted nodes in one script call (for highlighting)."""
+    if not highlight_nodes:
+        return []
+    try:
+        elements = driver.execute_script(
+            "return arguments[0].map(function (css) { return document.querySelector(css); });",
+            [node["css"] for node in highlight_nodes]
+        )
+    except WebDriverException as e:
+        logger.warning(f"Could not locate elements to highlight: {e}")
+        return []
+    return [element for element in elements or [] if element is not None]
+
+
+HIGHLIGHT_SCRIPT = """
+var elements = arguments[0];
+var styles = [];
+var box = null;
+elements[0].scrollIntoView({block: 'center'});
+elements.forEach(function (el) {
+    styles.push(el.getAttribute('style'));
+    el.setAttribute('style', (el.getAttribute('style') || '') + 'background-color: yellow; border: 2px solid red; padding: 3px;');
+    var r = el.getBoundingClientRect();
+    if (r.width === 0 && r.height === 0) { return; }
+    if (!box) { box = {left: r.left, top: r.top, right: r.right, bottom: r.bottom}; return; }
+    box.left = Math.min(box.left, r.left);
+    box.top = Math.min(box.top, r.top);
+    box.right = Math.max(box.right, r.right);
+    box.bottom = Math.max(box.bottom, r.bottom);
+});
+return {styles: styles, box: box, ratio: window.devicePixelRatio || 1};
+"""
+
+RESTORE_STYLE_SCRIPT = """
+var elements = arguments[0];
+var styles = arguments[1];
+elements.forEach(function (el, i) {
+    if (styles[i] === null) { el.removeAttribute('style'); } else { el.setAttribute('style', styles[i]); }
+});
+"""
+
+
+def compress_screenshot(png_data, box=None, ratio=1):
+    """
+    Crop a PNG screenshot to box (CSS pixels, plus padding) and re-encode it as
+    SCREENSHOT_FORMAT, lowering quality then size until it fits SCREENSHOT_MAX_BYTES.
+    """
+    image = Image.open(io.BytesIO(png_data)).convert("RGB")
+    if box:
+        left = max(0, int((box["left"] - SCREENSHOT_PADDING) * ratio))
+        top = max(0, int((box["top"] - SCREENSHOT_PADDING) * ratio))
+        right = min(image.width, int((box["right"] + SCREENSHOT_PADDING) * ratio))
+        bottom = min(image.height, int((box["bottom"] + SCREENSHOT_PADDING) * ratio))
+        if right > left and bottom > top:
+            image = image.crop((left, top, right, bottom))
+    if image.width > SCREENSHOT_MAX_WIDTH:
+        image.thumbnail((SCREENSHOT_MAX_WIDTH, image.height))
+
+    data = b""
+    for _ in range(4):
+        for quality in (80, 65, 50):
+            buffer = io.BytesIO()
+            image.save(buffer, format=SCREENSHOT_FORMAT, quality=quality)
+            data = buffer.getvalue()
+            if len(data) <= SCREENSHOT_MAX_BYTES:
+                return data
+        image.thumbnail((int(image.width * 0.7), int(image.height * 0.7)))
+    return data
+
+
 def take_screenshot(driver, highlight_elements=None):
-    """Take a screenshot with Selenium and highlight specific elements if needed."""
+    """
+    Take a screenshot with Selenium, highlighting specific elements and cropping
+    the image around them. Returns the compressed image bytes, or None.
+    """
     try:
         if not driver:
             return None
 
         # Highlight availability elements or price elements before taking screenshot
+        highlight = None
         if highlight_elements:
-            original_styles = {}
-            for element in highlight_elements:
-                try:
-                    original_style = driver.execute_script("return arguments[0].getAttribute('style')", element)
-                    original_styles[element] = original_style or ""
-                    driver.execute_script(
-                        "arguments[0].setAttribute('style', arguments[1] + 'background-color: yellow; border: 2px solid red; padding: 3px;')",
-                        element, original_styles[element]
-                    )
-                except Exception as e:
-                    logger.warning(f"Could not highlight element: {e}")
+            try:
+                highlight = driver.execute_script(HIGHLIGHT_SCRIPT, highlight_elements)
+            except Exception as e:
+                logger.warning(f"Could not highlight elements: {e}")
 
         # Take screenshot
-        screenshot = driver.get_screenshot_as_base64()
+        png_data = driver.get_screenshot_as_png()
 
         # Restore original styles
-        if highlight_elements:
-            for element, original_style in original_styles.items():
-                try:
-                    driver.execute_script(
-                        "arguments[0].setAttribute('style', arguments[1])",
-                        element, original_style
-                    )
-                except Exception:
-                    pass
-
-        return screenshot
+        if highlight:
+            try:
+                driver.execute_script(RESTORE_STYLE_SCRIPT, highlight_elements, highlight["styles"])
+            except Exception:
+                pass
+
+        if highlight:
+            return compress_screenshot(png_data, highlight.get("box"), highlight.get("ratio", 1))
+        return compress_screenshot(png_data)
     except Exception as e:
         logger.error(f"Error taking screenshot: {e}")
         return None
 
 
+def screenshot_bytes(screenshot):
+    """Raw image bytes of a screenshot entry (older entries hold base64 text)."""
+    data = screenshot["data"]
+    if isinstance(data, str):
+        return base64.b64decode(data)
+    return data
+
+
 ###############################################################################
 #                        STANDARD CHECK (WITHOUT SELENIUM)                    #
 ###############################################################################
-def check_site_standard(site_info, product_info):
+async def check_site_standard_async(site_info, product_info):
     try:
-        session = create_session(site_info)
         headers = {
             "User-Agent": random.choice(USER_AGENTS),
             "Accept-Language": "fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7",
@@ -944,103 +1204,16 @@ def check_site_standard(site_info, product_info):
         }
 
         logger.info(f"Accessing {product_info['url']}")
-        response = session.get(product_info['url'], headers=headers, cookies=cookies, timeout=30)
-        random_wait(1, 2)
+        status_code, in_stock, product_data = await fetch_and_extract_async(
+            site_info, product_info, headers, cookies, scan_page_text=True
+        )
 
-        if response.status_code != 200:
-            msg = f"HTTP Error {response.status_code} on {site_info['name']} for {product_info['name']}"
+        if status_code != 200:
+            msg = f"HTTP Error {status_code} on {site_info['name']} for {product_info['name']}"
             logger.warning(msg)
             return False, msg, [], {}
 
-        # Parse HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
-        selectors = site_info['selectors']
-        product_data = {
-            "title": None,
-            "price": None,
-            "availability": None,
-            "image_url": None,
-            "buy_url": product_info['url']
-        }
-
-        # Extract product title
-        for title_selector in selectors['title']:
-            title_element = soup.select_one(title_selector)
-            if title_element:
-                product_data["title"] = title_element.get_text().strip()
-                break
-
-        # Extract product price
-        for price_selector in selectors['price']:
-            price_element = soup.select_one(price_selector)
-            if price_element:
-                price_text = price_element.get_text().strip()
-                # Remove currency symbols and convert to float
-                price_text = re.sub(r'[^\d,.]', '', price_text).replace(',', '.')
-                try:
-                    price_match = re.search(r'\d+\.\d+', price_text)
-                    if price_match:
-                        product_data["price"] = float(price_match.group(0))
-                except (ValueError, AttributeError):
-                    pass
-                break
-
-        # Extract product image
-        for img_selector in selectors['image']:
-            img_element = soup.select_one(img_selector)
-            if img_element and img_element.has_attr('src'):
-                img_url = img_element['src']
-                # Make absolute URL if it's relative
-                if img_url.startswith('/'):
-                    img_url = site_info['base_url'] + img_url
-                product_data["image_url"] = img_url
-                break
-
-        # Check availability - combine multiple approaches
-        in_stock = False
-        availability_text = ""
-        
-        # 1. Check via selectors
-        for avail_selector in selectors['availability']:
-            avail_element = soup.select_one(avail_selector)
-            if avail_element:
-                availability_text = avail_element.get_text().strip()
-                # Check positive indicators
-                for in_stock_phrase in selectors['in_stock_text']:
-                    if in_stock_phrase.lower() in availability_text.lower():
-                        in_stock = True
-                        break
-                # Check negative indicators
-                for out_of_stock_phrase in selectors['out_of_stock_text']:
-                    if out_of_stock_phrase.lower() in availability_text.lower():
-                        in_stock = False
-                        break
-                break
-        
-        # 2. Check for add to cart button
-        if not in_stock:
-            for cart_selector in selectors['add_to_cart_button']:
-                cart_button = soup.select_one(cart_selector)
-                if cart_button and not cart_button.has_attr('disabled'):
-                    in_stock = True
-                    availability_text = "Add to cart button is enabled"
-                    break
-        
-        # 3. Check content for availability indicators
-        if not availability_text:
-            content = response.text.lower()
-            for in_stock_phrase in selectors['in_stock_text']:
-                if in_stock_phrase.lower() in content:
-                    in_stock = True
-                    availability_text = in_stock_phrase
-                    break
-            if not in_stock:
-                for out_of_stock_phrase in selectors['out_of_stock_text']:
-                    if out_of_stock_phrase.lower() in content:
-                        availability_text = out_of_stock_phrase
-                        break
-
-        product_data["availability"] = availability_text
+        availability_text = product_data["availability"]
 
         # Generate success message if in stock
         if in_stock:
@@ -1053,7 +1226,7 @@ def check_site_standard(site_info, product_info):
             logger.info(msg)
             return False, msg, [], product_data
 
-    except requests.exceptions.RequestException as e:
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         err_msg = f"Connection error to {site_info['name']} for {product_info['name']}: {e}"
         logger.error(err_msg)
         return False, err_msg, [], {}
@@ -1063,6 +1236,18 @@ def check_site_standard(site_info, product_info):
         return False, err_msg, [], {}
 
 
+# Standard results fetched ahead by check_products_concurrently(), keyed by product URL
+_prefetched_results = {}
+
+
+def check_site_standard(site_info, product_info):
+    """Standard check from a worker thread: the request itself runs on fetch_engine."""
+    result = _prefetched_results.pop(product_info['url'], None)
+    if result is not None:
+        return result
+    return fetch_engine.run(check_site_standard_async(site_info, product_info))
+
+
 ###############################################################################
 #           CLOUDSCRAPER CHECK (SITES WITH CLOUDFLARE)                        #
 ###############################################################################
@@ -1070,18 +1255,14 @@ def check_site_with_cloudscraper(site_info, product_info):
     logger.info(f"Checking {site_info['name']} for {product_info['name']} with CloudScraper")
     site_name = site_info['name']
     product_name = product_info['name']
-    circuit_breaker_key = f"{site_name}_{product_name}"
-    
-    if circuit_breaker_key not in circuit_breakers:
-        circuit_breakers[circuit_breaker_key] = CircuitBreaker(circuit_breaker_key)
-    if not circuit_breakers[circuit_breaker_key].allow_request():
+    breaker = circuit_breakers.get(
+        product_info['url'], f"{site_name}_{product_name}", on_open=lambda: scraper_sessions.invalidate(site_info)
+    )
+    if not breaker.allow_request():
         return False, f"Circuit breaker open for {site_name} - {product_name}", [], {}
 
     try:
-        scraper = cloudscraper.create_scraper(
-            browser={"browser": "chrome", "platform": "windows", "desktop": True},
-            delay=5
-        )
+        scraper = scraper_sessions.get(site_info)
         headers = {
             "User-Agent": random.choice(USER_AGENTS),
             "Accept-Language": "fr-FR,fr;q=0.9,en-US;q=0.8,en;q=0.7",
@@ -1092,91 +1273,19 @@ def check_site_with_cloudscraper(site_info, product_info):
             "session": f"session_{random.randint(10000, 99999)}",
             "language": "fr"
         }
-        proxies = proxy_manager.get_proxy_dict()
-        response = scraper.get(product_info['url'], headers=headers, cookies=cookies, proxies=proxies, timeout=30)
+        status_code, in_stock, product_data = fetch_and_extract(scraper, site_info, product_info, headers, cookies)
         random_wait(1, 2)
 
-        if response.status_code != 200:
-            circuit_breakers[circuit_breaker_key].record_failure()
-            return False, f"HTTP Error {response.status_code} on {site_name} for {product_name}", [], {}
-
-        # Parse the HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        selectors = site_info['selectors']
-        product_data = {
-            "title": None,
-            "price": None,
-            "availability": None,
-            "image_url": None,
-            "buy_url": product_info['url']
-        }
+        if status_code != 200:
+            if status_code in CHALLENGE_STATUS_CODES:
+                # Challenge cookies rejected: solve a new challenge on the next check
+                scraper_sessions.invalidate(site_info)
+            breaker.record_failure()
+            return False, f"HTTP Error {status_code} on {site_name} for {product_name}", [], {}
 
-        # Extract product title
-        for title_selector in selectors['title']:
-            title_element = soup.select_one(title_selector)
-            if title_element:
-                product_data["title"] = title_element.get_text().strip()
-                break
-
-        # Extract product price
-        for price_selector in selectors['price']:
-            price_element = soup.select_one(price_selector)
-            if price_element:
-                price_text = price_element.get_text().strip()
-                # Remove currency symbols and convert to float
-                price_text = re.sub(r'[^\d,.]', '', price_text).replace(',', '.')
-                try:
-                    price_match = re.search(r'\d+\.\d+', price_text)
-                    if price_match:
-                        product_data["price"] = float(price_match.group(0))
-                except (ValueError, AttributeError):
-                    pass
-                break
-
-        # Extract product image
-        for img_selector in selectors['image']:
-            img_element = soup.select_one(img_selector)
-            if img_element and img_element.has_attr('src'):
-                img_url = img_element['src']
-                # Make absolute URL if it's relative
-                if img_url.startswith('/'):
-                    img_url = site_info['base_url'] + img_url
-                product_data["image_url"] = img_url
-                break
-
-        # Check availability
-        in_stock = False
-        availability_text = ""
-        
-        # 1. Check via selectors
-        for avail_selector in selectors['availability']:
-            avail_element = soup.select_one(avail_selector)
-            if avail_element:
-                availability_text = avail_element.get_text().strip()
-                # Check positive indicators
-                for in_stock_phrase in selectors['in_stock_text']:
-                    if in_stock_phrase.lower() in availability_text.lower():
-                        in_stock = True
-                        break
-                # Check negative indicators
-                for out_of_stock_phrase in selectors['out_of_stock_text']:
-                    if out_of_stock_phrase.lower() in availability_text.lower():
-                        in_stock = False
-                        break
-                break
-        
-        # 2. Check for add to cart button
-        if not in_stock:
-            for cart_selector in selectors['add_to_cart_button']:
-                cart_button = soup.select_one(cart_selector)
-                if cart_button and not cart_button.has_attr('disabled'):
-                    in_stock = True
-                    availability_text = "Add to cart button is enabled"
-                    break
-
-        product_data["availability"] = availability_text
-
-        circuit_breakers[circuit_breaker_key].record_success()
+        availability_text = product_data["availability"]
+
+        breaker.record_success()
         
         # Generate message and screenshots
         if in_stock:
@@ -1188,7 +1297,8 @@ def check_site_with_cloudscraper(site_info, product_info):
             return False, msg, [], product_data
 
     except Exception as e:
-        circuit_breakers[circuit_breaker_key].record_failure()
+        scraper_sessions.invalidate(site_info)
+        breaker.record_failure()
         return False, f"CloudScraper Error for {site_name} - {product_name}: {e}", [], {}
 
 
@@ -1199,132 +1309,40 @@ def check_site_with_selenium(site_info, product_info):
     logger.info(f"Checking {site_info['name']} for {product_info['name']} with Selenium")
     site_name = site_info['name']
     product_name = product_info['name']
-    circuit_breaker_key = f"{site_name}_{product_name}"
-    
-    if circuit_breaker_key not in circuit_breakers:
-        circuit_breakers[circuit_breaker_key] = CircuitBreaker(circuit_breaker_key)
-    if not circuit_breakers[circuit_breaker_key].allow_request():
+    breaker = circuit_breakers.get(product_info['url'], f"{site_name}_{product_name}")
+    if not breaker.allow_request():
         return False, f"Circuit breaker open for {site_name} - {product_name}", [], {}
 
     driver = None
+    healthy = False
     try:
-        driver = initialize_browser()
+        driver = browser_pool.acquire()
         if not driver:
-            circuit_breakers[circuit_breaker_key].record_failure()
+            # Local browser problem, not a failure of the site
+            breaker.release()
             return False, f"Could not initialize browser for {site_name} - {product_name}", [], {}
 
         driver.get(product_info['url'])
         WebDriverWait(driver, 20).until(EC.presence_of_element_located((By.TAG_NAME, "body")))
         random_wait(1, 2)
 
-        selectors = site_info['selectors']
-        product_data = {
-            "title": None,
-            "price": None,
-            "availability": None,
-            "image_url": None,
-            "buy_url": product_info['url']
-        }
-        
-        highlight_elements = []
-
-        # Extract product title
-        for title_selector in selectors['title']:
-            try:
-                title_elements = driver.find_elements(By.CSS_SELECTOR, title_selector)
-                if title_elements:
-                    product_data["title"] = title_elements[0].text.strip()
-                    break
-            except Exception:
-                continue
-
-        # Extract product price
-        for price_selector in selectors['price']:
-            try:
-                price_elements = driver.find_elements(By.CSS_SELECTOR, price_selector)
-                if price_elements:
-                    price_text = price_elements[0].text.strip()
-                    # Remove currency symbols and convert to float
-                    price_text = re.sub(r'[^\d,.]', '', price_text).replace(',', '.')
-                    try:
-                        price_match = re.search(r'\d+\.\d+', price_text)
-                        if price_match:
-                            product_data["price"] = float(price_match.group(0))
-                    except (ValueError, AttributeError):
-                        pass
-                    highlight_elements.append(price_elements[0])
-                    break
-            except Exception:
-                continue
+        extractor = get_extractor(site_info)
+        in_stock, product_data, highlight_nodes = extractor.extract_driver(driver, product_info['url'])
+        availability_text = product_data["availability"]
 
-        # Extract product image
-        for img_selector in selectors['image']:
-            try:
-                img_elements = driver.find_elements(By.CSS_SELECTOR, img_selector)
-                if img_elements and img_elements[0].get_attribute('src'):
-                    img_url = img_elements[0].get_attribute('src')
-                    # Make absolute URL if it's relative
-                    if img_url.startswith('/'):
-                        img_url = site_info['base_url'] + img_url
-                    product_data["image_url"] = img_url
-                    break
-            except Exception:
-                continue
-
-        # Check availability
-        in_stock = False
-        availability_text = ""
-        availability_element = None
-        
-        # 1. Check via selectors
-        for avail_selector in selectors['availability']:
-            try:
-                avail_elements = driver.find_elements(By.CSS_SELECTOR, avail_selector)
-                if avail_elements:
-                    availability_element = avail_elements[0]
-                    availability_text = availability_element.text.strip()
-                    highlight_elements.append(availability_element)
-                    
-                    # Check positive indicators
-                    for in_stock_phrase in selectors['in_stock_text']:
-                        if in_stock_phrase.lower() in availability_text.lower():
-                            in_stock = True
-                            break
-                    
-                    # Check negative indicators
-                    for out_of_stock_phrase in selectors['out_of_stock_text']:
-                        if out_of_stock_phrase.lower() in availability_text.lower():
-                            in_stock = False
-                            break
-                    break
-            except Exception:
-                continue
-        
-        # 2. Check for add to cart button
-        cart_button = None
-        if not in_stock:
-            for cart_selector in selectors['add_to_cart_button']:
-                try:
-                    cart_buttons = driver.find_elements(By.CSS_SELECTOR, cart_selector)
-                    if cart_buttons and not cart_buttons[0].get_attribute('disabled'):
-                        cart_button = cart_buttons[0]
-                        in_stock = True
-                        availability_text = "Add to cart button is enabled"
-                        highlight_elements.append(cart_button)
-                        break
-                except Exception:
-                    continue
-
-        product_data["availability"] = availability_text
-
-        # Take screenshot with highlighted elements
+        # Screenshot only when this result turns into a restock alert
         screenshots = []
-        screenshot_data = take_screenshot(driver, highlight_elements)
-        if screenshot_data:
-            caption = f"{product_name} on {site_name} - {'IN STOCK' if in_stock else 'Not available'}"
-            screenshots.append({"data": screenshot_data, "caption": caption})
-
-        circuit_breakers[circuit_breaker_key].record_success()
+        if in_stock and not change_tracker.is_in_stock(product_info['url']):
+            screenshot_data = take_screenshot(driver, locate_elements(driver, highlight_nodes))
+            if screenshot_data:
+                screenshots.append({
+                    "data": screenshot_data,
+                    "mime_type": f"image/{SCREENSHOT_FORMAT.lower()}",
+                    "caption": f"{product_name} on {site_name} - IN STOCK"
+                })
+
+        breaker.record_success()
+        healthy = True
         
         if in_stock:
             price_info = f" at {product_data['price']}€" if product_data["price"] else ""
@@ -1335,112 +1353,271 @@ def check_site_with_selenium(site_info, product_info):
             return False, msg, screenshots, product_data
 
     except TimeoutException:
-        circuit_breakers[circuit_breaker_key].record_failure()
+        breaker.record_failure()
         return False, f"Timeout on {site_name} for {product_name}", [], {}
     except WebDriverException as e:
-        circuit_breakers[circuit_breaker_key].record_failure()
+        breaker.record_failure()
         return False, f"WebDriver Error for {site_name} - {product_name}: {e}", [], {}
     except Exception as e:
-        circuit_breakers[circuit_breaker_key].record_failure()
+        breaker.record_failure()
         return False, f"Selenium Error for {site_name} - {product_name}: {e}", [], {}
     finally:
         if driver:
-            driver.quit()
+            browser_pool.release(driver, healthy)
 
 
 ###############################################################################
-#                   GLOBAL SITE CHECK FUNCTION                                #
+#                      MEMOIZED FETCH TIER SELECTION                          #
 ###############################################################################
-def check_site_product(site_info, product_info):
-    # Detect anti-bot protection + priority usage
+class FetchTierSelector:
+    """
+    Remembers, per site, the fetch tier that last produced a valid extraction.
+    Checks start on that tier; each TIER_DECAY period without a new
+    escalation moves the start back one tier towards the cheapest one.
+    """
+    def __init__(self, decay=TIER_DECAY):
+        self.decay = decay
+        self._tiers = {}
+        self._lock = threading.Lock()
+
+    def start_tier(self, site_name):
+        with self._lock:
+            entry = self._tiers.get(site_name)
+            if entry is None:
+                return 0
+            tier, since = entry
+            return max(0, tier - int((time.monotonic() - since) // self.decay))
+
+    def record(self, site_name, start, tier):
+        with self._lock:
+            entry = self._tiers.get(site_name)
+            # Restart the decay on escalation or when the site moves to another tier
+            if tier > start or entry is None or entry[0] != tier:
+                self._tiers[site_name] = (tier, time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._tiers.clear()
+
+
+fetch_tiers = FetchTierSelector()
+
+
+def get_fetch_tiers(site_info):
+    """Check functions available for a site, from the cheapest to the most expensive."""
     if site_info.get('anti_bot_protection'):
-        # Try cloudscraper first, then selenium if it fails
-        available, msg, screenshots, product_data = check_site_with_cloudscraper(site_info, product_info)
-        if "Error" in msg or not available:
-            available2, msg2, screenshots2, product_data2 = check_site_with_selenium(site_info, product_info)
-            if screenshots2:
-                screenshots.extend(screenshots2)
-            if product_data2 and product_data2.get("title"):
-                product_data = product_data2
-            return available2, msg2, screenshots, product_data
-        else:
-            return available, msg, screenshots, product_data
-    else:
-        # Otherwise use standard version or selenium based on site type
-        if site_info.get('type') in ['official', 'official_reseller'] and site_info.get('priority', 999) <= 2:
-            # E.g., try standard first, then selenium
-            available, msg, screenshots, product_data = check_site_standard(site_info, product_info)
-            if not available and "Error" in msg:
-                # As a last resort
-                available2, msg2, screenshots2, product_data2 = check_site_with_selenium(site_info, product_info)
-                if screenshots2:
-                    screenshots.extend(screenshots2)
-                if product_data2 and product_data2.get("title"):
-                    product_data = product_data2
-                return available2, msg2, screenshots, product_data
-            return available, msg, screenshots, product_data
-        else:
-            # Simple
-            return check_site_standard(site_info, product_info)
+        return [check_site_with_cloudscraper, check_site_with_selenium]
+    if site_info.get('type') in ['official', 'official_reseller'] and site_info.get('priority', 999) <= 2:
+        return [check_site_standard, check_site_with_selenium]
+    return [check_site_standard]
 
 
 ###############################################################################
-#                        MAIN PROGRAM FUNCTION                                #
+#              SINGLE-FLIGHT CHECKS AND SHORT-LIVED RESULT CACHE              #
 ###############################################################################
-def main_program():
-    logger.info(f"Bot started - Monitoring Pokemon card collections")
-    counter = 0
-    while True:
+class CheckCoalescer:
+    """
+    Concurrent checks of the same product URL (scheduler, manual refreshes
+    from several dashboard users) share one in-flight check instead of each
+    fetching the page or starting a browser. A finished result is served
+    again for ttl seconds.
+    """
+    def __init__(self, ttl=RESULT_CACHE_TTL):
+        self.ttl = ttl
+        self._in_flight = {}
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def run(self, key, func):
+        with self._lock:
+            cached = self._results.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            logger.info(f"Waiting for the check already in progress: {key}")
+            return future.result()
+
         try:
-            counter += 1
-            now = datetime.now()
-            logger.info(f"Check #{counter} - {now}")
-            check_interval = random.randint(CHECK_INTERVAL_MIN, CHECK_INTERVAL_MAX)
-
-            alerts = []
-            for site in SITES:
-                logger.info(f"Checking site: {site['name']}")
-                for product in site['products']:
-                    available, message, screenshots, product_data = check_site_product(site, product)
-                    
-                    if available:
-                        alerts.append({
-                            "source": site["name"],
-                            "product_name": product["name"],
-                            "collection": product["collection"],
-                            "message": message,
-                            "url": product["url"],
-                            "screenshots": screenshots,
-                            "product_data": product_data
-                        })
-                        logger.info(f"DETECTION - {site['name']} for {product['name']}: {message}")
-                    else:
-                        logger.info(f"{site['name']} for {product['name']}: {message}")
+            result = func()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            with self._lock:
+                self._results[key] = (time.monotonic(), result)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
 
-                    time.sleep(1)  # Small pause between products
+    def clear(self):
+        with self._lock:
+            self._results.clear()
 
-                time.sleep(2)  # Small pause between sites
 
-            if alerts:
-                subject = f"ALERT - Pokemon cards in stock!"
-                text = f"Stock availability detected for Pokemon collections.\n\n"
-                for idx, al in enumerate(alerts, 1):
-                    text += f"{idx}. {al['source']} -> {al['product_name']}\n"
-                    if al['product_data'].get('price'):
-                        text += f"   Price: {al['product_data']['price']}€\n"
-                    text += f"   Url: {al['url']}\n\n"
-                send_notifications(subject, text, alerts)
+check_coalescer = CheckCoalescer()
+
+
+###############################################################################
+#                   GLOBAL SITE CHECK FUNCTION                                #
+###############################################################################
+def check_site_product(site_info, product_info):
+    return check_coalescer.run(
+        product_info['url'], lambda: _check_and_record(site_info, product_info)
+    )
+
+
+def _check_and_record(site_info, product_info):
+    started = time.monotonic()
+    result, tier = _check_site_product(site_info, product_info)
+    check_history.record(site_info, product_info, result, latency=time.monotonic() - started, tier=tier)
+    # Downstream work (alerts, persistence) only runs when something changed
+    for event in change_tracker.diff(site_info, product_info, result):
+        logger.info(f"CHANGE {event.kind} - {site_info['name']} for {product_info['name']}")
+        for listener in list(change_listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Error handling {event.kind} of {product_info['name']}: {e}")
+    return result
+
+
+def alert_from_event(event):
+    """Alert dict (as used by send_notifications) for a ChangeEvent."""
+    return {
+        "source": event.site["name"],
+        "product_name": event.product["name"],
+        "collection": event.product["collection"],
+        "message": event.message,
+        "url": event.product["url"],
+        "screenshots": event.screenshots,
+        "product_data": event.product_data
+    }
+
+
+def describe_event(event):
+    """One line summary of an alert event for notification texts."""
+    if event.kind == PRICE_CHANGE:
+        return f"Price {event.previous['price']}€ -> {event.current['price']}€: {event.message}"
+    return event.message
 
-            next_check = now + timedelta(seconds=check_interval)
-            logger.info(f"Next check: {next_check.strftime('%H:%M:%S')} (in {check_interval} s)")
-            time.sleep(check_interval)
 
-        except KeyboardInterrupt:
-            logger.info("Bot stopped manually.")
+def _start_tier(site_info, tiers):
+    return min(fetch_tiers.start_tier(site_info['name']), len(tiers) - 1)
+
+
+def _check_site_product(site_info, product_info):
+    """Check result and name of the last fetch tier used (standard, cloudscraper, selenium)."""
+    tiers = get_fetch_tiers(site_info)
+    site_name = site_info['name']
+    start = _start_tier(site_info, tiers)
+
+    screenshots = []
+    product_data = {}
+    for tier in range(start, len(tiers)):
+        available, msg, tier_screenshots, tier_product_data = tiers[tier](site_info, product_info)
+        screenshots.extend(tier_screenshots)
+        if tier_product_data and (tier_product_data.get("title") or not product_data):
+            product_data = tier_product_data
+        # A recognised page is final, including an "out of stock" verdict
+        if is_valid_extraction(tier_product_data):
+            fetch_tiers.record(site_name, start, tier)
             break
-        except Exception as e:
-            logger.error(f"Unexpected error: {e}")
-            time.sleep(RETRY_INTERVAL)
+        if tier + 1 < len(tiers):
+            logger.info(f"{tiers[tier].__name__} gave no usable result for {site_name}, trying next tier")
+    return (available, msg, screenshots, product_data), tiers[tier].__name__.rsplit("_", 1)[-1]
+
+
+###############################################################################
+#              CONCURRENT CHECK ENGINE (ASYNCIO + PER-HOST LIMIT)             #
+###############################################################################
+def get_host(url):
+    """Return the lowercase host of a URL, used to group checks per retailer."""
+    return urlparse(url).netloc.lower()
+
+
+def check_products_concurrently(checks):
+    """
+    Check a batch of (site, product) pairs at the same time.
+    The standard HTTP checks of the batch are awaited together on
+    fetch_engine, at most HOST_CONCURRENCY at a time per host, so the batch
+    takes as long as its slowest host instead of the sum of every request.
+    Each result then goes through check_site_product() as usual (fetch tier
+    escalation, history, change events) without being fetched again.
+    Returns the (available, msg, screenshots, product_data) results in order.
+    """
+    standard = []
+    for site, product in checks:
+        tiers = get_fetch_tiers(site)
+        if tiers[_start_tier(site, tiers)] is check_site_standard:
+            standard.append((site, product))
+
+    results = fetch_engine.gather([check_site_standard_async(site, product) for site, product in standard])
+    for (site, product), result in zip(standard, results):
+        if isinstance(result, BaseException):
+            # Fetched again by check_site_product()
+            logger.error(f"Error checking {site['name']} for {product['name']}: {result}")
+        else:
+            _prefetched_results[product['url']] = result
+    try:
+        return [check_site_product(site, product) for site, product in checks]
+    finally:
+        for site, product in standard:
+            _prefetched_results.pop(product['url'], None)
+
+
+###############################################################################
+#                        MAIN PROGRAM FUNCTION                                #
+###############################################################################
+def main_program():
+    logger.info(f"Bot started - Monitoring Pokemon card collections")
+    ensure_chromedriver()
+
+    def handle_result(site, product, result):
+        available, message, screenshots, product_data = result
+        if available:
+            logger.info(f"DETECTION - {site['name']} for {product['name']}: {message}")
+        else:
+            logger.info(f"{site['name']} for {product['name']}: {message}")
+
+    def handle_change(event):
+        # Only restocks and price changes of products in stock are notified
+        if not is_alert_event(event):
+            return
+        alert = alert_from_event(event)
+        subject = f"ALERT - Pokemon cards in stock!" if event.kind == RESTOCK else f"ALERT - Pokemon price change!"
+        text = f"Stock availability detected for Pokemon collections.\n\n"
+        text += f"{alert['source']} -> {alert['product_name']}\n"
+        text += f"   {describe_event(event)}\n"
+        if event.current['price']:
+            text += f"   Price: {event.current['price']}€\n"
+        text += f"   Url: {alert['url']}\n\n"
+        send_notifications(subject, text, [alert])
+
+    change_listeners.append(handle_change)
+
+    # Each product is checked when it is due instead of in fixed full passes
+    scheduler = CheckScheduler(
+        SITES,
+        check_func=check_site_product,
+        on_result=handle_result,
+        base_interval=(CHECK_INTERVAL_MIN + CHECK_INTERVAL_MAX) // 2,
+        workers=CHECK_WORKERS,
+        host_limit=HOST_CONCURRENCY
+    )
+    catalog_listeners.append(lambda new_catalog: scheduler.sync(new_catalog.sites))
+    watcher = start_catalog_watch()
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.stop()
+        watcher.stop()
+        logger.info("Bot stopped manually.")
 
 
 ###############################################################################
@@ -1494,6 +1671,9 @@ if __name__ == "__main__":
         # Basic checks
         if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
             logger.warning("Incomplete or missing Telegram configuration.")
+        # The web app normally applies the schema migrations (circuit breaker states, check history)
+        from auth import init_db
+        init_db()
         main_program()
     except KeyboardInterrupt:
         logger.info("Manual stop.")
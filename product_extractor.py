@@ -0,0 +1,538 @@
+"""
+product_extractor.py - Compiled product data extraction shared by every check path
+"""
+
+import re
+import json
+import codecs
+import logging
+from html import unescape
+from lxml import html as lxml_html
+from lxml import etree
+from lxml.cssselect import CSSSelector
+from cssselect import SelectorError
+
+logger = logging.getLogger("PokemonStockBot")
+
+# Selector lists of a site's "selectors" block that point at DOM elements
+SELECTOR_GROUPS = ("title", "price", "image", "availability", "add_to_cart_button")
+
+_UTF8_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+
+
+def parse_price(text):
+    """Convert a displayed price ("49,99 €") to a float, or None."""
+    price_text = re.sub(r'[^\d,.]', '', text or "").replace(',', '.')
+    price_match = re.search(r'\d+\.\d+', price_text)
+    if price_match:
+        try:
+            return float(price_match.group(0))
+        except ValueError:
+            return None
+    return None
+
+
+def is_valid_extraction(product_data):
+    """True when the page was fetched and recognised, whatever the stock verdict."""
+    return bool(product_data) and any(
+        product_data.get(field) for field in ("title", "price", "availability")
+    )
+
+
+def parse_html(markup):
+    """Build an lxml document from an HTML string or UTF-8 bytes."""
+    if not markup:
+        raise ValueError("Empty HTML document")
+    if isinstance(markup, bytes):
+        return lxml_html.document_fromstring(markup, parser=_UTF8_PARSER)
+    try:
+        return lxml_html.document_fromstring(markup)
+    except ValueError:
+        # Unicode strings with an XML encoding declaration must be parsed as bytes
+        return lxml_html.document_fromstring(markup.encode("utf-8"), parser=_UTF8_PARSER)
+
+
+class CompiledSelector:
+    """A CSS selector translated once to XPath, usable on lxml trees and by Selenium."""
+    def __init__(self, css):
+        self.css = css
+        self.matcher = CSSSelector(css, translator="html")
+
+
+def compile_selectors(css_list):
+    compiled = []
+    for css in css_list or []:
+        try:
+            compiled.append(CompiledSelector(css))
+        except SelectorError as e:
+            logger.warning(f"Invalid CSS selector ignored: {css} ({e})")
+    return compiled
+
+
+class PhraseMatcher:
+    """
+    In-stock / out-of-stock phrases of a site, lowercased once.
+    Matches respect word boundaries ("disponible" is not found inside
+    "indisponible") and an out-of-stock phrase always wins over an in-stock one.
+    Each phrase is located with str.find, which scans in C: for the handful of
+    phrases a site has, this beats a Python-level automaton or a regex alternation.
+    """
+    def __init__(self, in_stock_text, out_of_stock_text):
+        self.negatives = [(phrase.lower(), phrase) for phrase in out_of_stock_text or []]
+        self.positives = [(phrase.lower(), phrase) for phrase in in_stock_text or []]
+
+    @staticmethod
+    def find(content, phrase):
+        """Index of the first occurrence of phrase delimited by word boundaries, or -1."""
+        check_start = phrase[:1].isalnum()
+        check_end = phrase[-1:].isalnum()
+        index = content.find(phrase)
+        while index != -1:
+            end = index + len(phrase)
+            if (not check_start or index == 0 or not content[index - 1].isalnum()) and \
+                    (not check_end or end == len(content) or not content[end].isalnum()):
+                return index
+            index = content.find(phrase, index + 1)
+        return -1
+
+    def match(self, text):
+        """Returns (in_stock, matched_phrase), or (False, None) when nothing matches."""
+        content = text.lower()
+        for lowered, phrase in self.negatives:
+            if self.find(content, lowered) != -1:
+                return False, phrase
+        for lowered, phrase in self.positives:
+            if self.find(content, lowered) != -1:
+                return True, phrase
+        return False, None
+
+
+###############################################################################
+#                 STRUCTURED DATA (SCHEMA.ORG JSON-LD) FAST PATH              #
+###############################################################################
+JSON_LD_PATTERN = re.compile(
+    r'<script[^>]*type\s*=\s*["\']?application/ld\+json["\']?[^>]*>(.*?)</script\s*>', re.I | re.S
+)
+JSON_LD_PATTERN_BYTES = re.compile(JSON_LD_PATTERN.pattern.encode("ascii"), re.I | re.S)
+
+# schema.org availability values under which the product can be ordered
+IN_STOCK_AVAILABILITY = {"instock", "limitedavailability", "onlineonly", "preorder", "presale"}
+
+
+def iter_json_ld(markup):
+    """Yield every JSON-LD object of a page, found without building a DOM."""
+    if isinstance(markup, bytes):
+        blocks = (match.decode("utf-8", errors="replace") for match in JSON_LD_PATTERN_BYTES.findall(markup))
+    else:
+        blocks = JSON_LD_PATTERN.findall(markup)
+    for block in blocks:
+        try:
+            data = json.loads(block.strip(), strict=False)
+        except ValueError:
+            continue
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+            elif isinstance(node, dict):
+                yield node
+                if "@graph" in node:
+                    stack.append(node["@graph"])
+
+
+def _has_type(node, type_name):
+    types = node.get("@type")
+    types = types if isinstance(types, list) else [types]
+    return any(isinstance(t, str) and t.rsplit("/", 1)[-1] == type_name for t in types)
+
+
+def _offers(product):
+    offers = product.get("offers")
+    offers = offers if isinstance(offers, list) else [offers]
+    for offer in offers:
+        if not isinstance(offer, dict):
+            continue
+        # AggregateOffer may nest the individual offers
+        nested = offer.get("offers")
+        if nested:
+            yield from (item for item in (nested if isinstance(nested, list) else [nested]) if isinstance(item, dict))
+        yield offer
+
+
+def _offer_price(offer):
+    for key in ("price", "lowPrice"):
+        value = offer.get(key)
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value.strip().replace(",", "."))
+            except ValueError:
+                price = parse_price(value)
+                if price is not None:
+                    return price
+    return None
+
+
+def _image_url(image):
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get("url")
+    return image if isinstance(image, str) else None
+
+
+def structured_product_data(markup):
+    """
+    Read a schema.org Product and its offers from the JSON-LD of a page.
+    Returns (in_stock, fields) or None when no offer states an availability.
+    """
+    for node in iter_json_ld(markup):
+        if not _has_type(node, "Product"):
+            continue
+        offers = [offer for offer in _offers(node) if isinstance(offer.get("availability"), str)]
+        if not offers:
+            continue
+        states = [
+            (offer["availability"].rsplit("/", 1)[-1], _offer_price(offer)) for offer in offers
+        ]
+        available = [(state, price) for state, price in states if state.lower() in IN_STOCK_AVAILABILITY]
+        state, price = (available or states)[0]
+        prices = [price for _, price in (available or states) if price is not None]
+        name = node.get("name")
+        return bool(available), {
+            "title": unescape(name).strip() if isinstance(name, str) else None,
+            "price": min(prices) if prices else price,
+            "availability": state,
+            "image_url": _image_url(node.get("image"))
+        }
+    return None
+
+
+###############################################################################
+#                 DOCUMENT ADAPTERS (LXML TREE / SELENIUM DRIVER)             #
+###############################################################################
+class LxmlDocument:
+    def __init__(self, root):
+        self.root = root
+
+    def first(self, selector):
+        matches = selector.matcher(self.root)
+        return matches[0] if matches else None
+
+    def text(self, node):
+        return node.text_content().strip()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+# Runs in the browser: first match of every selector, read in a single WebDriver round trip
+EXTRACTION_SCRIPT = """
+var selectors = arguments[0];
+var matches = {};
+for (var i = 0; i < selectors.length; i++) {
+    var css = selectors[i];
+    var el = null;
+    try { el = document.querySelector(css); } catch (e) { el = null; }
+    if (!el) { continue; }
+    matches[css] = {
+        css: css,
+        text: el.innerText !== undefined ? el.innerText : el.textContent,
+        src: el.getAttribute('src') !== null ? el.src : null,
+        disabled: (el.disabled || el.hasAttribute('disabled')) ? 'true' : null
+    };
+}
+return matches;
+"""
+
+
+class ScriptResultDocument:
+    """Adapter over the matches returned by EXTRACTION_SCRIPT (nodes are plain dicts)."""
+    def __init__(self, matches):
+        self.matches = matches or {}
+
+    def first(self, selector):
+        return self.matches.get(selector.css)
+
+    def text(self, node):
+        return (node.get("text") or "").strip()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+class StreamingDocument:
+    """
+    Incremental lxml parse of a page received chunk by chunk.
+    feed() returns True once every selector group of the extractor has the
+    fully parsed match a full parse would use, i.e. once the rest of the page
+    is not needed.
+    Selectors are re-evaluated each time the amount read grows by half, which
+    keeps the total cost linear in the page size.
+    """
+    FIRST_CHECK_BYTES = 32 * 1024
+    CHECK_GROWTH = 1.5
+
+    def __init__(self, extractor, encoding="utf-8"):
+        self.extractor = extractor
+        self.bytes_read = 0
+        self._next_check = self.FIRST_CHECK_BYTES
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        # Only the <html> start event is needed, to get hold of the tree being built
+        self._parser = etree.HTMLPullParser(events=("start",), tag="html")
+        self._parser.set_element_class_lookup(lxml_html.HtmlElementClassLookup())
+        self._parts = []
+        self._root = None
+        self._pending = [group for group in SELECTOR_GROUPS if extractor.groups[group]]
+
+    def feed(self, chunk):
+        self.bytes_read += len(chunk)
+        text = self._decoder.decode(chunk)
+        if text:
+            self._parts.append(text)
+            self._parser.feed(text)
+        for _, element in self._parser.read_events():
+            if self._root is None:
+                self._root = element
+        if self._root is not None and self.bytes_read >= self._next_check:
+            self._next_check = self.bytes_read * self.CHECK_GROWTH
+            open_chain = self._open_chain()
+            self._pending = [group for group in self._pending if not self._resolved(group, open_chain)]
+        return not self._pending
+
+    def _open_chain(self):
+        """Elements still open in the parser: the chain of last children from the root."""
+        chain = []
+        node = self._root
+        while node is not None:
+            chain.append(node)
+            node = node[-1] if len(node) else None
+        return chain
+
+    def _resolved(self, group, open_chain):
+        """
+        True once the node extract() will pick for group cannot change: the
+        selectors are walked in priority order like ProductExtractor._first,
+        and a lower one only counts when every higher one already has a
+        complete first match that extract() passes over.
+        """
+        for selector in self.extractor.groups[group]:
+            matches = selector.matcher(self._root)
+            if not matches or any(matches[0] is node for node in open_chain):
+                return False
+            if not self._skipped(group, matches[0]):
+                return True
+        return False
+
+    @staticmethod
+    def _skipped(group, node):
+        """Matches extract() moves past: images without src, disabled add-to-cart buttons."""
+        if group == 'image':
+            return not node.get('src')
+        if group == 'add_to_cart_button':
+            return node.get('disabled') is not None
+        return False
+
+    def close(self):
+        """Finish the (possibly truncated) tree. Returns (root, text read so far)."""
+        tail = self._decoder.decode(b"", final=True)
+        if tail:
+            self._parts.append(tail)
+            self._parser.feed(tail)
+        root = self._parser.close()
+        return root, "".join(self._parts)
+
+
+###############################################################################
+#                           PRODUCT EXTRACTOR                                 #
+###############################################################################
+class ProductExtractor:
+    """
+    Extracts title, price, image and availability for one site entry.
+    The selector lists are compiled once; extract() works on any document
+    adapter so the HTML and Selenium paths share the same rules.
+    """
+    def __init__(self, selectors, base_url="", structured_data=True):
+        self.base_url = base_url
+        # Read schema.org JSON-LD offers before falling back to the CSS selectors
+        self.structured_data = structured_data
+        self.groups = {group: compile_selectors(selectors.get(group)) for group in SELECTOR_GROUPS}
+        self.phrases = PhraseMatcher(selectors.get('in_stock_text'), selectors.get('out_of_stock_text'))
+        # Picklable description of the extractor, rebuilt by extract_page() in parse workers
+        self.spec = (json.dumps(selectors, sort_keys=True), base_url, structured_data)
+        # Every distinct CSS selector, in order, for the single-call browser extraction
+        self.css_list = list(dict.fromkeys(
+            selector.css for group in SELECTOR_GROUPS for selector in self.groups[group]
+        ))
+
+    def _first(self, document, group):
+        for selector in self.groups[group]:
+            node = document.first(selector)
+            if node is not None:
+                yield node
+
+    def extract(self, document, buy_url, page_text=None):
+        """
+        Returns (in_stock, product_data, highlight_nodes).
+        page_text enables the last-resort scan of the whole page for stock phrases.
+        """
+        product_data = {
+            "title": None,
+            "price": None,
+            "availability": None,
+            "image_url": None,
+            "buy_url": buy_url
+        }
+        highlight_nodes = []
+
+        # Extract product title
+        for node in self._first(document, 'title'):
+            product_data["title"] = document.text(node)
+            break
+
+        # Extract product price
+        for node in self._first(document, 'price'):
+            product_data["price"] = parse_price(document.text(node))
+            highlight_nodes.append(node)
+            break
+
+        # Extract product image
+        for node in self._first(document, 'image'):
+            img_url = document.attr(node, 'src')
+            if img_url:
+                # Make absolute URL if it's relative
+                if img_url.startswith('/'):
+                    img_url = self.base_url + img_url
+                product_data["image_url"] = img_url
+                break
+
+        # Check availability - combine multiple approaches
+        in_stock = False
+        availability_text = ""
+
+        # 1. Check via selectors
+        for node in self._first(document, 'availability'):
+            availability_text = document.text(node)
+            highlight_nodes.append(node)
+            in_stock, _ = self.match_stock_text(availability_text)
+            break
+
+        # 2. Check for add to cart button
+        if not in_stock:
+            for node in self._first(document, 'add_to_cart_button'):
+                if document.attr(node, 'disabled') is None:
+                    in_stock = True
+                    availability_text = "Add to cart button is enabled"
+                    highlight_nodes.append(node)
+                    break
+
+        # 3. Check content for availability indicators
+        if not availability_text and page_text:
+            in_stock, availability_text = self.scan_page_text(page_text)
+
+        product_data["availability"] = availability_text
+        return in_stock, product_data, highlight_nodes
+
+    def match_stock_text(self, availability_text):
+        """Negative phrases win over positive ones. Returns (in_stock, matched_phrase)."""
+        return self.phrases.match(availability_text)
+
+    def scan_page_text(self, page_text):
+        in_stock, phrase = self.phrases.match(page_text)
+        return in_stock, phrase or ""
+
+    def extract_structured(self, markup, buy_url):
+        """JSON-LD fast path. Returns (in_stock, product_data, []) or None."""
+        structured = structured_product_data(markup)
+        if structured is None:
+            return None
+        in_stock, fields = structured
+        image_url = fields["image_url"]
+        if image_url and image_url.startswith('/'):
+            image_url = self.base_url + image_url
+        product_data = {
+            "title": fields["title"],
+            "price": fields["price"],
+            "availability": fields["availability"],
+            "image_url": image_url,
+            "buy_url": buy_url
+        }
+        return in_stock, product_data, []
+
+    def extract_html(self, markup, buy_url, scan_page_text=False):
+        if self.structured_data:
+            result = self.extract_structured(markup, buy_url)
+            if result is not None:
+                return result
+        root = parse_html(markup)
+        page_text = markup if scan_page_text else None
+        if isinstance(page_text, bytes):
+            page_text = page_text.decode("utf-8", errors="replace")
+        return self.extract(LxmlDocument(root), buy_url, page_text)
+
+    def extract_stream(self, chunks, buy_url, encoding="utf-8", max_bytes=None, scan_page_text=False):
+        """
+        Parse an iterable of byte chunks incrementally and stop consuming it as
+        soon as every selector group resolved or max_bytes were read.
+        Returns (in_stock, product_data, text_read).
+        """
+        document = self.stream_document(encoding)
+        for chunk in chunks:
+            if document.feed(chunk):
+                break
+            if max_bytes and document.bytes_read >= max_bytes:
+                logger.info(f"Stream size cap reached ({document.bytes_read} bytes) for {buy_url}")
+                break
+        return self.extract_streamed(document, buy_url, scan_page_text)
+
+    def stream_document(self, encoding="utf-8"):
+        """Incremental document to feed with the chunks of a page, for extract_streamed()."""
+        return StreamingDocument(self, encoding)
+
+    def extract_streamed(self, document, buy_url, scan_page_text=False):
+        """Finish a fed StreamingDocument and extract it. Returns (in_stock, product_data, text_read)."""
+        root, text_read = document.close()
+        if root is None:
+            raise ValueError("Empty HTML document")
+        in_stock, product_data, _ = self.extract(
+            LxmlDocument(root), buy_url, text_read if scan_page_text else None
+        )
+        return in_stock, product_data, text_read
+
+    def extract_driver(self, driver, buy_url):
+        """
+        Extract from a loaded Selenium page with one execute_script call.
+        The highlight nodes are dicts carrying their "css" selector; element
+        handles are only looked up when a screenshot needs them.
+        """
+        matches = driver.execute_script(EXTRACTION_SCRIPT, self.css_list)
+        return self.extract(ScriptResultDocument(matches), buy_url)
+
+
+###############################################################################
+#                       PARSE WORKER (PROCESS POOL)                           #
+###############################################################################
+# Extractors compiled in this process by extract_page(), keyed by their spec
+_spec_extractors = {}
+
+
+def extract_page(spec, markup, buy_url, scan_page_text=False, encoding="utf-8"):
+    """
+    Process pool entry point: parse raw HTML bytes with the selector spec of
+    a site (ProductExtractor.spec). The extractor is compiled once per worker
+    process. Returns (in_stock, product_data).
+    """
+    extractor = _spec_extractors.get(spec)
+    if extractor is None:
+        selectors_json, base_url, structured_data = spec
+        extractor = _spec_extractors[spec] = ProductExtractor(json.loads(selectors_json), base_url, structured_data)
+    if isinstance(markup, bytes) and encoding:
+        try:
+            if codecs.lookup(encoding).name != "utf-8":
+                markup = markup.decode(encoding, errors="replace")
+        except LookupError:
+            pass
+    in_stock, product_data, _ = extractor.extract_html(markup, buy_url, scan_page_text)
+    return in_stock, product_data
@@ -0,0 +1,223 @@
+"""
+site_catalog.py - Declarative site catalog (JSON files) validated and compiled on load
+"""
+
+import os
+import json
+import logging
+import threading
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from product_extractor import ProductExtractor, SELECTOR_GROUPS
+
+logger = logging.getLogger("PokemonStockBot")
+
+CATALOG_FILES = ("collections.json", "selectors.json", "sites.json")
+REQUIRED_COLLECTION_KEYS = ("name", "keywords", "image_url")
+REQUIRED_SITE_KEYS = ("name", "base_url", "selectors", "products")
+REQUIRED_PRODUCT_KEYS = ("name", "collection", "url")
+PHRASE_LISTS = ("in_stock_text", "out_of_stock_text")
+# Query parameters that only track the visit; they would split cache keys of the same page
+TRACKING_PARAM_PREFIXES = ("utm_", "fbclid", "gclid")
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def canonicalize_url(url, base_url=""):
+    """Absolute URL with lowercase scheme/host, no fragment and no tracking parameters."""
+    if not isinstance(url, str) or not url.strip():
+        raise CatalogError(f"Invalid URL: {url!r}")
+    url = urljoin(base_url.rstrip("/") + "/", url.strip()) if base_url else url.strip()
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.netloc:
+        raise CatalogError(f"Invalid URL: {url}")
+    query = urlencode([
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", query, ""))
+
+
+def make_extractor(site_info):
+    return ProductExtractor(
+        site_info['selectors'], site_info.get('base_url', ''), site_info.get('structured_data', True)
+    )
+
+
+class Catalog:
+    """
+    A validated catalog with the extractor of every site already compiled
+    (CSS selectors translated, phrase matchers built). A reload builds a new
+    Catalog instead of changing this one.
+    """
+    def __init__(self, sites, collections, selectors, signature=None):
+        self.sites = sites
+        self.collections = collections
+        self.selectors = selectors
+        self.signature = signature
+        self.extractors = {site['name']: make_extractor(site) for site in sites}
+
+
+def _read_json(directory, filename):
+    path = os.path.join(directory, filename)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except OSError as e:
+        raise CatalogError(f"Cannot read {path}: {e}")
+    except ValueError as e:
+        raise CatalogError(f"Invalid JSON in {path}: {e}")
+
+
+def catalog_signature(directory):
+    """(name, mtime, size) of every catalog file, used to detect changes."""
+    signature = []
+    for filename in CATALOG_FILES:
+        try:
+            stat = os.stat(os.path.join(directory, filename))
+            signature.append((filename, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((filename, None, None))
+    return tuple(signature)
+
+
+def _check_selectors(name, selectors):
+    if not isinstance(selectors, dict):
+        raise CatalogError(f"Selectors {name}: expected an object")
+    for key in SELECTOR_GROUPS + PHRASE_LISTS:
+        values = selectors.get(key, [])
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise CatalogError(f"Selectors {name}: '{key}' must be a list of strings")
+
+
+def resolve_selectors(name, definitions, chain=()):
+    """Selector set with its "extends" parents merged in (child keys win)."""
+    if name not in definitions:
+        raise CatalogError(f"Unknown selector set: {name}")
+    if name in chain:
+        raise CatalogError(f"Selector sets extend each other: {' -> '.join(chain + (name,))}")
+    definition = definitions[name]
+    if not isinstance(definition, dict):
+        raise CatalogError(f"Selectors {name}: expected an object")
+    resolved = {}
+    if definition.get("extends"):
+        resolved.update(resolve_selectors(definition["extends"], definitions, chain + (name,)))
+    resolved.update({key: value for key, value in definition.items() if key != "extends"})
+    return resolved
+
+
+def _build_site(site, selectors, collection_names):
+    missing = [key for key in REQUIRED_SITE_KEYS if key not in site]
+    if missing:
+        raise CatalogError(f"Site {site.get('name', '?')}: missing {', '.join(missing)}")
+    site = dict(site)
+    site_name = site['name']
+    if isinstance(site['selectors'], str):
+        if site['selectors'] not in selectors:
+            raise CatalogError(f"Site {site_name}: unknown selector set {site['selectors']}")
+        site['selectors'] = selectors[site['selectors']]
+    elif isinstance(site['selectors'], dict) and site['selectors'].get("extends"):
+        site['selectors'] = resolve_selectors("inline", dict(selectors, inline=site['selectors']))
+    _check_selectors(site_name, site['selectors'])
+    site['base_url'] = canonicalize_url(site['base_url']).rstrip("/")
+
+    if not isinstance(site['products'], list):
+        raise CatalogError(f"Site {site_name}: 'products' must be a list")
+    products = []
+    names = set()
+    for product in site['products']:
+        if not isinstance(product, dict):
+            raise CatalogError(f"Site {site_name}: invalid product entry {product!r}")
+        missing = [key for key in REQUIRED_PRODUCT_KEYS if key not in product]
+        if missing:
+            raise CatalogError(f"Site {site_name}, product {product.get('name', '?')}: missing {', '.join(missing)}")
+        if product['name'] in names:
+            raise CatalogError(f"Site {site_name}: duplicate product {product['name']}")
+        if product['collection'] not in collection_names:
+            raise CatalogError(f"Site {site_name}, product {product['name']}: unknown collection {product['collection']}")
+        names.add(product['name'])
+        product = dict(product)
+        product['url'] = canonicalize_url(product['url'], site['base_url'])
+        products.append(product)
+    site['products'] = products
+    return site
+
+
+def load_catalog(directory):
+    """Read, validate and compile the catalog files. Raises CatalogError."""
+    signature = catalog_signature(directory)
+    collections = _read_json(directory, "collections.json")
+    definitions = _read_json(directory, "selectors.json")
+    raw_sites = _read_json(directory, "sites.json")
+    if not isinstance(collections, list) or not isinstance(definitions, dict) or not isinstance(raw_sites, list):
+        raise CatalogError("collections.json and sites.json must hold lists, selectors.json an object")
+
+    collection_names = set()
+    for collection in collections:
+        if not isinstance(collection, dict) or any(key not in collection for key in REQUIRED_COLLECTION_KEYS):
+            raise CatalogError(f"Collection needs {', '.join(REQUIRED_COLLECTION_KEYS)}: {collection!r}")
+        if collection["name"] in collection_names:
+            raise CatalogError(f"Duplicate collection: {collection['name']}")
+        collection_names.add(collection["name"])
+
+    selectors = {name: resolve_selectors(name, definitions) for name in definitions}
+    for name, selector_set in selectors.items():
+        _check_selectors(name, selector_set)
+
+    sites = []
+    site_names = set()
+    for site in raw_sites:
+        if not isinstance(site, dict):
+            raise CatalogError(f"Invalid site entry: {site!r}")
+        built = _build_site(site, selectors, collection_names)
+        if built['name'] in site_names:
+            raise CatalogError(f"Duplicate site: {built['name']}")
+        site_names.add(built['name'])
+        sites.append(built)
+
+    return Catalog(sites, collections, selectors, signature)
+
+
+class CatalogWatcher:
+    """
+    Polls the catalog files and passes every new valid version to on_reload.
+    An invalid edit is logged and the running catalog stays in place.
+    """
+    def __init__(self, directory, on_reload, interval=10, signature=None):
+        self.directory = directory
+        self.on_reload = on_reload
+        self.interval = interval
+        self.signature = signature or catalog_signature(directory)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self):
+        signature = catalog_signature(self.directory)
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        try:
+            catalog = load_catalog(self.directory)
+        except CatalogError as e:
+            logger.error(f"Catalog change ignored: {e}")
+            return False
+        self.on_reload(catalog)
+        logger.info(f"Catalog reloaded: {len(catalog.sites)} sites, "
+                    f"{sum(len(site['products']) for site in catalog.sites)} products")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error while reloading the catalog: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-watch", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
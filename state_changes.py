@@ -0,0 +1,94 @@
+"""
+state_changes.py - Typed change events computed from successive check results
+"""
+
+import os
+import threading
+from collections import namedtuple
+from product_extractor import is_valid_extraction
+
+RESTOCK = "restock"
+SOLD_OUT = "sold_out"
+PRICE_CHANGE = "price_change"
+TITLE_CHANGE = "title_change"
+
+# Relative price variation below which a new price is not reported (0.05 = 5%)
+PRICE_CHANGE_THRESHOLD = float(os.getenv("PRICE_CHANGE_THRESHOLD", "0.05"))
+
+ChangeEvent = namedtuple(
+    "ChangeEvent",
+    ["kind", "site", "product", "previous", "current", "message", "screenshots", "product_data"]
+)
+
+
+def is_alert_event(event):
+    """
+    Events worth a notification: a restock, or a new price of a product that
+    was already in stock (a restock with a new price is a single alert).
+    """
+    if event.kind == RESTOCK:
+        return True
+    return (event.kind == PRICE_CHANGE and event.current["available"]
+            and bool(event.previous and event.previous["available"]))
+
+
+class StateDiffEngine:
+    """
+    Keeps the last known state (availability, price, title) of every product,
+    keyed by URL, and turns each new check result into the list of changes.
+    Failed checks (no recognised page) neither change the state nor emit events.
+    """
+    def __init__(self, price_threshold=PRICE_CHANGE_THRESHOLD):
+        self.price_threshold = price_threshold
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def is_in_stock(self, url):
+        state = self._states.get(url)
+        return bool(state and state["available"])
+
+    def _price_changed(self, old, new):
+        if old is None or new is None or old == new:
+            return False
+        return abs(new - old) >= self.price_threshold * old
+
+    def diff(self, site, product, result):
+        """Record a check result and return its ChangeEvents (usually none)."""
+        available, message, screenshots, product_data = result
+        if not is_valid_extraction(product_data):
+            return []
+
+        title = " ".join((product_data.get("title") or "").split()) or None
+        with self._lock:
+            previous = self._states.get(product['url'])
+            # A price or title missing from one page keeps the last known value
+            current = {
+                "available": bool(available),
+                "price": product_data.get("price"),
+                "title": title
+            }
+            if previous:
+                if current["price"] is None:
+                    current["price"] = previous["price"]
+                if current["title"] is None:
+                    current["title"] = previous["title"]
+            self._states[product['url']] = current
+
+        kinds = []
+        if previous is None:
+            if current["available"]:
+                kinds.append(RESTOCK)
+        else:
+            if current["available"] and not previous["available"]:
+                kinds.append(RESTOCK)
+            elif previous["available"] and not current["available"]:
+                kinds.append(SOLD_OUT)
+            if self._price_changed(previous["price"], current["price"]):
+                kinds.append(PRICE_CHANGE)
+            if previous["title"] and current["title"] != previous["title"]:
+                kinds.append(TITLE_CHANGE)
+
+        return [
+            ChangeEvent(kind, site, product, previous, current, message, screenshots, product_data)
+            for kind in kinds
+        ]
@@ -0,0 +1,155 @@
+"""
+subscriptions.py - In-memory index of the users' notification subscriptions
+"""
+
+import json
+import bisect
+import logging
+import threading
+from collections import namedtuple
+from db_connection import get_db_connection
+
+logger = logging.getLogger("PokemonStockBot")
+
+# Subscriptions of approved users only, as in the former notification query
+SUBSCRIPTION_QUERY = """
+    SELECT n.id, n.user_id, n.collection, n.product, n.site, n.min_price, n.max_price,
+           u.username, u.email, u.preferences
+    FROM user_notifications n
+    JOIN users u ON u.id = n.user_id
+    WHERE n.active = 1 AND u.role = 'user'
+"""
+
+# Collection matching any collection; an empty product or site matches any product or site
+ALL_COLLECTIONS = "all"
+
+Subscription = namedtuple(
+    "Subscription",
+    ["notification_id", "user_id", "username", "email", "min_price", "max_price", "email_alerts", "telegram_alerts"]
+)
+
+
+def _subscription(row):
+    preferences = {}
+    if row['preferences']:
+        try:
+            preferences = json.loads(row['preferences'])
+        except ValueError:
+            pass
+    key = (row['collection'], row['product'] or "", row['site'] or "")
+    return key, Subscription(
+        row['id'], row['user_id'], row['username'], row['email'],
+        row['min_price'] if row['min_price'] is not None else 0.0,
+        row['max_price'] if row['max_price'] is not None else float("inf"),
+        preferences.get('notifications_email', True),
+        preferences.get('notifications_telegram', False)
+    )
+
+
+class PriceBucket:
+    """Subscriptions of one (collection, product, site) key, sorted by minimum price."""
+    def __init__(self):
+        self.min_prices = []
+        self.subscriptions = []
+
+    def add(self, subscription):
+        index = bisect.bisect_right(self.min_prices, subscription.min_price)
+        self.min_prices.insert(index, subscription.min_price)
+        self.subscriptions.insert(index, subscription)
+
+    def remove(self, subscription):
+        index = self.subscriptions.index(subscription)
+        del self.min_prices[index]
+        del self.subscriptions[index]
+
+    def matching(self, price):
+        # Only the subscriptions starting at or below the price can contain it
+        end = bisect.bisect_right(self.min_prices, price)
+        return [sub for sub in self.subscriptions[:end] if price <= sub.max_price]
+
+
+class SubscriptionIndex:
+    """
+    Active subscriptions keyed by (collection, product, site) with the user's
+    channel preferences already parsed. Loaded from SQLite on first use, then
+    kept up to date by the code that writes subscriptions or users, so
+    matching a product needs no database access.
+    """
+    def __init__(self):
+        self._buckets = {}
+        self._by_id = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _insert(self, row):
+        key, subscription = _subscription(row)
+        self._buckets.setdefault(key, PriceBucket()).add(subscription)
+        self._by_id[subscription.notification_id] = (key, subscription)
+
+    def _discard(self, notification_id):
+        entry = self._by_id.pop(notification_id, None)
+        if entry is None:
+            return
+        key, subscription = entry
+        bucket = self._buckets[key]
+        bucket.remove(subscription)
+        if not bucket.subscriptions:
+            del self._buckets[key]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        rows = get_db_connection().execute(SUBSCRIPTION_QUERY).fetchall()
+        for row in rows:
+            self._insert(row)
+        self._loaded = True
+        logger.info(f"Subscription index loaded: {len(self._by_id)} subscriptions")
+
+    def add_notification(self, notification_id):
+        """Index a subscription just inserted in user_notifications."""
+        with self._lock:
+            if not self._loaded:
+                return
+            row = get_db_connection().execute(
+                SUBSCRIPTION_QUERY + " AND n.id = ?", (notification_id,)
+            ).fetchone()
+            self._discard(notification_id)
+            if row:
+                self._insert(row)
+
+    def remove_notification(self, notification_id):
+        with self._lock:
+            self._discard(notification_id)
+
+    def refresh_user(self, user_id):
+        """Re-read the subscriptions of a user whose role, profile or preferences changed."""
+        with self._lock:
+            if not self._loaded:
+                return
+            for notification_id in [nid for nid, (_, sub) in self._by_id.items() if sub.user_id == user_id]:
+                self._discard(notification_id)
+            for row in get_db_connection().execute(SUBSCRIPTION_QUERY + " AND n.user_id = ?", (user_id,)):
+                self._insert(row)
+
+    def invalidate(self):
+        """Forget the index (the database was replaced); it is reloaded on the next match."""
+        with self._lock:
+            self._buckets = {}
+            self._by_id = {}
+            self._loaded = False
+
+    def match(self, collection, product, site, price):
+        """Subscriptions covering a product of a site at the given price."""
+        with self._lock:
+            self._ensure_loaded()
+            matches = []
+            for collection_key in {collection, ALL_COLLECTIONS}:
+                for product_key in {product, ""}:
+                    for site_key in {site, ""}:
+                        bucket = self._buckets.get((collection_key, product_key, site_key))
+                        if bucket:
+                            matches.extend(bucket.matching(price))
+            return matches
+
+
+subscription_index = SubscriptionIndex()
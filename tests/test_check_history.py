@@ -0,0 +1,103 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_history import CheckHistory, DAY, HOUR
+from db_connection import DB_PATH, db, get_db_connection
+from db_migrations import run_migrations
+
+# auth migrates database.db in the working directory on import
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    from auth import MIGRATIONS
+finally:
+    os.chdir(_cwd)
+
+SITE = {"name": "Shop"}
+PRODUCT = {"name": "Coffret"}
+NOW = 1000 * DAY
+OLD_HOUR = NOW - 10 * DAY
+
+
+def found(available, price):
+    return available, "ok", [], {"title": "Coffret", "price": price, "availability": "En stock"}
+
+
+class CheckHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        db.set_path(os.path.join(self.tmp, "test.db"))
+        run_migrations(get_db_connection(), MIGRATIONS)
+        self.history = CheckHistory(flush_interval=0.05, raw_days=7, hourly_days=30, retention_interval=DAY)
+
+    def tearDown(self):
+        self.history.stop()
+        if self.history._thread:
+            # The writer must be done with the test database before the path is restored
+            self.history._thread.join(5)
+        db.set_path(DB_PATH)
+        shutil.rmtree(self.tmp)
+
+    def insert(self, *rows):
+        with get_db_connection() as conn:
+            conn.executemany(
+                "INSERT INTO check_results (product, site, ts, available, price, latency, tier) "
+                "VALUES ('Coffret', 'Shop', ?, ?, ?, ?, 'check_site_standard')",
+                rows
+            )
+
+    def test_recorded_results_are_written(self):
+        self.history.record(SITE, PRODUCT, found(True, 49.99), latency=0.5, tier="check_site_standard")
+        self.history.record(SITE, PRODUCT, (False, "Access blocked", [], {}), latency=0.2)
+        self.history.flush(timeout=5)
+        rows = self.history.history("Coffret", since=0)
+        self.assertEqual([(row["available"], row["price"]) for row in rows], [(True, 49.99), (None, None)])
+        self.assertEqual(rows[0]["tier"], "check_site_standard")
+
+    def test_downsample_folds_old_hours(self):
+        self.insert(
+            (OLD_HOUR + 10, 1, 50.0, 1.0),
+            (OLD_HOUR + 20, 0, 40.0, 3.0),
+            (OLD_HOUR + 30, None, None, 2.0),
+            (OLD_HOUR + HOUR + 10, 1, None, 1.0),
+            (NOW - 60, 1, 45.0, 1.0),
+        )
+        self.assertEqual(self.history.downsample(now=NOW), 4)
+
+        hours = self.history.hourly("Coffret")
+        self.assertEqual([hour["hour"] for hour in hours], [OLD_HOUR, OLD_HOUR + HOUR])
+        first = hours[0]
+        self.assertEqual(first["checks"], 3)
+        self.assertEqual(first["in_stock_ratio"], 0.5)
+        self.assertEqual(first["avg_price"], 45.0)
+        self.assertEqual((first["min_price"], first["max_price"]), (40.0, 50.0))
+        self.assertEqual(first["avg_latency"], 2.0)
+        self.assertIsNone(hours[1]["avg_price"])
+        # Recent results stay raw
+        self.assertEqual(len(self.history.history("Coffret", since=0)), 1)
+
+    def test_late_rows_are_merged_into_an_existing_hour(self):
+        self.insert((OLD_HOUR + 10, 1, None, 1.0))
+        self.history.downsample(now=NOW)
+        self.insert((OLD_HOUR + 20, 0, 30.0, 1.0), (OLD_HOUR + 30, 1, 60.0, 1.0))
+        self.history.downsample(now=NOW)
+
+        (hour,) = self.history.hourly("Coffret")
+        self.assertEqual(hour["checks"], 3)
+        self.assertAlmostEqual(hour["in_stock_ratio"], 2 / 3)
+        self.assertEqual((hour["min_price"], hour["max_price"]), (30.0, 60.0))
+        self.assertEqual(hour["avg_price"], 45.0)
+
+    def test_expired_hours_are_dropped(self):
+        self.insert((NOW - 40 * DAY, 1, 50.0, 1.0), (OLD_HOUR, 1, 50.0, 1.0))
+        self.history.downsample(now=NOW)
+        self.assertEqual([hour["hour"] for hour in self.history.hourly("Coffret")], [OLD_HOUR])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_scheduler import CheckScheduler, HostBudget, ScheduledProduct, MIN_INTERVAL
+
+
+def site(name, host, products, **options):
+    return dict(name=name, products=[
+        {"name": product, "url": f"https://{host}/{product}"} for product in products
+    ], **options)
+
+
+def found(available, price):
+    return available, "ok", [], {"title": "Coffret", "price": price, "availability": "En stock"}
+
+
+ERROR = (False, "Error checking: timeout", [], {})
+
+
+class HostBudgetTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        budget = HostBudget(requests_per_minute=6, burst=2)
+        now = budget.updated
+        self.assertEqual(budget.try_acquire(now), 0)
+        self.assertEqual(budget.try_acquire(now), 0)
+        self.assertAlmostEqual(budget.try_acquire(now), 10.0)
+        self.assertAlmostEqual(budget.try_acquire(now + 5), 5.0)
+        self.assertEqual(budget.try_acquire(now + 10), 0)
+
+
+class ScheduledProductTest(unittest.TestCase):
+    def product(self, **options):
+        entry = site("Shop", "shop.example", ["coffret"], **options)
+        return ScheduledProduct(entry, entry["products"][0], base_interval=600)
+
+    def test_interval_follows_priority(self):
+        self.assertEqual(self.product(priority=1).base_interval, 150)
+        self.assertEqual(self.product(priority=2).base_interval, 300)
+        self.assertEqual(self.product(priority=3).base_interval, 600)
+        self.assertEqual(self.product(priority=1, check_interval=90).base_interval, 90)
+
+    def test_volatile_products_are_checked_more_often(self):
+        item = self.product()
+        for available in (False, True, False, True):
+            item.record(found(available, 49.99))
+        self.assertEqual(item.volatility(), 3)
+        interval = item.next_interval()
+        self.assertGreaterEqual(interval, 0.9 * 150)
+        self.assertLessEqual(interval, 1.1 * 150)
+
+    def test_interval_has_a_floor(self):
+        item = self.product(check_interval=MIN_INTERVAL)
+        for price in (10.0, 11.0, 12.0, 13.0):
+            item.record(found(True, price))
+        self.assertGreaterEqual(item.next_interval(), 0.9 * MIN_INTERVAL)
+
+    def test_errors_do_not_count_as_changes(self):
+        item = self.product()
+        item.record(found(True, 49.99))
+        item.record(ERROR)
+        item.record(found(True, 49.99))
+        item.record((False, "Access blocked (HTTP 403)", [], {"title": None, "price": None, "availability": None}))
+        self.assertEqual(item.volatility(), 0)
+        self.assertEqual(len(item.history), 2)
+
+
+class CheckSchedulerTest(unittest.TestCase):
+    def test_host_limit_and_budget(self):
+        scheduler = CheckScheduler([
+            site("Shop", "shop.example", ["a", "b", "c"], requests_per_minute=600),
+            site("Other", "other.example", ["d"]),
+        ], check_func=None, host_limit=2)
+        ready = [scheduler._next_ready() for _ in range(3)]
+        hosts = [entry[1] for entry in ready if entry]
+        self.assertEqual(sorted(hosts), ["other.example", "shop.example", "shop.example"])
+        # Both slots of shop.example are taken: its last product waits
+        self.assertIsNone(scheduler._next_ready())
+
+        scheduler._in_flight["shop.example"] = 0
+        item, host = scheduler._next_ready()
+        self.assertEqual(item.key, ("Shop", "c"))
+
+    def test_budget_defers_a_host(self):
+        scheduler = CheckScheduler([site("Shop", "shop.example", ["a", "b", "c"])],
+                                   check_func=None, host_limit=5)
+        self.assertIsNotNone(scheduler._next_ready())
+        self.assertIsNotNone(scheduler._next_ready())
+        # The burst of 2 is spent; the third product stays queued with its due time
+        self.assertIsNone(scheduler._next_ready())
+        self.assertEqual(len(scheduler._heap), 1)
+
+    def test_run_reschedules_checked_products(self):
+        checked = []
+        done = threading.Event()
+
+        def check(site_info, product):
+            checked.append(product["name"])
+            return found(True, 10.0)
+
+        def on_result(site_info, product, result):
+            if len(checked) == 2:
+                done.set()
+
+        scheduler = CheckScheduler([site("Shop", "shop.example", ["a", "b"], check_interval=600)],
+                                   check, on_result=on_result)
+        thread = threading.Thread(target=scheduler.run, daemon=True)
+        thread.start()
+        self.assertTrue(done.wait(5))
+        scheduler.stop()
+        thread.join(5)
+        self.assertEqual(sorted(checked), ["a", "b"])
+        # Next checks are about check_interval away (with the +/-10% jitter)
+        self.assertGreater(scheduler.next_due(), time.time() + 500)
+
+    def test_sync_adds_and_drops_products(self):
+        scheduler = CheckScheduler([site("Shop", "shop.example", ["a", "b"])], check_func=None)
+        scheduler.sync([site("Shop", "shop.example", ["b", "c"])])
+        self.assertEqual(sorted(scheduler._products), [("Shop", "b"), ("Shop", "c")])
+
+
+if __name__ == "__main__":
+    unittest.main()
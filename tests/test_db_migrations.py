@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_migrations import current_version, run_migrations
+
+MIGRATIONS = [
+    (1, "products", ["CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT)"]),
+    (2, "price", ["ALTER TABLE products ADD COLUMN price REAL"]),
+]
+
+
+class RunMigrationsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "test.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        self.addCleanup(conn.close)
+        return conn
+
+    def columns(self, conn):
+        return [row[1] for row in conn.execute("PRAGMA table_info(products)")]
+
+    def test_applies_in_order_once(self):
+        conn = self.connect()
+        self.assertEqual(current_version(conn), 0)
+        self.assertEqual(run_migrations(conn, MIGRATIONS), 2)
+        self.assertEqual(current_version(conn), 2)
+        self.assertEqual(self.columns(conn), ["id", "name", "price"])
+
+        # Non-idempotent statements (CREATE TABLE, ALTER TABLE) are not run again
+        self.assertEqual(run_migrations(conn, MIGRATIONS), 0)
+        self.assertEqual(run_migrations(self.connect(), MIGRATIONS), 0)
+        versions = conn.execute("SELECT version FROM schema_version ORDER BY version").fetchall()
+        self.assertEqual(versions, [(1,), (2,)])
+
+    def test_only_new_migrations_run(self):
+        conn = self.connect()
+        run_migrations(conn, MIGRATIONS[:1])
+        self.assertEqual(run_migrations(conn, MIGRATIONS), 1)
+        self.assertEqual(self.columns(conn), ["id", "name", "price"])
+
+    def test_callable_step(self):
+        conn = self.connect()
+        steps = MIGRATIONS + [(3, "seed", lambda c: c.execute("INSERT INTO products (name) VALUES ('Coffret')"))]
+        run_migrations(conn, steps)
+        run_migrations(conn, steps)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM products").fetchone()[0], 1)
+
+    def test_failed_migration_is_rolled_back(self):
+        conn = self.connect()
+        broken = MIGRATIONS + [(3, "broken", [
+            "CREATE TABLE stock (id INTEGER PRIMARY KEY)",
+            "ALTER TABLE missing ADD COLUMN x",
+        ])]
+        with self.assertRaises(sqlite3.OperationalError):
+            run_migrations(conn, broken)
+        self.assertEqual(current_version(conn), 2)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("stock", tables)
+
+    def test_concurrent_processes_migrate_once(self):
+        errors = []
+
+        def migrate():
+            try:
+                conn = sqlite3.connect(self.path, timeout=10)
+                try:
+                    run_migrations(conn, MIGRATIONS)
+                finally:
+                    conn.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=migrate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(errors, [])
+        conn = self.connect()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0], 2)
+        self.assertEqual(self.columns(conn), ["id", "name", "price"])
+
+
+if __name__ == "__main__":
+    unittest.main()
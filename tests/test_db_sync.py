@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import base64
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_sync import ContentsStore, DatabaseSync, MANIFEST_FILE
+
+PREFIX = "/repos/owner/repo/contents/"
+
+
+class ContentsHandler(BaseHTTPRequestHandler):
+    """Minimal stand-in for the GitHub contents API, backed by server.files."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _path(self):
+        return self.path[len(PREFIX):]
+
+    def _body(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+    def _reply(self, status, data=None):
+        body = json.dumps(data or {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        entry = self.server.files.get(self._path())
+        if entry is None:
+            return self._reply(404)
+        content, sha = entry
+        self._reply(200, {"sha": sha, "content": base64.b64encode(content).decode()})
+
+    def do_PUT(self):
+        path, body = self._path(), self._body()
+        if path in self.server.files and body.get("sha") != self.server.files[path][1]:
+            self.server.conflicts += 1
+            return self._reply(409 if "sha" in body else 422)
+        content = base64.b64decode(body["content"])
+        sha = hashlib.sha1(content).hexdigest()
+        self.server.files[path] = (content, sha)
+        self._reply(201, {"content": {"sha": sha}})
+
+    def do_DELETE(self):
+        path, body = self._path(), self._body()
+        if path not in self.server.files:
+            return self._reply(404)
+        if body.get("sha") != self.server.files[path][1]:
+            return self._reply(409)
+        del self.server.files[path]
+        self._reply(200)
+
+
+class DatabaseSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ContentsHandler)
+        self.server.files = {}
+        self.server.conflicts = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.sync = self.make_sync("local.db.synced")
+        self.snapshot = os.path.join(self.tmp, "snapshot.db")
+        with self.connect(self.snapshot) as conn:
+            conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL)")
+            conn.executemany("INSERT INTO products (name, price) VALUES (?, ?)",
+                             [(f"Booster {i}", 5.0 + i) for i in range(200)])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def make_sync(self, synced_name):
+        api_url = f"http://127.0.0.1:{self.server.server_address[1]}{PREFIX}"
+        store = ContentsStore(api_url, "token")
+        # Small chunks so the base is split into several files
+        return DatabaseSync(store, os.path.join(self.tmp, synced_name), directory="sync", chunk_size=1024)
+
+    def connect(self, path):
+        conn = sqlite3.connect(path)
+        self.addCleanup(conn.close)
+        return conn
+
+    def restored_rows(self):
+        target = self.connect(":memory:")
+        self.assertTrue(self.make_sync("other.db.synced").restore(target))
+        return target.execute("SELECT id, name, price FROM products ORDER BY id").fetchall()
+
+    def snapshot_rows(self):
+        return self.connect(self.snapshot).execute("SELECT id, name, price FROM products ORDER BY id").fetchall()
+
+    def manifest(self):
+        return json.loads(self.server.files[f"sync/{MANIFEST_FILE}"][0])
+
+    def test_push_base_and_restore(self):
+        self.assertEqual(self.sync.push(self.snapshot), "base")
+        self.assertGreater(len(self.manifest()["base"]["chunks"]), 1)
+        self.assertEqual(self.restored_rows(), self.snapshot_rows())
+
+    def test_push_delta_and_restore(self):
+        self.sync.push(self.snapshot)
+        with self.connect(self.snapshot) as conn:
+            conn.execute("UPDATE products SET price = 9.5 WHERE id = 3")
+            conn.execute("DELETE FROM products WHERE id = 7")
+            conn.execute("INSERT INTO products (name, price) VALUES ('Coffret', 49.9)")
+
+        self.assertEqual(self.sync.push(self.snapshot), "delta")
+        self.assertEqual(len(self.manifest()["deltas"]), 1)
+        self.assertEqual(self.restored_rows(), self.snapshot_rows())
+
+    def test_unchanged_snapshot_is_not_pushed(self):
+        self.sync.push(self.snapshot)
+        files = dict(self.server.files)
+        self.assertIsNone(self.sync.push(self.snapshot))
+        self.assertEqual(self.server.files, files)
+
+    def test_stale_sha_is_refreshed_and_retried(self):
+        self.sync.push(self.snapshot)
+        # Another writer updates the manifest: the cached sha becomes stale
+        path = f"sync/{MANIFEST_FILE}"
+        content = self.server.files[path][0] + b"\n"
+        self.server.files[path] = (content, hashlib.sha1(content).hexdigest())
+
+        with self.connect(self.snapshot) as conn:
+            conn.execute("UPDATE products SET price = 1.0 WHERE id = 1")
+        self.assertEqual(self.sync.push(self.snapshot), "delta")
+        self.assertEqual(self.server.conflicts, 1)
+        self.assertEqual(self.restored_rows(), self.snapshot_rows())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sys
+import time
+import threading
+import unittest
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetch_engine import AsyncFetchEngine
+
+DELAY = 0.2
+PAGE = b"<html><body>" + b"<p>Booster</p>" * 20000 + b"</body></html>"
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serves /slow (after DELAY), /flaky (503 the first time) and /big (PAGE in chunks)."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"ok"):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        host = self.headers["Host"].split(":")[0]
+        with server.lock:
+            server.requests[self.path] += 1
+            server.active[host] += 1
+            server.peak[host] = max(server.peak[host], server.active[host])
+            server.peak_total = max(server.peak_total, sum(server.active.values()))
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(DELAY)
+                self._send(200)
+            elif self.path == "/flaky":
+                self._send(503 if server.requests[self.path] == 1 else 200)
+            elif self.path == "/big":
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(PAGE)))
+                self.end_headers()
+                try:
+                    for offset in range(0, len(PAGE), 16 * 1024):
+                        self.wfile.write(PAGE[offset:offset + 16 * 1024])
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            else:
+                self._send(404)
+        finally:
+            with server.lock:
+                server.active[host] -= 1
+
+
+class CountingDocument:
+    def __init__(self, stop_after):
+        self.stop_after = stop_after
+        self.bytes_read = 0
+
+    def feed(self, chunk):
+        self.bytes_read += len(chunk)
+        return self.bytes_read >= self.stop_after
+
+
+class AsyncFetchEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("0.0.0.0", 0), PageHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = defaultdict(int)
+        self.server.active = defaultdict(int)
+        self.server.peak = defaultdict(int)
+        self.server.peak_total = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.port = self.server.server_address[1]
+        self.engine = AsyncFetchEngine(host_limit=2, backoff_factor=0)
+
+    def tearDown(self):
+        self.engine.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, host, path):
+        return f"http://{host}:{self.port}{path}"
+
+    def test_requests_to_one_host_are_limited(self):
+        pages = self.engine.gather([
+            self.engine.fetch("Shop", self.url("127.0.0.1", f"/slow?{i}")) for i in range(6)
+        ])
+        self.assertEqual([page.status_code for page in pages], [200] * 6)
+        self.assertEqual(self.server.peak["127.0.0.1"], 2)
+
+    def test_hosts_are_fetched_at_the_same_time(self):
+        started = time.monotonic()
+        self.engine.gather([
+            self.engine.fetch(host, self.url(host, f"/slow?{i}"))
+            for host in ("127.0.0.1", "127.0.0.2") for i in range(2)
+        ])
+        self.assertEqual(self.server.peak_total, 4)
+        self.assertLess(time.monotonic() - started, 3 * DELAY)
+
+    def test_retry_status_is_retried(self):
+        page = self.engine.run(self.engine.fetch("Shop", self.url("127.0.0.1", "/flaky")))
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(self.server.requests["/flaky"], 2)
+
+    def test_error_status_is_returned_without_body(self):
+        page = self.engine.run(self.engine.fetch("Shop", self.url("127.0.0.1", "/missing")))
+        self.assertEqual(page.status_code, 404)
+        self.assertIsNone(page.content)
+
+    def test_full_body_and_encoding(self):
+        page = self.engine.run(self.engine.fetch("Shop", self.url("127.0.0.1", "/big")))
+        self.assertEqual(page.content, PAGE)
+        self.assertEqual(page.encoding, "utf-8")
+        self.assertTrue(page.text.startswith("<html>"))
+
+    def test_stream_stops_once_document_is_resolved(self):
+        page = self.engine.run(self.engine.fetch(
+            "Shop", self.url("127.0.0.1", "/big"), stream=lambda encoding: CountingDocument(32 * 1024)
+        ))
+        self.assertIsNone(page.content)
+        self.assertGreaterEqual(page.document.bytes_read, 32 * 1024)
+        self.assertLess(page.document.bytes_read, len(PAGE))
+
+    def test_stream_stops_at_byte_cap(self):
+        page = self.engine.run(self.engine.fetch(
+            "Shop", self.url("127.0.0.1", "/big"),
+            stream=lambda encoding: CountingDocument(len(PAGE) + 1), max_bytes=64 * 1024
+        ))
+        self.assertLess(page.document.bytes_read, len(PAGE))
+
+    def test_site_session_is_reused(self):
+        self.engine.run(self.engine.fetch("Shop", self.url("127.0.0.1", "/slow?a")))
+        session = self.engine._sessions["Shop"][0]
+        self.engine.run(self.engine.fetch("Shop", self.url("127.0.0.1", "/slow?b")))
+        self.assertIs(self.engine._sessions["Shop"][0], session)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# On import, pokemon_scraper opens its log file and auth migrates database.db,
+# both in the working directory
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    from pokemon_scraper import CheckCoalescer, CircuitBreakerRegistry
+    from auth import MIGRATIONS
+finally:
+    os.chdir(_cwd)
+
+from db_connection import DB_PATH, db, get_db_connection
+from db_migrations import run_migrations
+
+
+class CheckCoalescerTest(unittest.TestCase):
+    def test_concurrent_checks_share_one_run(self):
+        coalescer = CheckCoalescer(ttl=60)
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def check():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return (True, "En stock", [], {})
+
+        leader = threading.Thread(target=lambda: results.append(coalescer.run("url", check)))
+        leader.start()
+        self.assertTrue(started.wait(5))
+        followers = [threading.Thread(target=lambda: results.append(coalescer.run("url", check)))
+                     for _ in range(3)]
+        for thread in followers:
+            thread.start()
+        # Let the followers reach the in-flight future before the leader finishes
+        time.sleep(0.1)
+        self.assertIn("url", coalescer._in_flight)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [(True, "En stock", [], {})] * 4)
+
+    def test_result_is_reused_within_ttl(self):
+        coalescer = CheckCoalescer(ttl=60)
+        calls = []
+        check = lambda: calls.append(1) or len(calls)
+        self.assertEqual(coalescer.run("url", check), 1)
+        self.assertEqual(coalescer.run("url", check), 1)
+        self.assertEqual(coalescer.run("other", check), 2)
+        coalescer.clear()
+        self.assertEqual(coalescer.run("url", check), 3)
+
+    def test_expired_result_is_checked_again(self):
+        coalescer = CheckCoalescer(ttl=0)
+        calls = []
+        check = lambda: calls.append(1) or len(calls)
+        coalescer.run("url", check)
+        self.assertEqual(coalescer.run("url", check), 2)
+
+    def test_errors_are_raised_and_not_cached(self):
+        coalescer = CheckCoalescer(ttl=60)
+
+        def failing():
+            raise RuntimeError("timeout")
+
+        with self.assertRaises(RuntimeError):
+            coalescer.run("url", failing)
+        self.assertEqual(coalescer._in_flight, {})
+        self.assertEqual(coalescer.run("url", lambda: "ok"), "ok")
+
+
+class CircuitBreakerRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        db.set_path(os.path.join(self.tmp, "test.db"))
+        run_migrations(get_db_connection(), MIGRATIONS)
+
+    def tearDown(self):
+        db.set_path(DB_PATH)
+        shutil.rmtree(self.tmp)
+
+    def expire(self, *breakers):
+        for breaker in breakers:
+            breaker.last_failure_time -= breaker.recovery_timeout + 1
+
+    def test_host_opens_after_failures_across_products(self):
+        registry = CircuitBreakerRegistry(host_failure_threshold=3)
+        opened = []
+        breakers = [registry.get(f"https://shop.example/{name}", name, on_open=lambda: opened.append(1))
+                    for name in ("a", "b", "c")]
+        for breaker in breakers:
+            self.assertTrue(breaker.allow_request())
+            breaker.record_failure()
+
+        self.assertEqual([breaker.state for breaker in breakers], ["CLOSED"] * 3)
+        self.assertEqual(breakers[0].parent.state, "OPEN")
+        self.assertEqual(opened, [1])
+        self.assertFalse(registry.get("https://shop.example/d", "d").allow_request())
+        self.assertTrue(registry.get("https://other.example/e", "e").allow_request())
+
+    def test_half_open_lets_one_probe_through(self):
+        registry = CircuitBreakerRegistry()
+        breaker = registry.get("https://shop.example/a", "a")
+        for _ in range(3):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, "OPEN")
+        self.assertFalse(breaker.allow_request())
+
+        self.expire(breaker, breaker.parent)
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, "HALF-OPEN")
+        self.assertFalse(breaker.allow_request())
+        breaker.record_success()
+        self.assertEqual((breaker.state, breaker.parent.state), ("CLOSED", "CLOSED"))
+        self.assertTrue(breaker.allow_request())
+
+    def test_failed_probe_opens_again(self):
+        registry = CircuitBreakerRegistry()
+        breaker = registry.get("https://shop.example/a", "a")
+        for _ in range(3):
+            breaker.record_failure()
+        self.expire(breaker, breaker.parent)
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "OPEN")
+        self.assertFalse(breaker.allow_request())
+
+    def test_state_survives_a_restart(self):
+        breaker = CircuitBreakerRegistry().get("https://shop.example/a", "a")
+        for _ in range(3):
+            breaker.record_failure()
+
+        restored = CircuitBreakerRegistry().get("https://shop.example/a", "a")
+        self.assertEqual((restored.state, restored.failure_count), ("OPEN", 3))
+        self.assertEqual(restored.parent.state, "OPEN")
+        self.assertFalse(restored.allow_request())
+        rows = get_db_connection().execute("SELECT name, state FROM circuit_breaker_states ORDER BY name").fetchall()
+        self.assertEqual([tuple(row) for row in rows], [("a", "OPEN"), ("shop.example", "OPEN")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from product_extractor import PhraseMatcher, ProductExtractor
+
+SELECTORS = {
+    "title": ["h1.product-title", "h1"],
+    "price": [".product-price", ".price"],
+    "image": [".product-image img", "img.product-photo"],
+    "availability": [".stock"],
+    "in_stock_text": ["en stock"],
+    "out_of_stock_text": ["rupture"],
+}
+PADDING = "<p>Lorem ipsum dolor sit amet</p>" * 4000
+
+
+def page(head, tail):
+    return f"<html><body>{head}{PADDING}{tail}</body></html>".encode("utf-8")
+
+
+def chunks(markup, size=8 * 1024):
+    for offset in range(0, len(markup), size):
+        yield markup[offset:offset + size]
+
+
+class CountingChunks:
+    def __init__(self, markup):
+        self.markup = markup
+        self.bytes_read = 0
+
+    def __iter__(self):
+        for chunk in chunks(self.markup):
+            self.bytes_read += len(chunk)
+            yield chunk
+
+
+class StreamingExtractionTest(unittest.TestCase):
+    def setUp(self):
+        self.extractor = ProductExtractor(SELECTORS, base_url="https://shop.example", structured_data=False)
+
+    def assert_same_as_full_parse(self, markup):
+        in_stock, product_data, _ = self.extractor.extract_html(markup, "https://shop.example/p")
+        streamed = self.extractor.extract_stream(chunks(markup), "https://shop.example/p")
+        self.assertEqual(streamed[:2], (in_stock, product_data))
+        return product_data
+
+    def test_stops_early_when_best_selectors_match_first(self):
+        markup = page(
+            '<h1 class="product-title">Coffret Dresseur</h1><span class="product-price">49,99 €</span>'
+            '<div class="product-image"><img src="/c.jpg"></div><div class="stock">En stock</div>',
+            '<span class="price">9,99 €</span>'
+        )
+        source = CountingChunks(markup)
+        in_stock, product_data, _ = self.extractor.extract_stream(source, "https://shop.example/p")
+        self.assertTrue(in_stock)
+        self.assertEqual(product_data["price"], 49.99)
+        self.assertEqual(product_data["image_url"], "https://shop.example/c.jpg")
+        self.assertLess(source.bytes_read, len(markup))
+
+    def test_lower_priority_match_does_not_stop_the_stream(self):
+        # The fallback selectors match at the top; the preferred ones only near the end
+        markup = page(
+            '<h1>Boutique</h1><span class="price">9,99 €</span><img src="/logo.png">'
+            '<div class="stock">En stock</div>',
+            '<h1 class="product-title">Coffret Dresseur</h1><span class="product-price">49,99 €</span>'
+            '<div class="product-image"><img src="/c.jpg"></div>'
+        )
+        product_data = self.assert_same_as_full_parse(markup)
+        self.assertEqual(product_data["title"], "Coffret Dresseur")
+        self.assertEqual(product_data["price"], 49.99)
+
+    def test_image_without_src_falls_back_like_full_parse(self):
+        markup = page(
+            '<h1 class="product-title">Coffret</h1><span class="product-price">49,99 €</span>'
+            '<div class="product-image"><img data-src="/lazy.jpg"></div><div class="stock">Rupture</div>',
+            '<img class="product-photo" src="/photo.jpg">'
+        )
+        product_data = self.assert_same_as_full_parse(markup)
+        self.assertEqual(product_data["image_url"], "https://shop.example/photo.jpg")
+
+    def test_truncated_page_still_extracts(self):
+        markup = page('<h1 class="product-title">Coffret</h1><div class="stock">Rupture</div>', "")
+        in_stock, product_data, _ = self.extractor.extract_stream(
+            chunks(markup), "https://shop.example/p", max_bytes=16 * 1024
+        )
+        self.assertFalse(in_stock)
+        self.assertEqual(product_data["title"], "Coffret")
+        self.assertEqual(product_data["availability"], "Rupture")
+
+
+class PhraseMatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.matcher = PhraseMatcher(["Disponible", "en stock", "Ajouter au panier"],
+                                     ["Indisponible", "rupture de stock", "épuisé"])
+
+    def test_in_stock_phrase(self):
+        self.assertEqual(self.matcher.match("Produit EN STOCK, livraison 48h"), (True, "en stock"))
+
+    def test_out_of_stock_phrase_wins(self):
+        self.assertEqual(self.matcher.match("Ajouter au panier - Rupture de stock"), (False, "rupture de stock"))
+
+    def test_word_boundaries(self):
+        # "disponible" inside "indisponible" is not an in-stock match
+        self.assertEqual(self.matcher.match("Article indisponible"), (False, "Indisponible"))
+        self.assertEqual(PhraseMatcher(["disponible"], []).match("indisponibles"), (False, None))
+        self.assertEqual(PhraseMatcher(["stock"], []).match("stocks: 3"), (False, None))
+        self.assertEqual(PhraseMatcher(["stock"], []).match("(stock)"), (True, "stock"))
+
+    def test_non_ascii_phrase(self):
+        self.assertEqual(self.matcher.match("Coffret ÉPUISÉ"), (False, "épuisé"))
+
+    def test_later_occurrence_on_a_boundary_matches(self):
+        self.assertEqual(PhraseMatcher(["stock"], []).match("restocking soon, stock: 2"), (True, "stock"))
+
+    def test_no_match(self):
+        self.assertEqual(self.matcher.match("Coffret Dresseur d'Elite"), (False, None))
+        self.assertEqual(PhraseMatcher(None, None).match("en stock"), (False, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from state_changes import StateDiffEngine, is_alert_event, RESTOCK, SOLD_OUT, PRICE_CHANGE
+
+SITE = {"name": "Shop"}
+PRODUCT = {"name": "Booster", "collection": "Ecarlate", "url": "https://shop.example/booster"}
+
+
+def result(available, price):
+    return available, "msg", [], {"title": "Booster", "price": price}
+
+
+class StateDiffEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = StateDiffEngine(price_threshold=0.05)
+
+    def alerts(self, available, price):
+        events = self.engine.diff(SITE, PRODUCT, result(available, price))
+        return events, [event for event in events if is_alert_event(event)]
+
+    def test_restock_with_new_price_is_a_single_alert(self):
+        self.alerts(True, 10.0)
+        events, _ = self.alerts(False, 10.0)
+        self.assertEqual([event.kind for event in events], [SOLD_OUT])
+
+        events, alerts = self.alerts(True, 15.0)
+        self.assertEqual(sorted(event.kind for event in events), sorted([RESTOCK, PRICE_CHANGE]))
+        self.assertEqual([event.kind for event in alerts], [RESTOCK])
+
+    def test_price_change_while_in_stock_is_an_alert(self):
+        self.alerts(True, 10.0)
+        events, alerts = self.alerts(True, 12.0)
+        self.assertEqual([event.kind for event in alerts], [PRICE_CHANGE])
+
+    def test_price_change_while_out_of_stock_is_not_an_alert(self):
+        self.alerts(False, 10.0)
+        events, alerts = self.alerts(False, 12.0)
+        self.assertEqual([event.kind for event in events], [PRICE_CHANGE])
+        self.assertEqual(alerts, [])
+
+    def test_first_sighting_in_stock_is_a_restock(self):
+        events, alerts = self.alerts(True, 10.0)
+        self.assertEqual([event.kind for event in alerts], [RESTOCK])
+
+    def test_failed_check_keeps_state(self):
+        self.alerts(True, 10.0)
+        self.assertEqual(self.engine.diff(SITE, PRODUCT, (False, "error", [], {})), [])
+        self.assertTrue(self.engine.is_in_stock(PRODUCT["url"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
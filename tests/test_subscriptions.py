@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_connection import DB_PATH, db, get_db_connection
+from db_migrations import run_migrations
+from subscriptions import SubscriptionIndex
+
+# auth migrates database.db in the working directory on import
+_cwd = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+try:
+    from auth import MIGRATIONS
+finally:
+    os.chdir(_cwd)
+
+
+class SubscriptionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        db.set_path(os.path.join(self.tmp, "test.db"))
+        run_migrations(get_db_connection(), MIGRATIONS)
+        self.ash = self.add_user("ash", preferences={"notifications_telegram": True})
+        self.misty = self.add_user("misty", preferences={"notifications_email": False})
+        self.index = SubscriptionIndex()
+
+    def tearDown(self):
+        db.set_path(DB_PATH)
+        shutil.rmtree(self.tmp)
+
+    def add_user(self, username, role="user", preferences=None):
+        with get_db_connection() as conn:
+            return conn.execute(
+                "INSERT INTO users (username, email, password, role, preferences) VALUES (?, ?, 'x', ?, ?)",
+                (username, f"{username}@example.com", role, json.dumps(preferences or {}))
+            ).lastrowid
+
+    def subscribe(self, user_id, collection, product=None, site=None, min_price=None, max_price=None, active=1):
+        with get_db_connection() as conn:
+            return conn.execute(
+                "INSERT INTO user_notifications (user_id, collection, product, site, min_price, max_price, active) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, collection, product, site, min_price, max_price, active)
+            ).lastrowid
+
+    def matched(self, collection="Ecarlate et Violet", product="Coffret", site="Shop", price=50.0):
+        return sorted(sub.notification_id for sub in self.index.match(collection, product, site, price))
+
+    def test_exact_and_wildcard_keys(self):
+        exact = self.subscribe(self.ash, "Ecarlate et Violet", "Coffret", "Shop")
+        any_site = self.subscribe(self.ash, "Ecarlate et Violet", "Coffret")
+        any_product = self.subscribe(self.misty, "Ecarlate et Violet", site="Shop")
+        every_collection = self.subscribe(self.misty, "all")
+        self.subscribe(self.misty, "Ecarlate et Violet", "Display")
+        self.subscribe(self.misty, "Ecarlate et Violet", "Coffret", "Other shop")
+        self.subscribe(self.misty, "Epee et Bouclier")
+
+        self.assertEqual(self.matched(), sorted([exact, any_site, any_product, every_collection]))
+
+    def test_price_bounds(self):
+        in_range = self.subscribe(self.ash, "all", min_price=40, max_price=60)
+        at_max = self.subscribe(self.ash, "all", max_price=50)
+        at_min = self.subscribe(self.ash, "all", min_price=50)
+        above = self.subscribe(self.ash, "all", min_price=55)
+        self.subscribe(self.ash, "all", max_price=49.99)
+
+        self.assertEqual(self.matched(price=50.0), sorted([in_range, at_max, at_min]))
+        self.assertEqual(self.matched(price=70.0), [at_min, above])
+
+    def test_only_active_subscriptions_of_approved_users(self):
+        pending = self.add_user("gary", role="pending")
+        self.subscribe(pending, "all")
+        self.subscribe(self.ash, "all", active=0)
+        self.assertEqual(self.matched(), [])
+
+    def test_channel_preferences(self):
+        self.subscribe(self.ash, "all")
+        self.subscribe(self.misty, "all")
+        channels = {sub.username: (sub.email_alerts, sub.telegram_alerts)
+                    for sub in self.index.match("Ecarlate et Violet", "Coffret", "Shop", 50.0)}
+        self.assertEqual(channels, {"ash": (True, True), "misty": (False, False)})
+
+    def test_updates_after_loading(self):
+        first = self.subscribe(self.ash, "all")
+        self.assertEqual(self.matched(), [first])
+
+        second = self.subscribe(self.misty, "all")
+        self.assertEqual(self.matched(), [first])
+        self.index.add_notification(second)
+        self.assertEqual(self.matched(), [first, second])
+        self.index.remove_notification(first)
+        self.assertEqual(self.matched(), [second])
+
+        with get_db_connection() as conn:
+            conn.execute("UPDATE users SET role = 'pending' WHERE id = ?", (self.misty,))
+        self.index.refresh_user(self.misty)
+        self.assertEqual(self.matched(), [])
+
+    def test_invalidate_reloads_from_the_database(self):
+        first = self.subscribe(self.ash, "all")
+        self.assertEqual(self.matched(), [first])
+        # e.g. the database was restored from a backup
+        second = self.subscribe(self.misty, "all")
+        self.index.invalidate()
+        self.assertEqual(self.matched(), [first, second])
+
+
+if __name__ == "__main__":
+    unittest.main()